@@ -0,0 +1,68 @@
+"""
+Compares finding MakeAppointment availability windows with the bitmask engine and with the
+previous walk over time strings, for a day with few free half hours and a day entirely free.
+Also times the engine alone on a bitmask, for windows of 30 minutes to 3 hours, against checking
+each start in turn.
+"""
+
+import sys
+
+import common
+import legacy_make_appointment as legacy
+
+ITERATIONS = 20000
+
+
+def main():
+    bot = common.load_bot('make-appointment')
+    days = {
+        'sparse day': ['10:00', '16:00', '16:30'],
+        'free day': list(bot.SLOT_TIMES[bot.OPENING_SLOT:bot.CLOSING_SLOT]),
+    }
+    for label, availabilities in days.items():
+        print('{}, {} free half hours'.format(label, len(availabilities)))
+        for duration in (30, 60):
+            assert bot.get_availabilities_for_duration(duration, availabilities) == \
+                legacy.get_availabilities_for_duration(duration, availabilities)
+            baseline, candidate = common.compare(
+                lambda: legacy.get_availabilities_for_duration(duration, availabilities),
+                lambda: bot.get_availabilities_for_duration(duration, availabilities), ITERATIONS, repeat=7)
+            common.print_mean('  windows of {} min, time strings'.format(duration), baseline)
+            common.print_mean('  windows of {} min, bitmask'.format(duration), candidate, baseline)
+
+        appointment_time = availabilities[-2]
+        time_slot = common.slot(appointment_time)
+        for duration in (30, 60):
+            baseline, candidate = common.compare(
+                lambda: legacy.is_available(time_slot, duration, availabilities),
+                lambda: bot.is_available(appointment_time, duration, availabilities), ITERATIONS, repeat=7)
+            common.print_mean('  is_available {} min, time strings'.format(duration), baseline)
+            common.print_mean('  is_available {} min, bitmask'.format(duration), candidate, baseline)
+
+        # What make_appointment does on a turn with a time: find the windows, then check the time
+        def turn_legacy():
+            legacy.get_availabilities_for_duration(60, availabilities)
+            return legacy.is_available(time_slot, 60, availabilities)
+
+        def turn_bitmask():
+            availability = bot.availability_mask(availabilities)
+            bot.free_windows(availability, 60)
+            return bot.is_free(availability, appointment_time, 60)
+
+        baseline, candidate = common.compare(turn_legacy, turn_bitmask, ITERATIONS, repeat=7)
+        common.print_mean('  turn, 60 min, time strings', baseline)
+        common.print_mean('  turn, 60 min, bitmask', candidate, baseline)
+
+    # The engine alone: window starts found with shifts and ANDs, against checking each start
+    print('engine on the free day bitmask, window starts')
+    mask = bot.availability_mask(days['free day'])
+    for duration in (30, 60, 90, 180):
+        slots = bot.duration_slots(duration)
+        baseline, candidate = common.compare(
+            lambda: [slot for slot in range(bot.OPENING_SLOT, bot.CLOSING_SLOT) if bot.fits(mask, slot, slots)],
+            lambda: bot.window_starts(mask, slots) & bot.BUSINESS_HOURS_MASK, ITERATIONS, repeat=7)
+        common.print_mean('  {} min, slot by slot'.format(duration), baseline)
+        common.print_mean('  {} min, shift and AND'.format(duration), candidate, baseline)
+
+if __name__ == '__main__':
+    sys.exit(main())
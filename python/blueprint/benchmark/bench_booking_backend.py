@@ -0,0 +1,146 @@
+"""
+Measures BookTrip fulfillment throughput and tail latency against the local booking backend stub,
+with concurrent fulfillments, for the pooled HTTP backend and for a client opening a new
+connection per booking. Also checks that a retried fulfillment is booked once and that a
+malformed response fails the fulfillment, and shows how injected backend failures are absorbed
+by retries.
+"""
+
+import sys
+import json
+import time
+import random
+import datetime
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import common
+from booking_stub import BookingStubServer
+
+FULFILLMENTS = 2000
+WORKERS = (1, 8, 32)
+MEAN_DELAY = 0.002
+
+
+class FakeContext(object):
+    """
+    Lambda context of an invocation with a 3 second timeout
+    """
+
+    def __init__(self, timeout_ms=3000):
+        self.deadline = time.monotonic() + timeout_ms / 1000.0
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+def unpooled_backend(bot, base_url):
+    """
+    A backend client opening a new connection for every booking, as the baseline
+    """
+
+    class UnpooledBookingBackend(object):
+        def book(self, reservation, idempotency_key, deadline):
+            request = urllib.request.Request(
+                base_url + '/reservations', data=json.dumps(reservation).encode('utf-8'), method='POST',
+                headers={'Content-Type': 'application/json', 'Idempotency-Key': idempotency_key})
+            try:
+                with urllib.request.urlopen(request, timeout=max(deadline - time.monotonic(), 0.001)) as response:
+                    return json.loads(response.read()).get('confirmationId')
+            except (urllib.error.URLError, OSError) as e:
+                raise bot.BookingError(e)
+
+    return UnpooledBookingBackend()
+
+
+class MalformedBookingStubServer(BookingStubServer):
+    """
+    A backend answering every booking with a 200 and the given body
+    """
+
+    def __init__(self, body):
+        super().__init__()
+        self.body = body
+
+    def book(self, key, reservation):
+        return 200, self.body
+
+
+def fulfillment_event(session_id, check_in):
+    event = common.intent_request('BookHotel', {
+        'Location': 'chicago', 'CheckInDate': check_in, 'Nights': '3', 'RoomType': 'queen'
+    }, invocation_source='FulfillmentCodeHook')
+    event['sessionId'] = session_id
+    return event
+
+
+def run(bot, events, workers):
+    """
+    Fulfills the events with the given concurrency. Returns the latencies in milliseconds, the
+    number of failed fulfillments and the elapsed seconds.
+    """
+    def fulfill(event):
+        start = time.perf_counter()
+        response = bot.lambda_handler(event, FakeContext())
+        return (time.perf_counter() - start) * 1000, response['sessionState']['intent']['state'] != 'Fulfilled'
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(fulfill, events))
+    elapsed = time.perf_counter() - start
+    return sorted(latency for latency, _ in results), sum(failed for _, failed in results), elapsed
+
+
+def print_run(label, latencies, failed, elapsed):
+    print('{:<36} {:>6.0f}/s  p50 {:>7.2f}ms  p95 {:>7.2f}ms  p99 {:>7.2f}ms  max {:>7.2f}ms  failed {}'.format(
+        label, len(latencies) / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)],
+        latencies[int(len(latencies) * 0.99)], latencies[-1], failed))
+
+
+def main():
+    check_in = (datetime.date.today() + datetime.timedelta(days=7)).isoformat()
+    delay = lambda: random.expovariate(1 / MEAN_DELAY)
+
+    with BookingStubServer(delay=delay) as stub:
+        bot = common.load_bot('book-trip', {
+            'BOOKING_BACKEND_URL': stub.endpoint_url,
+            'BOOKING_BACKEND_MAX_CONNECTIONS': str(max(WORKERS)),
+        })
+        bot.logger.setLevel('ERROR')
+        pooled = bot.booking_backend
+        unpooled = unpooled_backend(bot, stub.endpoint_url)
+
+        print('{} fulfillments, backend latency exponential with mean {:.0f}ms'.format(FULFILLMENTS, MEAN_DELAY * 1000))
+        for workers in WORKERS:
+            for label, backend in (('new connection per call', unpooled), ('pooled', pooled)):
+                bot.booking_backend = backend
+                events = [fulfillment_event('{}-{}-{}'.format(label, workers, i), check_in) for i in range(FULFILLMENTS)]
+                print_run('{} workers, {}'.format(workers, label), *run(bot, events, workers))
+
+        # A fulfillment retried by Lex books once and gets the same confirmation
+        bot.booking_backend = pooled
+        requests, bookings = stub.requests, len(stub.bookings)
+        first = bot.lambda_handler(fulfillment_event('retried', check_in), FakeContext())
+        second = bot.lambda_handler(fulfillment_event('retried', check_in), FakeContext())
+        assert first['sessionState']['sessionAttributes']['lastConfirmationId'] == \
+            second['sessionState']['sessionAttributes']['lastConfirmationId']
+        print('retried fulfillment: {} calls, {} booking'.format(stub.requests - requests, len(stub.bookings) - bookings))
+
+    # A 2xx body which is not a JSON object fails the fulfillment like a backend error
+    for body in (b'<html>OK</html>', ['ABC123']):
+        with MalformedBookingStubServer(body) as stub:
+            bot.booking_backend = bot.HttpBookingBackend(stub.endpoint_url)
+            response = bot.lambda_handler(fulfillment_event('malformed', check_in), FakeContext())
+            assert response['sessionState']['intent']['state'] == 'Failed', response
+    print('malformed backend responses: failed')
+
+    # Injected failures: each booking is retried once within its deadline
+    for failure_rate in (0.05, 0.2):
+        with BookingStubServer(delay=delay, failure_rate=failure_rate) as stub:
+            bot.booking_backend = bot.HttpBookingBackend(stub.endpoint_url, max(WORKERS))
+            events = [fulfillment_event('failures-{}-{}'.format(failure_rate, i), check_in) for i in range(FULFILLMENTS)]
+            print_run('8 workers, {:.0%} failures'.format(failure_rate), *run(bot, events, 8))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Compares city validation and pricing through the city catalog with the previous list scans and
+per-character loops, for the shipped catalog and for a synthetic catalog of 10,000 cities.
+"""
+
+import os
+import sys
+import random
+import string
+import tempfile
+
+import common
+import legacy_book_trip
+
+ITERATIONS = 20000
+LARGE_CATALOG_SIZE = 10000
+
+
+def synthetic_cities(count, seed=7):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        names.add(' '.join(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+                           for _ in range(rng.randint(1, 2))))
+    return sorted(names)
+
+
+def main():
+    bot = common.load_bot('book-trip')
+    print('catalog of {} cities'.format(len(bot.city_catalog)))
+    for city in ('chicago', 'portland', 'atlantis'):
+        assert bot.isvalid_city(city) == legacy_book_trip.isvalid_city(city)
+        baseline, candidate = common.compare(lambda: legacy_book_trip.isvalid_city(city),
+                                             lambda: bot.isvalid_city(city), ITERATIONS)
+        common.print_mean('isvalid_city({!r}) (list scan)'.format(city), baseline)
+        common.print_mean('isvalid_city({!r}) (catalog)'.format(city), candidate, baseline)
+
+    assert bot.generate_hotel_price('san francisco', 3, 'king') == \
+        legacy_book_trip.generate_hotel_price('san francisco', 3, 'king')
+    assert bot.generate_car_price('san francisco', 5, 22, 'luxury') == \
+        legacy_book_trip.generate_car_price('san francisco', 5, 22, 'luxury')
+    baseline, candidate = common.compare(lambda: legacy_book_trip.generate_hotel_price('san francisco', 3, 'king'),
+                                         lambda: bot.generate_hotel_price('san francisco', 3, 'king'), ITERATIONS)
+    common.print_mean('generate_hotel_price (loop)', baseline)
+    common.print_mean('generate_hotel_price (catalog)', candidate, baseline)
+    baseline, candidate = common.compare(lambda: legacy_book_trip.generate_car_price('san francisco', 5, 22, 'luxury'),
+                                         lambda: bot.generate_car_price('san francisco', 5, 22, 'luxury'), ITERATIONS)
+    common.print_mean('generate_car_price (loop)', baseline)
+    common.print_mean('generate_car_price (catalog)', candidate, baseline)
+
+    # The same lookups with a large catalog loaded from a data file
+    names = synthetic_cities(LARGE_CATALOG_SIZE)
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+        f.write('name\n' + ''.join(name + '\n' for name in names))
+    try:
+        large_bot = common.load_bot('book-trip', {'CITY_CATALOG_PATH': f.name})
+        build = common.measure(lambda: large_bot.load_city_catalog(f.name), 20, warmup=2)
+    finally:
+        os.environ.pop('CITY_CATALOG_PATH')
+        os.unlink(f.name)
+    print('catalog of {} cities, load {:.1f}ms'.format(len(large_bot.city_catalog), build['mean'] / 1000))
+    city = names[-1]
+    baseline, candidate = common.compare(lambda: city in names, lambda: large_bot.isvalid_city(city), 200)
+    common.print_mean('isvalid_city, last city (list scan)', baseline)
+    common.print_mean('isvalid_city, last city (catalog)', candidate, baseline)
+
+if __name__ == '__main__':
+    sys.exit(main())
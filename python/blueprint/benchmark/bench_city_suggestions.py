@@ -0,0 +1,43 @@
+"""
+Measures building the city catalog with its trigram index, and the latency of "did you mean"
+queries with misspelled city names, for the shipped catalog and for 10,000 and 50,000 cities.
+"""
+
+import sys
+import random
+
+import common
+from bench_city_catalog import synthetic_cities
+
+QUERIES = 2000
+
+
+def misspell(name, rng):
+    i = rng.randrange(len(name))
+    edit = rng.choice(('delete', 'swap', 'replace'))
+    if edit == 'delete' and len(name) > 3:
+        return name[:i] + name[i + 1:]
+    if edit == 'swap' and i < len(name) - 1:
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    return name[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + name[i + 1:]
+
+
+def main():
+    bot = common.load_bot('book-trip')
+    rng = random.Random(11)
+    catalogs = [('shipped', list(bot.city_catalog.names))] + [
+        ('synthetic', synthetic_cities(size)) for size in (10000, 50000)
+    ]
+    for label, names in catalogs:
+        build = common.measure(lambda: bot.CityCatalog(names), 5, warmup=1)
+        catalog = bot.CityCatalog(names)
+        queries = [misspell(rng.choice(names), rng) for _ in range(QUERIES)]
+        query = iter(range(10 ** 9))
+        stats = common.measure(lambda: catalog.suggest(queries[next(query) % QUERIES]), QUERIES)
+        found = sum(1 for q in queries if catalog.suggest(q))
+        print('{} catalog of {} cities: build {:.1f}ms, {:.0%} of misspellings get a suggestion'.format(
+            label, len(catalog), build['mean'] / 1000, found / QUERIES))
+        common.print_stats('  suggest (misspelled name)', stats)
+
+if __name__ == '__main__':
+    sys.exit(main())
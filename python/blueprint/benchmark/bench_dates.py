@@ -0,0 +1,79 @@
+"""
+Compares the date validation of the blueprint bots with parse_date, which memoizes ISO dates, and
+with the previous helpers, which parsed each date slot up to three times per turn.
+"""
+
+import sys
+import datetime
+
+import common
+import lexv2_blueprint_helpers as helpers
+import legacy_book_trip
+import legacy_make_appointment
+
+
+def future_weekday(days_ahead):
+    date = datetime.date.today() + datetime.timedelta(days=days_ahead)
+    while date.weekday() >= 5:
+        date += datetime.timedelta(days=1)
+    return date.isoformat()
+
+
+def main():
+    book_trip = common.load_bot('book-trip')
+    make_appointment = common.load_bot('make-appointment')
+    pickup_date = future_weekday(7)
+    return_date = future_weekday(14)
+
+    car_slots = common.intent_request('BookCar', {
+        'PickUpCity': 'chicago', 'PickUpDate': pickup_date, 'ReturnDate': return_date,
+        'DriverAge': '30', 'CarType': 'economy'
+    })['sessionState']['intent']['slots']
+    hotel_slots = common.intent_request('BookHotel', {
+        'Location': 'chicago', 'CheckInDate': pickup_date, 'Nights': '3', 'RoomType': 'queen'
+    })['sessionState']['intent']['slots']
+    appointment_type = common.slot('cleaning')
+    appointment_date = common.slot(pickup_date)
+    appointment_time = common.slot('10:00')
+
+    cases = [
+        ('BookCar validation', 20000,
+         lambda: legacy_book_trip.validate_book_car(car_slots),
+         lambda: book_trip.validate_book_car(book_trip.book_car_slots(car_slots))),
+        ('BookHotel validation', 20000,
+         lambda: legacy_book_trip.validate_hotel(hotel_slots),
+         lambda: book_trip.validate_hotel(book_trip.book_hotel_slots(hotel_slots))),
+        ('BookAppointment validation', 20000,
+         lambda: legacy_make_appointment.validate_book_appointment(appointment_type, appointment_date, appointment_time),
+         lambda: make_appointment.validate_book_appointment(make_appointment.make_appointment_slots(
+             {'AppointmentType': appointment_type, 'Date': appointment_date, 'Time': appointment_time}))),
+        ('day difference', 20000,
+         lambda: legacy_book_trip.get_day_difference(return_date, pickup_date),
+         lambda: book_trip.get_day_difference(return_date, pickup_date)),
+    ]
+    for label, iterations, baseline, candidate in cases:
+        assert baseline() == candidate(), label
+        before, after = common.compare(baseline, candidate, iterations, repeat=7)
+        print(label)
+        common.print_mean('  dateutil, per call', before)
+        common.print_mean('  parse_date, per call', after, before)
+
+    # A date seen for the first time still costs a parse, but ISO dates skip dateutil
+    def cold():
+        helpers.parse_iso_date.cache_clear()
+        return book_trip.parse_date(pickup_date)
+
+    baseline, candidate = common.compare(lambda: legacy_book_trip.dateutil.parser.parse(pickup_date), cold, 20000,
+                                         repeat=7)
+    print('first parse of an ISO date')
+    common.print_mean('  dateutil.parser.parse', baseline)
+    common.print_mean('  parse_date, cache cleared', candidate, baseline)
+    print(helpers.parse_iso_date.cache_info())
+
+    # Dates dateutil reads relative to today are parsed on every call, never served from the cache
+    cached = helpers.parse_iso_date.cache_info().currsize
+    assert book_trip.parse_date('March 3') is not None
+    assert helpers.parse_iso_date.cache_info().currsize == cached
+
+if __name__ == '__main__':
+    sys.exit(main())
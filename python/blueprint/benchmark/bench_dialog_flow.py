@@ -0,0 +1,98 @@
+"""
+Measures BookCar turn latency through the dialog state machine, with the car priced only by the
+transitions which quote and with every filled turn priced as the handler did before, over the
+turns of a typical conversation. Prints the transition stats the bot accumulates.
+
+First checks that a confirmed city suggestion followed by an invalid slot leaves no suggestion
+behind, so that denying the reservation afterwards is read as a denial of the reservation.
+
+The handler changes the slots and session attributes of its event, so each call gets a new event;
+building it is included in both timings.
+"""
+
+import sys
+import datetime
+
+import common
+
+ITERATIONS = 2000
+
+
+def check_suggestion_then_denial(bot, filled):
+    """
+    Walks a conversation: a misspelled city is suggested, the suggestion is confirmed along with
+    an invalid driver age, the age is corrected, and the reservation is denied
+    """
+    def turn(slots, confirmation_state, session_attributes):
+        event = common.intent_request('BookCar', slots, confirmation_state=confirmation_state,
+                                      session_attributes=session_attributes)
+        response = bot.lambda_handler(event, None)
+        return response['sessionState'], response['sessionState']['sessionAttributes']
+
+    state, session_attributes = turn(dict(filled, PickUpCity='chicgo'), 'None', {})
+    assert state['dialogAction']['type'] == 'ConfirmIntent'
+    assert session_attributes['confirmationContext'] == 'CitySuggestion'
+
+    state, session_attributes = turn(dict(filled, DriverAge='12'), 'Confirmed', session_attributes)
+    assert state['dialogAction'] == {'type': 'ElicitSlot', 'slotToElicit': 'DriverAge'}, state['dialogAction']
+    assert state['intent']['confirmationState'] == 'None'
+    assert 'confirmationContext' not in session_attributes
+
+    state, session_attributes = turn(filled, 'None', session_attributes)
+    assert state['dialogAction']['type'] == 'ConfirmIntent'
+    assert 'currentReservationPrice' in session_attributes
+    assert 'currentReservationAlternatives' not in session_attributes
+
+    # The bot confirms the reservation with its price and the user says no
+    state, session_attributes = turn(filled, 'Denied', session_attributes)
+    assert state['dialogAction']['type'] == 'Delegate', state['dialogAction']
+    assert state['intent']['slots']['PickUpCity'] is not None
+    assert 'currentReservation' not in session_attributes
+    print('suggestion, invalid slot, then denial: ok')
+
+
+def main():
+    later = lambda days: (datetime.date.today() + datetime.timedelta(days=days)).isoformat()
+    filled = {'PickUpCity': 'chicago', 'PickUpDate': later(3), 'ReturnDate': later(6), 'DriverAge': '30',
+              'CarType': 'economy'}
+    hotel = {'lastConfirmedReservation': '1|H|chicago|{}|3|queen'.format(later(3))}
+    auto_populate = dict(hotel, confirmationContext='AutoPopulate')
+    check_suggestion_then_denial(common.load_bot('book-trip'), filled)
+
+    # (label, slots, invocation source, confirmation state, session attributes)
+    turns = [
+        ('offer auto-populate', {}, 'DialogCodeHook', 'None', hotel),
+        ('auto-populate confirmed', dict(filled, DriverAge=None, CarType=None), 'DialogCodeHook', 'Confirmed',
+         auto_populate),
+        ('partial', {'PickUpCity': 'chicago'}, 'DialogCodeHook', 'None', None),
+        ('invalid city', dict(filled, PickUpCity='chicgo'), 'DialogCodeHook', 'None', None),
+        ('invalid driver age', dict(filled, DriverAge='12'), 'DialogCodeHook', 'None', None),
+        ('filled', filled, 'DialogCodeHook', 'None', None),
+        ('denied', filled, 'DialogCodeHook', 'Denied', None),
+        ('confirmed', filled, 'DialogCodeHook', 'Confirmed', None),
+        ('fulfillment', filled, 'FulfillmentCodeHook', 'None', None),
+    ]
+
+    bot = common.load_bot('book-trip')
+    eager = common.load_bot('book-trip')
+    for module in (bot, eager):
+        module.logger.setLevel('ERROR')
+    # Price every filled turn before its action, as the handler did before the state machine
+    for transition in eager.book_car_flow.table.values():
+        transition.quote = True
+
+    print('BookCar turn latency, priced every filled turn vs priced on quoting transitions')
+    for label, *turn in turns:
+        event = lambda: common.intent_request('BookCar', *turn)
+        baseline, candidate = common.compare(lambda: eager.lambda_handler(event(), None),
+                                             lambda: bot.lambda_handler(event(), None), ITERATIONS, repeat=5)
+        common.print_mean('  {}, eager pricing'.format(label), baseline)
+        common.print_mean('  {}, state machine'.format(label), candidate, baseline)
+
+    print()
+    print('{:<68} {:>8} {:>10} {:>10}'.format('transition', 'turns', 'mean ms', 'max ms'))
+    for name, stats in bot.book_car_flow.stats.snapshot().items():
+        print('{:<68} {:>8} {:>10.4f} {:>10.4f}'.format(name, stats['count'], stats['mean_ms'], stats['max_ms']))
+
+if __name__ == '__main__':
+    sys.exit(main())
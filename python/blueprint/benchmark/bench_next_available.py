@@ -0,0 +1,84 @@
+"""
+Compares the MakeAppointment "next available" search over 90 and 365 day horizons, with calendar
+bitmasks and day by day with the previous per-day windows. On a typical calendar
+the first availabilities come within days; on a sparse one only the last week has any, so the whole
+horizon is searched. Also times the search including generating the availabilities.
+
+First checks that when a requested date has no availability, the days offered instead follow that
+date, for a work day far in the future as well as for the next one.
+"""
+
+import sys
+import json
+import random
+import datetime
+
+import common
+import legacy_make_appointment as legacy
+
+HORIZONS = (90, 365)
+LIMIT = 5
+
+
+def day_by_day(start_date, days, duration, booking_map, limit=LIMIT):
+    """
+    The search as the previous helpers allow: the windows of each day in turn, until enough are found
+    """
+    found = []
+    for day in range(days):
+        date = (start_date + datetime.timedelta(days=day)).isoformat()
+        for appointment_time in legacy.get_availabilities_for_duration(duration, booking_map[date]):
+            found.append((date, appointment_time))
+            if len(found) == limit:
+                return found
+    return found
+
+
+def check_offered_dates(bot):
+    for days_ahead in (1, 400):
+        requested = datetime.date.today() + datetime.timedelta(days=days_ahead)
+        while requested.weekday() >= 5:
+            requested += datetime.timedelta(days=1)
+        # The requested date and the day after it are fully booked
+        booking_map = {requested.isoformat(): [], (requested + datetime.timedelta(days=1)).isoformat(): []}
+        event = common.intent_request('MakeAppointment', {'AppointmentType': 'cleaning', 'Date': requested.isoformat(), 'Time': None},
+                                      session_attributes={'bookingMap': json.dumps(booking_map)})
+        response = bot.lambda_handler(event, None)
+        assert response['messages'][0]['content'].startswith('We do not have any availability on that date.'), response
+        buttons = response['messages'][1]['imageResponseCard']['buttons']
+        offered = [datetime.datetime.strptime(button['value'].split(' at ')[0], '%A, %B %d, %Y').date() for button in buttons]
+        assert offered and min(offered) > requested + datetime.timedelta(days=1), (requested, offered)
+        assert max(offered) < requested + datetime.timedelta(days=1 + bot.NEXT_AVAILABLE_DAYS), (requested, offered)
+    print('days offered for a fully booked date follow it, next work day and in 400 days: ok')
+
+
+def main():
+    bot = common.load_bot('make-appointment')
+    bot.logger.setLevel('ERROR')
+    check_offered_dates(bot)
+    start_date = datetime.date.today() + datetime.timedelta(days=1)
+    random.seed(7)
+
+    for days in HORIZONS:
+        dates = [(start_date + datetime.timedelta(days=day)).isoformat() for day in range(days)]
+        calendars = {
+            'typical': {date: bot.get_availabilities(date) for date in dates},
+            'sparse': {date: (['15:00', '15:30', '16:00'] if i >= days - 7 and bot.parse_date(date).weekday() < 5 else [])
+                       for i, date in enumerate(dates)},
+        }
+        print('{} day horizon, earliest {}'.format(days, LIMIT))
+        for label, booking_map in calendars.items():
+            for duration in (30, 60):
+                expected = day_by_day(start_date, days, duration, booking_map)
+                assert bot.next_available(start_date, days, duration, dict(booking_map)) == expected
+                baseline, candidate = common.compare(
+                    lambda: day_by_day(start_date, days, duration, booking_map),
+                    lambda: bot.next_available(start_date, days, duration, booking_map), 200, repeat=7)
+                common.print_mean('  {}, {} min, day by day'.format(label, duration), baseline)
+                common.print_mean('  {}, {} min, calendar bitmask'.format(label, duration), candidate, baseline)
+
+        mean = common.measure(lambda: bot.next_available(start_date, days, 60, {}), 200)['mean']
+        common.print_mean('  generated availabilities, 60 min', mean)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Simulates BookTrip conversations, each booking a hotel then a car for the same stay, against a
+rates backend with a fixed latency, and compares the turn latency and backend calls of the quote
+cache with pricing every turn. The cities, stays, driver ages and car types follow a skewed
+distribution, as popular destinations do.
+"""
+
+import sys
+import time
+import random
+import datetime
+
+import common
+
+CONVERSATIONS = 300
+RATES_LATENCY = 0.002
+CONFIGURATIONS = (
+    ('no cache', 0, 300),
+    ('64 quotes, 300s', 64, 300),
+    ('1024 quotes, 50ms', 1024, 0.05),
+    ('1024 quotes, 300s', 1024, 300),
+)
+
+
+def conversation(rng, cities):
+    """
+    The slots and confirmation state of each turn of a conversation booking a hotel, then a car
+    from the auto-populated stay
+    """
+    city = rng.choices(cities, weights=[1 / (rank + 1) for rank in range(len(cities))])[0]
+    check_in = (datetime.date.today() + datetime.timedelta(days=rng.randint(1, 3))).isoformat()
+    check_out = (datetime.date.fromisoformat(check_in) + datetime.timedelta(days=3)).isoformat()
+    room_type = rng.choice(('queen', 'queen', 'king', 'deluxe'))
+    age = rng.choice(('22', '30', '30', '45'))
+    car_type = rng.choice(('economy', 'economy', 'midsize', 'luxury'))
+
+    hotel = {'Location': city, 'CheckInDate': check_in, 'Nights': '3', 'RoomType': None}
+    car = {'PickUpCity': city, 'PickUpDate': check_in, 'ReturnDate': check_out, 'DriverAge': None, 'CarType': None}
+    return [
+        ('BookHotel', {'Location': city}, 'DialogCodeHook', 'None'),
+        ('BookHotel', dict(hotel, RoomType=None), 'DialogCodeHook', 'None'),
+        ('BookHotel', dict(hotel, RoomType=room_type), 'DialogCodeHook', 'None'),
+        ('BookHotel', dict(hotel, RoomType=room_type), 'DialogCodeHook', 'Confirmed'),
+        ('BookHotel', dict(hotel, RoomType=room_type), 'FulfillmentCodeHook', 'Confirmed'),
+        ('BookCar', {}, 'DialogCodeHook', 'None'),
+        ('BookCar', car, 'DialogCodeHook', 'Confirmed'),
+        ('BookCar', dict(car, DriverAge=age), 'DialogCodeHook', 'None'),
+        ('BookCar', dict(car, DriverAge=age, CarType=car_type), 'DialogCodeHook', 'None'),
+        ('BookCar', dict(car, DriverAge=age, CarType=car_type), 'DialogCodeHook', 'Confirmed'),
+        ('BookCar', dict(car, DriverAge=age, CarType=car_type), 'FulfillmentCodeHook', 'Confirmed'),
+    ]
+
+
+def run(bot, conversations):
+    """
+    Runs the conversations, carrying the session attributes from turn to turn. Returns the turn
+    latencies in milliseconds.
+    """
+    latencies = []
+    for turns in conversations:
+        session_attributes = {}
+        for intent_name, slots, invocation_source, confirmation_state in turns:
+            event = common.intent_request(intent_name, slots, invocation_source, confirmation_state, session_attributes)
+            start = time.perf_counter()
+            response = bot.lambda_handler(event, None)
+            latencies.append((time.perf_counter() - start) * 1000)
+            session_attributes = response['sessionState']['sessionAttributes']
+    return sorted(latencies)
+
+
+def main():
+    bot = common.load_bot('book-trip')
+    bot.logger.setLevel('ERROR')
+    rng = random.Random(7)
+    cities = bot.city_catalog.names[:50]
+    conversations = [conversation(rng, cities) for _ in range(CONVERSATIONS)]
+
+    backend_calls = [0]
+
+    def rates_backend(key):
+        backend_calls[0] += 1
+        time.sleep(RATES_LATENCY)
+        return bot.engine_quote(key)
+
+    print('{} conversations, {} turns, rates backend latency {:.0f}ms'.format(
+        CONVERSATIONS, sum(len(turns) for turns in conversations), RATES_LATENCY * 1000))
+    print('{:<20} {:>10} {:>10} {:>10} {:>14} {:>9}'.format(
+        'quote cache', 'mean ms', 'p50 ms', 'p95 ms', 'backend calls', 'hit rate'))
+    for label, max_size, ttl in CONFIGURATIONS:
+        bot.quote_cache = bot.QuoteCache(rates_backend, max_size, ttl)
+        backend_calls[0] = 0
+        latencies = run(bot, conversations)
+        print('{:<20} {:>10.3f} {:>10.3f} {:>10.3f} {:>14} {:>9.1%}'.format(
+            label, sum(latencies) / len(latencies), latencies[len(latencies) // 2],
+            latencies[int(len(latencies) * 0.95)], backend_calls[0], bot.quote_cache.stats()['hit_rate']))
+
+    # A rates change drops the quotes of its city; the next turn prices them again
+    stats = bot.quote_cache.stats()
+    dropped = bot.quote_cache.invalidate(location=cities[0])
+    print('invalidating {}: {} of {} quotes dropped'.format(cities[0], dropped, stats['size']))
+
+if __name__ == '__main__':
+    sys.exit(main())
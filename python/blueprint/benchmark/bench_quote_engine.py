@@ -0,0 +1,54 @@
+"""
+Compares pricing whole grids of alternatives with the batched quote engine and with the
+previous scalar functions called once per combination.
+"""
+
+import sys
+
+import common
+import legacy_book_trip
+
+AGES = [18, 21, 24, 25, 40, 65]
+
+
+def main():
+    bot = common.load_bot('book-trip')
+    engine = bot.quote_engine
+    cities = list(bot.city_catalog.names)
+    grids = [
+        ('hotel, 1 city x 5 nights x 3 rooms', 'hotel', (cities[:1], list(range(1, 6)), list(bot.ROOM_TYPES))),
+        ('hotel, 27 cities x 30 nights x 3 rooms', 'hotel', (cities, list(range(1, 31)), list(bot.ROOM_TYPES))),
+        ('car, 1 city x 5 days x 1 age x 6 types', 'car', (cities[:1], list(range(1, 6)), AGES[:1], list(bot.CAR_TYPES))),
+        ('car, 27 cities x 30 days x 6 ages x 6 types', 'car', (cities, list(range(1, 31)), AGES, list(bot.CAR_TYPES))),
+    ]
+    for label, kind, args in grids:
+        if kind == 'hotel':
+            locations, nights, room_types = args
+            count = len(locations) * len(nights) * len(room_types)
+
+            def scalar():
+                return [[[legacy_book_trip.generate_hotel_price(location, n, room_type) for room_type in room_types]
+                         for n in nights] for location in locations]
+
+            def batched():
+                return engine.hotel_price_grid(locations, nights, room_types)
+        else:
+            locations, days, ages, car_types = args
+            count = len(locations) * len(days) * len(ages) * len(car_types)
+
+            def scalar():
+                return [[[[legacy_book_trip.generate_car_price(location, d, age, car_type) for car_type in car_types]
+                          for age in ages] for d in days] for location in locations]
+
+            def batched():
+                return engine.car_price_grid(locations, days, ages, car_types)
+
+        assert bot.grid_to_list(batched()) == scalar()
+        iterations = max(5, 20000 // count)
+        baseline, candidate = common.compare(scalar, batched, iterations, repeat=7)
+        print('{} ({} combinations)'.format(label, count))
+        common.print_mean('  scalar, per combination', baseline / count)
+        common.print_mean('  batched, per combination', candidate / count, baseline / count)
+
+if __name__ == '__main__':
+    sys.exit(main())
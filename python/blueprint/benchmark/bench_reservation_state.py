@@ -0,0 +1,70 @@
+"""
+Compares the size and the encode and decode time of the reservations BookTrip keeps in its
+session attributes, in the compact format and as the previous JSON of Lex slot objects.
+
+First checks that malformed reservations are ignored rather than failing the turn.
+"""
+
+import sys
+import json
+import datetime
+
+import common
+
+
+def check_malformed(bot):
+    for data in ('[1, 2]', '"Hotel"', '3', 'null', '{"ReservationType": "Hotel"', '2|H|chicago', '1|X|chicago'):
+        assert bot.decode_reservation(data) is None, data
+        if data[0] != '1':
+            assert bot.decode_legacy_reservation(data) is None, data
+    # A slot object without a value object leaves the field empty
+    reservation = bot.decode_reservation('{"ReservationType": "Hotel", "Location": {"value": "chicago"}, "Nights": 3}')
+    assert reservation == {'ReservationType': 'Hotel', 'Location': None, 'CheckInDate': None, 'Nights': '3',
+                           'RoomType': None}, reservation
+    print('malformed reservations ignored: ok')
+
+
+def main():
+    bot = common.load_bot('book-trip')
+    bot.logger.setLevel('ERROR')
+    check_malformed(bot)
+    check_in = (datetime.date.today() + datetime.timedelta(days=7)).isoformat()
+    check_out = (datetime.date.today() + datetime.timedelta(days=10)).isoformat()
+    reservations = [
+        ('Hotel', 'BookHotel', bot.book_hotel_slots, {
+            'Location': 'new york', 'CheckInDate': check_in, 'Nights': '3', 'RoomType': 'queen'}),
+        ('Car', 'BookCar', bot.book_car_slots, {
+            'PickUpCity': 'new york', 'PickUpDate': check_in, 'ReturnDate': check_out, 'DriverAge': '30',
+            'CarType': 'economy'}),
+    ]
+    for reservation_type, intent_name, extract, slot_values in reservations:
+        slots = common.intent_request(intent_name, slot_values)['sessionState']['intent']['slots']
+        fields = bot.RESERVATION_FIELDS[reservation_type]
+        values = extract(slots)
+        interpreted = tuple(getattr(values, attribute) for attribute in values.__slots__ if attribute != 'driver_age')
+
+        def encode_json():
+            return json.dumps(dict([('ReservationType', reservation_type)] + [(field, slots.get(field)) for field in fields]))
+
+        def encode_compact():
+            return bot.encode_reservation(reservation_type, interpreted)
+
+        legacy = encode_json()
+        compact = encode_compact()
+        assert bot.decode_reservation(legacy) == bot.decode_reservation(compact)
+
+        print('{} reservation: {} bytes as JSON, {} bytes compact ({:.1f}x smaller)'.format(
+            reservation_type, len(legacy), len(compact), len(legacy) / len(compact)))
+        baseline, candidate = common.compare(encode_json, encode_compact, 20000, repeat=7)
+        common.print_mean('  encode, JSON', baseline)
+        common.print_mean('  encode, compact', candidate, baseline)
+        baseline, candidate = common.compare(lambda: json.loads(legacy), lambda: bot.decode_reservation(compact), 20000,
+                                             repeat=7)
+        common.print_mean('  decode, JSON', baseline)
+        common.print_mean('  decode, compact', candidate, baseline)
+        _, legacy_decode = common.compare(lambda: json.loads(legacy), lambda: bot.decode_reservation(legacy), 20000,
+                                          repeat=7)
+        common.print_mean('  decode, JSON read by the codec', legacy_decode, baseline)
+
+if __name__ == '__main__':
+    sys.exit(main())
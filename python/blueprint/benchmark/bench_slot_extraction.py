@@ -0,0 +1,55 @@
+"""
+Compares reading an intent's slot values with the compiled slot extractors and with the previous
+try_ex closures followed by interpreted_value calls. bench_dates.py times the validators.
+"""
+
+import sys
+import datetime
+
+import common
+import legacy_book_trip
+
+
+def closure_values(slots, names):
+    """
+    The previous access pattern: one try_ex closure per slot, then interpreted_value on each
+    """
+    try_ex = legacy_book_trip.try_ex
+    interpreted_value = legacy_book_trip.interpreted_value
+    return [interpreted_value(try_ex(lambda: slots[name])) for name in names]
+
+
+def main():
+    book_trip = common.load_bot('book-trip')
+    make_appointment = common.load_bot('make-appointment')
+    order_flower = common.load_bot('order-flower')
+    pickup_date = (datetime.date.today() + datetime.timedelta(days=7)).isoformat()
+    return_date = (datetime.date.today() + datetime.timedelta(days=14)).isoformat()
+
+    intents = [
+        ('BookCar, 5 slots', book_trip.book_car_slots, {
+            'PickUpCity': 'chicago', 'PickUpDate': pickup_date, 'ReturnDate': return_date,
+            'DriverAge': '30', 'CarType': 'economy'}),
+        ('BookCar, 2 of 5 slots', book_trip.book_car_slots, {
+            'PickUpCity': 'chicago', 'PickUpDate': pickup_date, 'ReturnDate': None,
+            'DriverAge': None, 'CarType': None}),
+        ('BookHotel, 4 slots', book_trip.book_hotel_slots, {
+            'Location': 'chicago', 'CheckInDate': pickup_date, 'Nights': '3', 'RoomType': 'queen'}),
+        ('MakeAppointment, 3 slots', make_appointment.make_appointment_slots, {
+            'AppointmentType': 'cleaning', 'Date': pickup_date, 'Time': '10:00'}),
+        ('OrderFlowers, 3 slots', order_flower.order_flowers_slots, {
+            'FlowerType': 'roses', 'PickupDate': pickup_date, 'PickupTime': '10:00'}),
+    ]
+    for label, extract, values in intents:
+        slots = common.intent_request('Intent', values)['sessionState']['intent']['slots']
+        names = list(values)
+        record = extract(slots)
+        assert closure_values(slots, names) == [getattr(record, name) for name in record.__slots__[:len(names)]]
+
+        baseline, candidate = common.compare(lambda: closure_values(slots, names), lambda: extract(slots), 100000, repeat=7)
+        print(label)
+        common.print_mean('  try_ex closures', baseline)
+        common.print_mean('  compiled extractor', candidate, baseline)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Checks that the blueprint bots keep each request's time zone to that request when handled
+concurrently in threads, and compares the per-request cost of resolving a request clock with
+setting TZ and calling time.tzset as the handlers did before.
+
+The date used is today in Pacific/Kiritimati (UTC+14), which is still in the future in
+Pacific/Pago_Pago (UTC-11) at any time of day. A request from Kiritimati must reject it as not
+in advance and one from Pago Pago must accept it, whatever the other threads are doing.
+"""
+
+import os
+import sys
+import time
+import datetime
+import zoneinfo
+from concurrent.futures import ThreadPoolExecutor
+
+import common
+import lexv2_blueprint_helpers as helpers
+
+REQUESTS = 4000
+WORKERS = 16
+EARLY_ZONE = 'Pacific/Kiritimati'
+LATE_ZONE = 'Pacific/Pago_Pago'
+
+
+def main():
+    bots = {name: common.load_bot(name) for name in ('book-trip', 'make-appointment', 'order-flower')}
+    for bot in bots.values():
+        bot.logger.setLevel('ERROR')
+    date = datetime.datetime.now(zoneinfo.ZoneInfo(EARLY_ZONE)).date().isoformat()
+
+    requests = {
+        'book-trip': ('BookHotel', {'Location': 'chicago', 'CheckInDate': date, 'Nights': None, 'RoomType': None}),
+        'make-appointment': ('MakeAppointment', {'AppointmentType': None, 'Date': date, 'Time': None}),
+        'order-flower': ('OrderFlowers', {'FlowerType': None, 'PickupDate': date, 'PickupTime': None}),
+    }
+    # The messages rejecting a date which is not in the future
+    not_in_advance = ('one day in advance', 'a day in advance', 'from tomorrow onwards')
+
+    def handle(i):
+        name = list(bots)[i % len(bots)]
+        intent_name, slots = requests[name]
+        time_zone = EARLY_ZONE if i % 2 else LATE_ZONE
+        event = common.intent_request(intent_name, slots, session_attributes={'timeZone': time_zone})
+        response = bots[name].lambda_handler(event, None)
+        message = (response.get('messages') or [{}])[0].get('content') or ''
+        rejected = any(text in message for text in not_in_advance)
+        return rejected == (time_zone == EARLY_ZONE)
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        results = list(pool.map(handle, range(REQUESTS)))
+    print('{} requests in {} threads, {} bots, 2 time zones: {} with the wrong date'.format(
+        REQUESTS, WORKERS, len(bots), results.count(False)))
+    assert all(results)
+
+    # After the requests, no clock is left behind and the process time zone is untouched
+    bot = bots['order-flower']
+    assert bot.request_clock.get(None) is None
+    assert bot.today() == datetime.datetime.now(zoneinfo.ZoneInfo(helpers.DEFAULT_TIME_ZONE)).date()
+
+    event = common.intent_request('OrderFlowers', {}, session_attributes={'timeZone': 'Europe/Paris'})
+
+    def set_tz():
+        os.environ['TZ'] = 'America/New_York'
+        time.tzset()
+        return datetime.date.today()
+
+    def request_clock():
+        token = bot.request_clock.set(bot.RequestClock(bot.resolve_time_zone(event)))
+        try:
+            return bot.today()
+        finally:
+            bot.request_clock.reset(token)
+
+    baseline, candidate = common.compare(set_tz, request_clock, 20000, repeat=7)
+    print('per request, time zone setup and today()')
+    common.print_mean('  TZ and time.tzset', baseline)
+    common.print_mean('  request clock', candidate, baseline)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Local stand-in for the booking backend that BookTrip calls on fulfillment (BOOKING_BACKEND_URL).
+
+POST /reservations with a JSON reservation and an Idempotency-Key header answers
+{"confirmationId": ...}. A key seen before gets the confirmation id of its first booking back, so
+retried calls do not book twice. Latency and failures can be simulated.
+
+    python booking_stub.py --port 8080 --delay-ms 20 --failure-rate 0.05
+"""
+
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    # Concurrent clients opening new connections overflow the default listen backlog of 5
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class BookingStubServer(object):
+    """
+    delay, when given, is a callable() returning seconds to sleep before answering. A share
+    failure_rate of the calls is answered with a 503 before booking anything. book may answer a
+    body of bytes, sent as is.
+    """
+
+    def __init__(self, port=0, delay=None, failure_rate=0.0):
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self.bookings = {}
+        self.requests = 0
+        self.duplicates = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._server = StubHTTPServer(('127.0.0.1', port), self._request_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def endpoint_url(self):
+        return 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def book(self, key, reservation):
+        """
+        Returns the status and body of the answer to a booking
+        """
+        with self._lock:
+            self.requests += 1
+            if random.random() < self.failure_rate:
+                self.failures += 1
+                return 503, {'message': 'Service unavailable'}
+            if key in self.bookings:
+                self.duplicates += 1
+            else:
+                self.bookings[key] = {'confirmationId': uuid.uuid4().hex[:12].upper(), 'reservation': reservation}
+            return 200, {'confirmationId': self.bookings[key]['confirmationId']}
+
+    def _request_handler(self):
+        server = self
+
+        class BookingHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path.rstrip('/') != '/reservations':
+                    self._reply(404, {'message': 'Not found: {}'.format(self.path)})
+                    return
+                key = self.headers.get('Idempotency-Key')
+                if not key:
+                    self._reply(400, {'message': 'Missing Idempotency-Key header'})
+                    return
+                if server.delay:
+                    time.sleep(server.delay())
+                self._reply(*server.book(key, json.loads(body or b'{}')))
+
+            def _reply(self, status, body):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return BookingHandler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local stand-in for the BookTrip booking backend')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--delay-ms', type=float, default=0.0, help='Mean latency, exponentially distributed')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of calls answered with a 503')
+    args = parser.parse_args(argv)
+
+    delay = (lambda: random.expovariate(1000.0 / args.delay_ms)) if args.delay_ms > 0 else None
+    with BookingStubServer(args.port, delay, args.failure_rate) as server:
+        print('Booking backend stub on {}'.format(server.endpoint_url))
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
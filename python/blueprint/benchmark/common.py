@@ -0,0 +1,105 @@
+"""
+Shared helpers for the blueprint benchmarks.
+
+Loads the bot Lambda files as modules, builds Lex V2 events for them and times functions.
+Run the benchmarks from this directory, e.g. python bench_city_catalog.py
+"""
+
+import os
+import sys
+import time
+import timeit
+import importlib.util
+
+BLUEPRINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+# The bots import lexv2_blueprint_helpers, packaged next to them in Lambda
+sys.path.insert(0, BLUEPRINT_DIR)
+BOTS = {
+    'book-trip': os.path.join(BLUEPRINT_DIR, 'book-trip-example-bot', 'lexv2-book-trip.py'),
+    'make-appointment': os.path.join(BLUEPRINT_DIR, 'make-appointment-example-bot', 'lexv2-make-appointment.py'),
+    'order-flower': os.path.join(BLUEPRINT_DIR, 'order-flower-example-bot', 'lexv2-order-flower.py'),
+}
+
+
+def load_bot(name, env=None):
+    """
+    Loads a fresh copy of a bot's Lambda file, as a cold start would, with the given environment.
+    The shared lexv2_blueprint_helpers module is imported once, as any other module.
+    """
+    for key, value in (env or {}).items():
+        os.environ[key] = value
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), BOTS[name])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def slot(value):
+    if value is None:
+        return None
+    return {'shape': 'Scalar', 'value': {'originalValue': value, 'interpretedValue': value, 'resolvedValues': [value]}}
+
+
+def intent_request(intent_name, slots, invocation_source='DialogCodeHook', confirmation_state='None',
+                   session_attributes=None):
+    """
+    Builds a Lex V2 code hook event with the given interpreted slot values
+    """
+    return {
+        'sessionId': '123456789012345',
+        'invocationSource': invocation_source,
+        'inputMode': 'Text',
+        'bot': {'id': 'BOTID12345', 'name': 'Blueprint', 'aliasId': 'TSTALIASID', 'localeId': 'en_US', 'version': 'DRAFT'},
+        'sessionState': {
+            'sessionAttributes': dict(session_attributes or {}),
+            'intent': {
+                'name': intent_name,
+                'slots': {name: slot(value) for name, value in slots.items()},
+                'state': 'InProgress',
+                'confirmationState': confirmation_state
+            }
+        }
+    }
+
+
+def measure(fn, iterations, warmup=20):
+    """
+    Calls fn repeatedly and returns per-call latency statistics in microseconds
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        'mean': sum(samples) / len(samples),
+        'p50': samples[len(samples) // 2],
+        'p95': samples[int(len(samples) * 0.95)],
+        'p99': samples[int(len(samples) * 0.99)],
+    }
+
+
+def compare(baseline, candidate, iterations, repeat=15):
+    """
+    Best-of-repeat mean latencies (microseconds) of two functions, timed alternately so that
+    both see the same machine conditions
+    """
+    baseline_times = []
+    candidate_times = []
+    for _ in range(repeat):
+        baseline_times.append(timeit.timeit(baseline, number=iterations))
+        candidate_times.append(timeit.timeit(candidate, number=iterations))
+    return min(baseline_times) / iterations * 1e6, min(candidate_times) / iterations * 1e6
+
+
+def print_mean(label, mean, baseline=None):
+    speedup = '  ({:.2f}x)'.format(baseline / mean) if baseline else ''
+    print('{:<44} mean {:>10.3f}us{}'.format(label, mean, speedup))
+
+
+def print_stats(label, stats):
+    print('{:<44} mean {:>9.1f}us  p50 {:>9.1f}us  p95 {:>9.1f}us  p99 {:>9.1f}us'.format(
+        label, stats['mean'], stats['p50'], stats['p95'], stats['p99']))
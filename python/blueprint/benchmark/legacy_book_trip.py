@@ -0,0 +1,197 @@
+"""
+The BookTrip helper and validation functions as they were before the benchmarked changes, kept
+as the baseline for the benchmarks.
+"""
+
+import datetime
+import dateutil.parser
+
+
+def safe_int(n):
+    """
+    Safely convert n value to int.
+    """
+    if n is not None:
+        return int(n)
+    return n
+
+
+def try_ex(func):
+    """
+    Call passed in function in try block. If KeyError is encountered return None.
+    This function is intended to be used to safely access dictionary.
+
+    Note that this function would have negative impact on performance.
+    """
+
+    try:
+        return func()
+    except KeyError:
+        return None
+
+def interpreted_value(slot):
+    """
+    Retrieves interprated value from slot object
+    """
+    if slot is not None:
+        return slot["value"]["interpretedValue"]
+    return slot       
+
+
+def generate_car_price(location, days, age, car_type):
+    """
+    Generates a number within a reasonable range that might be expected for a flight.
+    The price is fixed for a given pair of locations.
+    """
+
+    car_types = ['economy', 'standard', 'midsize', 'full size', 'minivan', 'luxury']
+    base_location_cost = 0
+    for i in range(len(location)):
+        base_location_cost += ord(location.lower()[i]) - 97
+
+    age_multiplier = 1.10 if age < 25 else 1
+    # Select economy is car_type is not found
+    if car_type not in car_types:
+        car_type = car_types[0]
+
+    return days * ((100 + base_location_cost) + ((car_types.index(car_type.lower()) * 50) * age_multiplier))
+
+
+def generate_hotel_price(location, nights, room_type):
+    """
+    Generates a number within a reasonable range that might be expected for a hotel.
+    The price is fixed for a pair of location and roomType.
+    """
+
+    room_types = ['queen', 'king', 'deluxe']
+    cost_of_living = 0
+    for i in range(len(location)):
+        cost_of_living += ord(location.lower()[i]) - 97
+
+    return nights * (100 + cost_of_living + (100 + room_types.index(room_type.lower())))
+
+
+def isvalid_car_type(car_type):
+    car_types = ['economy', 'standard', 'midsize', 'full size', 'minivan', 'luxury']
+    return car_type.lower() in car_types
+
+
+def isvalid_city(city):
+    valid_cities = ['new york', 'los angeles', 'chicago', 'houston', 'philadelphia', 'phoenix', 'san antonio',
+                    'san diego', 'dallas', 'san jose', 'austin', 'jacksonville', 'san francisco', 'indianapolis',
+                    'columbus', 'fort worth', 'charlotte', 'detroit', 'el paso', 'seattle', 'denver', 'washington dc',
+                    'memphis', 'boston', 'nashville', 'baltimore', 'portland']
+    return city.lower() in valid_cities
+
+
+def isvalid_room_type(room_type):
+    room_types = ['queen', 'king', 'deluxe']
+    return room_type.lower() in room_types
+
+
+def isvalid_date(date):
+    try:
+        dateutil.parser.parse(date)
+        return True
+    except ValueError:
+        return False
+
+
+def get_day_difference(later_date, earlier_date):
+    later_datetime = dateutil.parser.parse(later_date).date()
+    earlier_datetime = dateutil.parser.parse(earlier_date).date()
+    return abs(later_datetime - earlier_datetime).days
+
+
+def add_days(date, number_of_days):
+    new_date = dateutil.parser.parse(date).date()
+    new_date += datetime.timedelta(days=number_of_days)
+    return new_date.strftime('%Y-%m-%d')
+
+
+def build_validation_result(isvalid, violated_slot, message_content):
+    return {
+        'isValid': isvalid,
+        'violatedSlot': violated_slot,
+        'message': {'contentType': 'PlainText', 'content': message_content}
+    }
+
+
+def validate_book_car(slots):
+    pickup_city = try_ex(lambda: slots['PickUpCity'])
+    pickup_date = try_ex(lambda: slots['PickUpDate'])
+    return_date = try_ex(lambda: slots['ReturnDate'])
+    driver_age = try_ex(lambda: slots['DriverAge'])
+    car_type = try_ex(lambda: slots['CarType'])
+
+    if pickup_city and not isvalid_city(pickup_city["value"]["interpretedValue"]):
+        return build_validation_result(
+            False,
+            'PickUpCity',
+            'We currently do not support {} as a valid destination.  Can you try a different city?'.format(interpreted_value(pickup_city))
+        )
+
+    if pickup_date:
+        if not isvalid_date(interpreted_value(pickup_date)):
+            return build_validation_result(False, 'PickUpDate', 'I did not understand your departure date.  When would you like to pick up your car rental?')
+        if datetime.datetime.strptime(interpreted_value(pickup_date), '%Y-%m-%d').date() <= datetime.date.today():
+            return build_validation_result(False, 'PickUpDate', 'Reservations must be scheduled at least one day in advance.  Can you try a different date?')
+
+    if return_date:
+        if not isvalid_date(interpreted_value(return_date)):
+            return build_validation_result(False, 'ReturnDate', 'I did not understand your return date.  When would you like to return your car rental?')
+
+    if pickup_date and return_date:
+        if dateutil.parser.parse(interpreted_value(pickup_date)) >= dateutil.parser.parse(interpreted_value(return_date)):
+            return build_validation_result(False, 'ReturnDate', 'Your return date must be after your pick up date.  Can you try a different return date?')
+
+        if get_day_difference(interpreted_value(pickup_date), interpreted_value(return_date)) > 30:
+            return build_validation_result(False, 'ReturnDate', 'You can reserve a car for up to thirty days.  Can you try a different return date?')
+
+    if driver_age is not None and safe_int(interpreted_value(driver_age)) < 18:
+        return build_validation_result(
+            False,
+            'DriverAge',
+            'Your driver must be at least eighteen to rent a car.  Can you provide the age of a different driver?'
+        )
+
+    if car_type and not isvalid_car_type(interpreted_value(car_type)):
+        return build_validation_result(
+            False,
+            'CarType',
+            'I did not recognize that model.  What type of car would you like to rent?  '
+            'Popular cars are economy, midsize, or luxury')
+
+    return {'isValid': True}
+
+
+def validate_hotel(slots):
+    location = try_ex(lambda: slots['Location'])
+    checkin_date = try_ex(lambda: slots['CheckInDate'])
+    nights = try_ex(lambda: slots['Nights'])
+    room_type = try_ex(lambda: slots['RoomType'])
+
+    if location and not isvalid_city(interpreted_value(location)):
+        return build_validation_result(
+            False,
+            'Location',
+            'We currently do not support {} as a valid destination.  Can you try a different city?'.format(interpreted_value(location))
+        )
+
+    if checkin_date:
+        if not isvalid_date(interpreted_value(checkin_date)):
+            return build_validation_result(False, 'CheckInDate', 'I did not understand your check in date.  When would you like to check in?')
+        if datetime.datetime.strptime(interpreted_value(checkin_date), '%Y-%m-%d').date() <= datetime.date.today():
+            return build_validation_result(False, 'CheckInDate', 'Reservations must be scheduled at least one day in advance.  Can you try a different date?')
+
+    if nights is not None and (safe_int(interpreted_value(nights)) < 1 or safe_int(interpreted_value(nights)) > 30):
+        return build_validation_result(
+            False,
+            'Nights',
+            'You can make a reservations for from one to thirty nights.  How many nights would you like to stay for?'
+        )
+
+    if room_type and not isvalid_room_type(interpreted_value(room_type)):
+        return build_validation_result(False, 'RoomType', 'I did not recognize that room type.  Would you like to stay in a queen, king, or deluxe room?')
+
+    return {'isValid': True}
@@ -0,0 +1,179 @@
+"""
+The MakeAppointment helper and validation functions as they were before the benchmarked changes,
+kept as the baseline for the benchmarks.
+"""
+
+import math
+import random
+import datetime
+import dateutil.parser
+
+
+def parse_int(n):
+    try:
+        return int(n)
+    except ValueError:
+        return float('nan')
+
+
+def try_ex(func):
+    """
+    Call passed in function in try block. If KeyError is encountered return None.
+    This function is intended to be used to safely access dictionary.
+
+    Note that this function would have negative impact on performance.
+    """
+
+    try:
+        return func()
+    except KeyError:
+        return None
+
+def interpreted_value(slot):
+    """
+    Retrieves interprated value from slot object
+    """
+    if slot is not None:
+        return slot["value"]["interpretedValue"]
+    return slot  
+
+def increment_time_by_thirty_mins(appointment_time):
+    hour, minute = list(map(int, appointment_time.split(':')))
+    return '{}:00'.format(hour + 1) if minute == 30 else '{}:30'.format(hour)
+
+
+def get_random_int(minimum, maximum):
+    """
+    Returns a random integer between min (included) and max (excluded)
+    """
+    min_int = math.ceil(minimum)
+    max_int = math.floor(maximum)
+
+    return random.randint(min_int, max_int - 1)
+
+
+def get_availabilities(date):
+    """
+    Helper function which in a full implementation would  feed into a backend API to provide query schedule availability.
+    The output of this function is an array of 30 minute periods of availability, expressed in ISO-8601 time format.
+
+    In order to enable quick demonstration of all possible conversation paths supported in this example, the function
+    returns a mixture of fixed and randomized results.
+
+    On Mondays, availability is randomized; otherwise there is no availability on Tuesday / Thursday and availability at
+    10:00 - 10:30 and 4:00 - 5:00 on Wednesday / Friday.
+    """
+    day_of_week = dateutil.parser.parse(date).weekday()
+    availabilities = []
+    available_probability = 0.3
+    if day_of_week == 0:
+        start_hour = 10
+        while start_hour <= 16:
+            if random.random() < available_probability:
+                # Add an availability window for the given hour, with duration determined by another random number.
+                appointment_type = get_random_int(1, 4)
+                if appointment_type == 1:
+                    availabilities.append('{}:00'.format(start_hour))
+                elif appointment_type == 2:
+                    availabilities.append('{}:30'.format(start_hour))
+                else:
+                    availabilities.append('{}:00'.format(start_hour))
+                    availabilities.append('{}:30'.format(start_hour))
+            start_hour += 1
+
+    if day_of_week == 2 or day_of_week == 4:
+        availabilities.append('10:00')
+        availabilities.append('16:00')
+        availabilities.append('16:30')
+
+    return availabilities
+
+
+def isvalid_date(date):
+    try:
+        dateutil.parser.parse(date)
+        return True
+    except ValueError:
+        return False
+
+
+def is_available(appointment_time, duration, availabilities):
+    """
+    Helper function to check if the given time and duration fits within a known set of availability windows.
+    Duration is assumed to be one of 30, 60 (meaning minutes).  Availabilities is expected to contain entries of the format HH:MM.
+    """
+    if duration == 30:
+        return interpreted_value(appointment_time) in availabilities
+    elif duration == 60:
+        second_half_hour_time = increment_time_by_thirty_mins(interpreted_value(appointment_time))
+        return interpreted_value(appointment_time) in availabilities and second_half_hour_time in availabilities
+
+    # Invalid duration ; throw error.  We should not have reached this branch due to earlier validation.
+    raise Exception('Was not able to understand duration {}'.format(duration))
+
+
+def get_duration(appointment_type):
+    appointment_duration_map = {'cleaning': 30, 'root canal': 60, 'whitening': 30}
+    return try_ex(lambda: appointment_duration_map[interpreted_value(appointment_type).lower()])
+
+
+def get_availabilities_for_duration(duration, availabilities):
+    """
+    Helper function to return the windows of availability of the given duration, when provided a set of 30 minute windows.
+    """
+    duration_availabilities = []
+    start_time = '10:00'
+    while start_time != '17:00':
+        if start_time in availabilities:
+            if duration == 30:
+                duration_availabilities.append(start_time)
+            elif increment_time_by_thirty_mins(start_time) in availabilities:
+                duration_availabilities.append(start_time)
+
+        start_time = increment_time_by_thirty_mins(start_time)
+
+    return duration_availabilities
+
+
+def build_validation_result(is_valid, violated_slot, message_content):
+    return {
+        'isValid': is_valid,
+        'violatedSlot': violated_slot,
+        'message': {'contentType': 'PlainText', 'content': message_content}
+    }
+
+
+def validate_book_appointment(appointment_type, date, appointment_time):
+    if appointment_type and not get_duration(appointment_type):
+        return build_validation_result(False, 'AppointmentType', 'I did not recognize that, can I book you a root canal, cleaning, or whitening?')
+
+    if appointment_time:
+        if len(appointment_time["value"]["resolvedValues"]) != 1:
+            return build_validation_result(False, 'Time', 'I did not understand that, what time would you like to book your appointment? Please specify AM or PM')
+        if len(interpreted_value(appointment_time)) != 5:
+            return build_validation_result(False, 'Time', 'I did not recognize that, what time would you like to book your appointment?')
+
+        hour, minute = interpreted_value(appointment_time).split(':')
+        hour = parse_int(hour)
+        minute = parse_int(minute)
+        if math.isnan(hour) or math.isnan(minute):
+            return build_validation_result(False, 'Time', 'I did not recognize that, what time would you like to book your appointment?')
+
+        if hour < 10 or hour > 16:
+            # Outside of business hours
+            return build_validation_result(False, 'Time', 'Our business hours are ten a.m. to five p.m.  What time works best for you?')
+
+        if minute not in [30, 0]:
+            # Must be booked on the hour or half hour
+            return build_validation_result(False, 'Time', 'We schedule appointments every half hour, what time works best for you?')
+
+    if date:
+        interpreted_date = interpreted_value(date)
+        if not isvalid_date(interpreted_date):
+            return build_validation_result(False, 'Date', 'I did not understand that, what date works best for you?')
+        elif datetime.datetime.strptime(interpreted_date, '%Y-%m-%d').date() <= datetime.date.today():
+            return build_validation_result(False, 'Date', 'Appointments must be scheduled a day in advance.  Can you try a different date?')
+        elif dateutil.parser.parse(interpreted_date).weekday() == 5 or dateutil.parser.parse(interpreted_date).weekday() == 6:
+            return build_validation_result(False, 'Date', 'Our office is not open on the weekends, can you provide a work day?')
+
+    return build_validation_result(True, None, None)
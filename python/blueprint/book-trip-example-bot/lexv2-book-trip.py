@@ -8,16 +8,77 @@ For instructions on how to set up and test this bot, as well as additional sampl
 visit the Lex Getting Started documentation https://docs.aws.amazon.com/lexv2/latest/dg/what-is.html.
 """
 
+import csv
 import json
+import collections
 import datetime
+import hashlib
+import importlib
 import time
 import os
-import dateutil.parser
+import threading
 import logging
 
+# Shared by the blueprint bots; package lexv2_blueprint_helpers.py next to this file
+from lexv2_blueprint_helpers import (RequestClock, compile_slot_extractor, parse_date, request_clock,
+                                     resolve_time_zone, today)
+
+try:
+    # NumPy is not part of the Lambda runtime. Package it, or add a layer which provides it, to
+    # price alternatives in batches; without it they are priced one by one.
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    # urllib3 comes with the Lambda runtime, as a dependency of boto3. It is only needed to call a
+    # booking backend.
+    import urllib3
+except ImportError:
+    urllib3 = None
+
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
+# Data file with the supported cities, one per row under a 'name' header
+CITY_CATALOG_PATH = os.environ.get('CITY_CATALOG_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cities.csv'))
+
+CAR_TYPES = ('economy', 'standard', 'midsize', 'full size', 'minivan', 'luxury')
+ROOM_TYPES = ('queen', 'king', 'deluxe')
+CAR_TYPE_INDEX = {car_type: i for i, car_type in enumerate(CAR_TYPES)}
+ROOM_TYPE_INDEX = {room_type: i for i, room_type in enumerate(ROOM_TYPES)}
+
+# "Did you mean" suggestions for unsupported cities: cities sharing at least
+# CITY_SUGGESTION_MIN_SCORE of their trigrams with the input are suggested. A single suggestion
+# scoring CITY_SUGGESTION_CONFIRM_SCORE, CITY_SUGGESTION_MARGIN ahead of the next one, is offered
+# for confirmation.
+CITY_SUGGESTION_LIMIT = 3
+CITY_SUGGESTION_MIN_SCORE = 0.4
+CITY_SUGGESTION_CONFIRM_SCORE = 0.6
+CITY_SUGGESTION_MARGIN = 0.2
+
+# Alternatives offered with a quote: every car or room type, for this many days or nights more
+# and less than requested
+ALTERNATIVE_DURATION_SPREAD = 2
+
+# Quotes (a price with its alternatives) are cached in the container for QUOTE_CACHE_TTL seconds,
+# QUOTE_CACHE_SIZE reservations at most. QUOTE_BACKEND names a 'module.function' pricing quotes in
+# place of the quote engine, e.g. a client of a rates service; it is called with a key
+# ('Car', location, days, age, car type) or ('Hotel', location, nights, room type) and returns
+# (price, alternatives).
+QUOTE_CACHE_SIZE = int(os.environ.get('QUOTE_CACHE_SIZE', '1024'))
+QUOTE_CACHE_TTL = float(os.environ.get('QUOTE_CACHE_TTL', '300'))
+QUOTE_BACKEND = os.environ.get('QUOTE_BACKEND', '')
+
+# Booking backend called on fulfillment; without a URL, reservations are only logged. A call must
+# finish within BOOKING_BACKEND_TIMEOUT_MS, and BOOKING_BACKEND_RESERVE_MS before the function
+# times out. Failed calls are retried BOOKING_BACKEND_RETRIES times while that allows.
+BOOKING_BACKEND_URL = os.environ.get('BOOKING_BACKEND_URL', '')
+BOOKING_BACKEND_MAX_CONNECTIONS = int(os.environ.get('BOOKING_BACKEND_MAX_CONNECTIONS', '10'))
+BOOKING_BACKEND_TIMEOUT_MS = int(os.environ.get('BOOKING_BACKEND_TIMEOUT_MS', '3000'))
+BOOKING_BACKEND_RESERVE_MS = int(os.environ.get('BOOKING_BACKEND_RESERVE_MS', '500'))
+BOOKING_BACKEND_RETRIES = int(os.environ.get('BOOKING_BACKEND_RETRIES', '1'))
+
 
 # --- Helpers that build all of the responses ---
 
@@ -94,57 +155,341 @@ def delegate(session_attributes, intent_name, slots):
     }
 
 
-# --- Helper Functions ---
+def clear_confirmation(response):
+    """
+    Resets the confirmation state of the intent, when the user confirmed a suggestion rather than the intent itself.
+    """
+    response['sessionState']['intent']['confirmationState'] = 'None'
+    return response
 
 
-def safe_int(n):
+def build_slot_value(interpreted_value):
     """
-    Safely convert n value to int.
+    Build a slot object with given interpretedValue.
     """
-    if n is not None:
-        return int(n)
-    return n
+    return {
+        "shape": "Scalar",
+        "value": {
+            "originalValue": interpreted_value,
+            "interpretedValue": interpreted_value,
+            "resolvedValues": [interpreted_value]
+        }
+    }
+
+
+# --- City catalog ---
+
+
+def normalize_city(city):
+    """
+    Catalog key of a city name: lower case with single spaces
+    """
+    return ' '.join(city.lower().split())
 
 
-def try_ex(func):
+def city_trigrams(key):
+    """
+    Distinct character trigrams of a normalized city name, padded to mark its start and end
     """
-    Call passed in function in try block. If KeyError is encountered return None.
-    This function is intended to be used to safely access dictionary.
+    padded = '  ' + key + ' '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
 
-    Note that this function would have negative impact on performance.
+
+def city_cost_base(city):
+    """
+    Location part of the generated prices, derived from the letters of the city name
     """
+    return sum(ord(c) - 97 for c in city.lower())
 
-    try:
-        return func()
-    except KeyError:
-        return None
 
-def interpreted_value(slot):
+class CityCatalog(object):
     """
-    Retrieves interprated value from slot object
+    The supported cities, indexed by normalized name, with their pricing cost base computed
+    when the catalog is loaded. An inverted trigram index over the names serves "did you mean"
+    suggestions.
     """
-    if slot is not None:
-        return slot["value"]["interpretedValue"]
-    return slot       
 
+    def __init__(self, names):
+        self.cities = {}
+        for name in names:
+            key = normalize_city(name)
+            if key:
+                self.cities[key] = city_cost_base(key)
+
+        self.names = list(self.cities)
+        self.trigram_counts = []
+        self.trigram_index = {}
+        for i, key in enumerate(self.names):
+            trigrams = city_trigrams(key)
+            self.trigram_counts.append(len(trigrams))
+            for trigram in trigrams:
+                self.trigram_index.setdefault(trigram, []).append(i)
+
+    def __len__(self):
+        return len(self.cities)
+
+    def is_valid(self, city):
+        return normalize_city(city) in self.cities
+
+    def cost_base(self, city):
+        cost_base = self.cities.get(normalize_city(city))
+        if cost_base is None:
+            # Prices can be requested before the city is validated
+            cost_base = city_cost_base(city)
+        return cost_base
+
+    def suggest(self, city, limit=CITY_SUGGESTION_LIMIT, min_score=CITY_SUGGESTION_MIN_SCORE):
+        """
+        Up to limit (name, score) pairs of the cities most similar to city, best first. The score
+        is the Dice coefficient of the trigram sets.
+        """
+        trigrams = city_trigrams(normalize_city(city))
+        shared = {}
+        for trigram in trigrams:
+            for i in self.trigram_index.get(trigram, ()):
+                shared[i] = shared.get(i, 0) + 1
+
+        # A city cannot reach min_score with fewer shared trigrams than this
+        min_shared = min_score * len(trigrams) / 2
+        scored = []
+        for i, count in shared.items():
+            if count >= min_shared:
+                score = 2.0 * count / (len(trigrams) + self.trigram_counts[i])
+                if score >= min_score:
+                    scored.append((score, self.names[i]))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(name, score) for score, name in scored[:limit]]
+
+
+def load_city_catalog(path):
+    with open(path, newline='') as f:
+        return CityCatalog(row['name'] for row in csv.DictReader(f))
+
+
+# Loaded once per container
+city_catalog = load_city_catalog(CITY_CATALOG_PATH)
+
+
+# --- Quote engine ---
+
+
+class QuoteEngine(object):
+    """
+    Prices car rentals and hotel stays. The grid methods price every combination of their
+    arguments in one batched computation and return an array indexed in argument order, e.g.
+    car_price_grid(locations, days, ages, car_types)[location][days][age][car_type].
+    """
 
-def generate_car_price(location, days, age, car_type):
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def car_price(self, location, days, age, car_type):
+        age_multiplier = 1.10 if age < 25 else 1
+        # Select economy is car_type is not found
+        car_type_cost = CAR_TYPE_INDEX.get(car_type.lower(), 0) * 50
+        return days * ((100 + self.catalog.cost_base(location)) + (car_type_cost * age_multiplier))
+
+    def hotel_price(self, location, nights, room_type):
+        return nights * (100 + self.catalog.cost_base(location) + (100 + ROOM_TYPE_INDEX[room_type.lower()]))
+
+    def car_price_grid(self, locations, days, ages, car_types):
+        if numpy is None:
+            return [[[[self.car_price(location, d, age, car_type) for car_type in car_types] for age in ages]
+                     for d in days] for location in locations]
+        base = numpy.array([100 + self.catalog.cost_base(location) for location in locations], dtype=float)
+        car_type_cost = numpy.array([CAR_TYPE_INDEX.get(car_type.lower(), 0) * 50 for car_type in car_types], dtype=float)
+        age_multiplier = numpy.where(numpy.asarray(ages) < 25, 1.10, 1.0)
+        return numpy.asarray(days, dtype=float)[None, :, None, None] * (
+            base[:, None, None, None] + car_type_cost[None, None, None, :] * age_multiplier[None, None, :, None]
+        )
+
+    def hotel_price_grid(self, locations, nights, room_types):
+        if numpy is None:
+            return [[[self.hotel_price(location, n, room_type) for room_type in room_types] for n in nights]
+                    for location in locations]
+        base = numpy.array([100 + self.catalog.cost_base(location) for location in locations])
+        room_type_cost = numpy.array([100 + ROOM_TYPE_INDEX[room_type.lower()] for room_type in room_types])
+        return numpy.asarray(nights)[None, :, None] * (base[:, None, None] + room_type_cost[None, None, :])
+
+
+def grid_to_list(grid):
+    return grid.tolist() if numpy is not None else grid
+
+
+def alternative_durations(duration, maximum=30):
+    return [d for d in range(duration - ALTERNATIVE_DURATION_SPREAD, duration + ALTERNATIVE_DURATION_SPREAD + 1)
+            if 1 <= d <= maximum]
+
+
+def car_alternatives(location, days, age):
     """
-    Generates a number within a reasonable range that might be expected for a flight.
-    The price is fixed for a given pair of locations.
+    Prices of every car type for a few days more or less, as {car type: {days: price}}
     """
+    durations = alternative_durations(days)
+    prices = grid_to_list(quote_engine.car_price_grid([location], durations, [age], CAR_TYPES))[0]
+    return {
+        car_type: {str(d): round(prices[i][0][j], 2) for i, d in enumerate(durations)}
+        for j, car_type in enumerate(CAR_TYPES)
+    }
+
+
+def hotel_alternatives(location, nights):
+    """
+    Prices of every room type for a few nights more or less, as {room type: {nights: price}}
+    """
+    durations = alternative_durations(nights)
+    prices = grid_to_list(quote_engine.hotel_price_grid([location], durations, ROOM_TYPES))[0]
+    return {
+        room_type: {str(n): prices[i][j] for i, n in enumerate(durations)}
+        for j, room_type in enumerate(ROOM_TYPES)
+    }
+
+
+quote_engine = QuoteEngine(city_catalog)
+
+
+# --- Quote cache ---
+
+
+class QuoteCache(object):
+    """
+    Quotes of the most recently priced reservations, each kept for at most ttl seconds. On a miss,
+    backend(key) prices the quote, as (price, alternatives). Quotes are shared between turns and
+    must not be modified.
+    """
+
+    def __init__(self, backend, max_size=QUOTE_CACHE_SIZE, ttl=QUOTE_CACHE_TTL, clock=time.monotonic):
+        self.backend = backend
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        # Incremented by invalidation, so that quotes priced before it are not cached after it
+        self.generation = 0
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self.entries[key]
+                self.expirations += 1
+            self.misses += 1
+            generation = self.generation
+
+        # Priced outside the lock, so that a slow backend does not hold up other turns
+        quote = self.backend(key)
+        with self.lock:
+            if generation == self.generation:
+                self.entries[key] = (self.clock() + self.ttl, quote)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        return quote
+
+    def invalidate(self, reservation_type=None, location=None):
+        """
+        Drops the cached quotes of a reservation type, of a location, or of both, or every quote
+        when neither is given. Returns the number of quotes dropped.
+        """
+        with self.lock:
+            self.generation += 1
+            if reservation_type is None and location is None:
+                dropped = len(self.entries)
+                self.entries.clear()
+                return dropped
+            location = location.lower() if location is not None else None
+            keys = [key for key in self.entries
+                    if (reservation_type is None or key[0] == reservation_type) and (location is None or key[1] == location)]
+            for key in keys:
+                del self.entries[key]
+            return len(keys)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'expirations': self.expirations,
+                'evictions': self.evictions
+            }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+
+def engine_quote(key):
+    """
+    Prices a quote with the quote engine, the default quote backend
+    """
+    if key[0] == 'Car':
+        _, location, days, age, car_type = key
+        return quote_engine.car_price(location, days, age, car_type), car_alternatives(location, days, age)
+    _, location, nights, room_type = key
+    return quote_engine.hotel_price(location, nights, room_type), hotel_alternatives(location, nights)
+
+
+def load_quote_backend(name):
+    """
+    The function named by a 'module.function' path, or the quote engine without one
+    """
+    if not name:
+        return engine_quote
+    module_name, _, function_name = name.rpartition('.')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def car_quote(location, days, age, car_type):
+    """
+    Price of a car rental and of its alternatives, as (price, {car type: {days: price}})
+    """
+    return quote_cache.get(('Car', location.lower(), days, age, car_type.lower()))
+
+
+def hotel_quote(location, nights, room_type):
+    """
+    Price of a hotel stay and of its alternatives, as (price, {room type: {nights: price}})
+    """
+    return quote_cache.get(('Hotel', location.lower(), nights, room_type.lower()))
+
+
+quote_cache = QuoteCache(load_quote_backend(QUOTE_BACKEND))
+
+
+# --- Helper Functions ---
 
-    car_types = ['economy', 'standard', 'midsize', 'full size', 'minivan', 'luxury']
-    base_location_cost = 0
-    for i in range(len(location)):
-        base_location_cost += ord(location.lower()[i]) - 97
 
-    age_multiplier = 1.10 if age < 25 else 1
-    # Select economy is car_type is not found
-    if car_type not in car_types:
-        car_type = car_types[0]
+def safe_int(n):
+    """
+    Safely convert n value to int.
+    """
+    if n is not None:
+        return int(n)
+    return n
+
 
-    return days * ((100 + base_location_cost) + ((car_types.index(car_type.lower()) * 50) * age_multiplier))
+def generate_car_price(location, days, age, car_type):
+    """
+    Generates a number within a reasonable range that might be expected for a flight.
+    The price is fixed for a given pair of locations.
+    """
+    return quote_engine.car_price(location, days, age, car_type)
 
 
 def generate_hotel_price(location, nights, room_type):
@@ -152,100 +497,161 @@ def generate_hotel_price(location, nights, room_type):
     Generates a number within a reasonable range that might be expected for a hotel.
     The price is fixed for a pair of location and roomType.
     """
+    return quote_engine.hotel_price(location, nights, room_type)
+
+
+def format_price(price):
+    return '${:,.2f}'.format(price)
 
-    room_types = ['queen', 'king', 'deluxe']
-    cost_of_living = 0
-    for i in range(len(location)):
-        cost_of_living += ord(location.lower()[i]) - 97
 
-    return nights * (100 + cost_of_living + (100 + room_types.index(room_type.lower())))
+def format_duration(duration, unit):
+    return '{} {}{}'.format(duration, unit, '' if str(duration) == '1' else 's')
+
+
+def quote_prompt(description, price, alternatives, selected_type, kind, duration, unit):
+    """
+    Prompt confirming a reservation with its price and its alternatives: the other types for the
+    same duration, then the selected type for the other durations
+    """
+    selected_type = selected_type.lower()
+    duration = str(duration)
+    other_types = ['{} {}'.format(alternative_type, format_price(prices[duration]))
+                   for alternative_type, prices in alternatives.items()
+                   if alternative_type != selected_type and duration in prices]
+    other_durations = ['{} {}'.format(format_duration(d, unit), format_price(price))
+                       for d, price in alternatives.get(selected_type, {}).items() if d != duration]
+    sentences = ['{} is {}.'.format(description, format_price(price))]
+    if other_types:
+        sentences.append('For {}: {}.'.format(format_duration(duration, unit), ', '.join(other_types)))
+    if other_durations:
+        sentences.append('A {} {} for {}.'.format(selected_type, kind, ', '.join(other_durations)))
+    sentences.append('Shall I book the {} {}?'.format(selected_type, kind))
+    return ' '.join(sentences)
 
 
 def isvalid_car_type(car_type):
-    car_types = ['economy', 'standard', 'midsize', 'full size', 'minivan', 'luxury']
-    return car_type.lower() in car_types
+    return car_type.lower() in CAR_TYPE_INDEX
 
 
 def isvalid_city(city):
-    valid_cities = ['new york', 'los angeles', 'chicago', 'houston', 'philadelphia', 'phoenix', 'san antonio',
-                    'san diego', 'dallas', 'san jose', 'austin', 'jacksonville', 'san francisco', 'indianapolis',
-                    'columbus', 'fort worth', 'charlotte', 'detroit', 'el paso', 'seattle', 'denver', 'washington dc',
-                    'memphis', 'boston', 'nashville', 'baltimore', 'portland']
-    return city.lower() in valid_cities
+    return city_catalog.is_valid(city)
 
 
 def isvalid_room_type(room_type):
-    room_types = ['queen', 'king', 'deluxe']
-    return room_type.lower() in room_types
+    return room_type.lower() in ROOM_TYPE_INDEX
 
 
 def isvalid_date(date):
-    try:
-        dateutil.parser.parse(date)
-        return True
-    except ValueError:
-        return False
+    return parse_date(date) is not None
 
 
 def get_day_difference(later_date, earlier_date):
-    later_datetime = dateutil.parser.parse(later_date).date()
-    earlier_datetime = dateutil.parser.parse(earlier_date).date()
-    return abs(later_datetime - earlier_datetime).days
+    return abs(parse_date(later_date) - parse_date(earlier_date)).days
 
 
 def add_days(date, number_of_days):
-    new_date = dateutil.parser.parse(date).date()
-    new_date += datetime.timedelta(days=number_of_days)
-    return new_date.strftime('%Y-%m-%d')
+    new_date = parse_date(date) + datetime.timedelta(days=number_of_days)
+    return new_date.isoformat()
 
 
-def build_validation_result(isvalid, violated_slot, message_content):
-    return {
+def build_validation_result(isvalid, violated_slot, message_content, suggestion=None):
+    result = {
         'isValid': isvalid,
         'violatedSlot': violated_slot,
         'message': {'contentType': 'PlainText', 'content': message_content}
     }
+    if suggestion is not None:
+        result['suggestion'] = suggestion
+    return result
 
 
-def validate_book_car(slots):
-    pickup_city = try_ex(lambda: slots['PickUpCity'])
-    pickup_date = try_ex(lambda: slots['PickUpDate'])
-    return_date = try_ex(lambda: slots['ReturnDate'])
-    driver_age = try_ex(lambda: slots['DriverAge'])
-    car_type = try_ex(lambda: slots['CarType'])
+def build_invalid_city_result(violated_slot, city):
+    """
+    Rejects an unsupported city, suggesting the closest supported ones. A single strong match is
+    returned as the suggestion to confirm.
+    """
+    suggestions = city_catalog.suggest(city)
+    if not suggestions:
+        return build_validation_result(
+            False,
+            violated_slot,
+            'We currently do not support {} as a valid destination.  Can you try a different city?'.format(city)
+        )
 
-    if pickup_city and not isvalid_city(pickup_city["value"]["interpretedValue"]):
+    best_name, best_score = suggestions[0]
+    next_score = suggestions[1][1] if len(suggestions) > 1 else 0
+    if best_score >= CITY_SUGGESTION_CONFIRM_SCORE and best_score - next_score >= CITY_SUGGESTION_MARGIN:
         return build_validation_result(
             False,
-            'PickUpCity',
-            'We currently do not support {} as a valid destination.  Can you try a different city?'.format(interpreted_value(pickup_city))
+            violated_slot,
+            'We currently do not support {} as a valid destination.  Did you mean {}?'.format(city, best_name),
+            best_name
         )
 
-    if pickup_date:
-        if not isvalid_date(interpreted_value(pickup_date)):
+    names = [name for name, _ in suggestions]
+    return build_validation_result(
+        False,
+        violated_slot,
+        'We currently do not support {} as a valid destination.  Did you mean {}?'.format(
+            city, ' or '.join([', '.join(names[:-1]), names[-1]]) if len(names) > 1 else names[0])
+    )
+
+
+def elicit_or_confirm_suggestion(intent_request, session_attributes, slots, validation_result):
+    """
+    Re-elicits the violated slot, or asks the user to confirm the suggested value when there is one
+    """
+    intent_name = intent_request['sessionState']['intent']['name']
+    suggestion = validation_result.get('suggestion')
+    if suggestion is not None:
+        slots[validation_result['violatedSlot']] = build_slot_value(suggestion)
+        session_attributes['confirmationContext'] = 'CitySuggestion'
+        return confirm_intent(session_attributes, intent_name, slots, validation_result['message'])
+
+    slots[validation_result['violatedSlot']] = None
+    return elicit_slot(
+        session_attributes,
+        intent_name,
+        slots,
+        validation_result['violatedSlot'],
+        validation_result['message']
+    )
+
+
+def validate_book_car(values):
+    """
+    Validates the BookCar slot values read by book_car_slots
+    """
+    if values.pickup_city and not isvalid_city(values.pickup_city):
+        return build_invalid_city_result('PickUpCity', values.pickup_city)
+
+    if values.pickup_date:
+        pickup_day = parse_date(values.pickup_date)
+        if pickup_day is None:
             return build_validation_result(False, 'PickUpDate', 'I did not understand your departure date.  When would you like to pick up your car rental?')
-        if datetime.datetime.strptime(interpreted_value(pickup_date), '%Y-%m-%d').date() <= datetime.date.today():
+        if pickup_day <= today():
             return build_validation_result(False, 'PickUpDate', 'Reservations must be scheduled at least one day in advance.  Can you try a different date?')
 
-    if return_date:
-        if not isvalid_date(interpreted_value(return_date)):
+    if values.return_date:
+        return_day = parse_date(values.return_date)
+        if return_day is None:
             return build_validation_result(False, 'ReturnDate', 'I did not understand your return date.  When would you like to return your car rental?')
 
-    if pickup_date and return_date:
-        if dateutil.parser.parse(interpreted_value(pickup_date)) >= dateutil.parser.parse(interpreted_value(return_date)):
+    if values.pickup_date and values.return_date:
+        if pickup_day >= return_day:
             return build_validation_result(False, 'ReturnDate', 'Your return date must be after your pick up date.  Can you try a different return date?')
 
-        if get_day_difference(interpreted_value(pickup_date), interpreted_value(return_date)) > 30:
+        if (return_day - pickup_day).days > 30:
             return build_validation_result(False, 'ReturnDate', 'You can reserve a car for up to thirty days.  Can you try a different return date?')
 
-    if driver_age is not None and safe_int(interpreted_value(driver_age)) < 18:
+    if values.driver_age is not None and safe_int(values.driver_age) < 18:
         return build_validation_result(
             False,
             'DriverAge',
             'Your driver must be at least eighteen to rent a car.  Can you provide the age of a different driver?'
         )
 
-    if car_type and not isvalid_car_type(interpreted_value(car_type)):
+    if values.car_type and not isvalid_car_type(values.car_type):
         return build_validation_result(
             False,
             'CarType',
@@ -255,42 +661,374 @@ def validate_book_car(slots):
     return {'isValid': True}
 
 
-def validate_hotel(slots):
-    location = try_ex(lambda: slots['Location'])
-    checkin_date = try_ex(lambda: slots['CheckInDate'])
-    nights = try_ex(lambda: slots['Nights'])
-    room_type = try_ex(lambda: slots['RoomType'])
-
-    if location and not isvalid_city(interpreted_value(location)):
-        return build_validation_result(
-            False,
-            'Location',
-            'We currently do not support {} as a valid destination.  Can you try a different city?'.format(interpreted_value(location))
-        )
+def validate_hotel(values):
+    """
+    Validates the BookHotel slot values read by book_hotel_slots
+    """
+    if values.location and not isvalid_city(values.location):
+        return build_invalid_city_result('Location', values.location)
 
-    if checkin_date:
-        if not isvalid_date(interpreted_value(checkin_date)):
+    if values.checkin_date:
+        checkin_day = parse_date(values.checkin_date)
+        if checkin_day is None:
             return build_validation_result(False, 'CheckInDate', 'I did not understand your check in date.  When would you like to check in?')
-        if datetime.datetime.strptime(interpreted_value(checkin_date), '%Y-%m-%d').date() <= datetime.date.today():
+        if checkin_day <= today():
             return build_validation_result(False, 'CheckInDate', 'Reservations must be scheduled at least one day in advance.  Can you try a different date?')
 
-    if nights is not None and (safe_int(interpreted_value(nights)) < 1 or safe_int(interpreted_value(nights)) > 30):
+    if values.nights is not None and (safe_int(values.nights) < 1 or safe_int(values.nights) > 30):
         return build_validation_result(
             False,
             'Nights',
             'You can make a reservations for from one to thirty nights.  How many nights would you like to stay for?'
         )
 
-    if room_type and not isvalid_room_type(interpreted_value(room_type)):
+    if values.room_type and not isvalid_room_type(values.room_type):
         return build_validation_result(False, 'RoomType', 'I did not recognize that room type.  Would you like to stay in a queen, king, or deluxe room?')
 
     return {'isValid': True}
 
 
+# --- Slot extraction ---
+
+
+book_car_slots = compile_slot_extractor('BookCarSlots', (
+    ('pickup_city', 'PickUpCity'),
+    ('pickup_date', 'PickUpDate'),
+    ('return_date', 'ReturnDate'),
+    ('driver_age', 'DriverAge'),
+    ('car_type', 'CarType'),
+))
+book_hotel_slots = compile_slot_extractor('BookHotelSlots', (
+    ('location', 'Location'),
+    ('checkin_date', 'CheckInDate'),
+    ('nights', 'Nights'),
+    ('room_type', 'RoomType'),
+))
+
+
+# --- Reservation state ---
+
+
+# Reservations are kept in the currentReservation and lastConfirmedReservation session attributes
+# as '<version>|<type>|<field>|...', with the interpreted values of RESERVATION_FIELDS in order.
+# '%' and '|' in values are percent-encoded, and a missing value is an empty field. Reservations
+# stored by earlier versions of this function as JSON slot objects are still read.
+RESERVATION_FORMAT_VERSION = '1'
+RESERVATION_FIELDS = {
+    'Hotel': ('Location', 'CheckInDate', 'Nights', 'RoomType'),
+    'Car': ('PickUpCity', 'PickUpDate', 'ReturnDate', 'CarType'),
+}
+RESERVATION_TYPE_CODES = {'Hotel': 'H', 'Car': 'C'}
+RESERVATION_TYPES = {code: reservation_type for reservation_type, code in RESERVATION_TYPE_CODES.items()}
+
+
+def encode_reservation_value(value):
+    if value is None:
+        return ''
+    value = str(value)
+    if '%' in value or '|' in value:
+        value = value.replace('%', '%25').replace('|', '%7C')
+    return value
+
+
+def decode_reservation_value(value):
+    if not value:
+        return None
+    if '%' in value:
+        value = value.replace('%7C', '|').replace('%25', '%')
+    return value
+
+
+def encode_reservation(reservation_type, values):
+    """
+    Encodes a reservation for the session attributes. values are the interpreted values of the
+    reservation type's RESERVATION_FIELDS, in order.
+    """
+    return '|'.join([RESERVATION_FORMAT_VERSION, RESERVATION_TYPE_CODES[reservation_type]]
+                    + [encode_reservation_value(value) for value in values])
+
+
+def decode_reservation(data):
+    """
+    Decodes a reservation stored in the session attributes into a dict with its ReservationType and
+    the interpreted value, or None, of each of its fields. Returns None if there is no reservation
+    or it cannot be read.
+    """
+    if not data:
+        return None
+    if data[0] == '{':
+        return decode_legacy_reservation(data)
+
+    parts = data.split('|')
+    reservation_type = RESERVATION_TYPES.get(parts[1]) if len(parts) > 1 else None
+    if parts[0] != RESERVATION_FORMAT_VERSION or reservation_type is None \
+            or len(parts) != len(RESERVATION_FIELDS[reservation_type]) + 2:
+        logger.warning('Ignoring unreadable reservation {!r}'.format(data))
+        return None
+
+    reservation = {'ReservationType': reservation_type}
+    for field, value in zip(RESERVATION_FIELDS[reservation_type], parts[2:]):
+        reservation[field] = decode_reservation_value(value)
+    return reservation
+
+
+def decode_legacy_reservation(data):
+    """
+    Reads a reservation stored as JSON, with a Lex slot object or None for each field
+    """
+    try:
+        stored = json.loads(data)
+    except ValueError:
+        stored = None
+    if not isinstance(stored, dict):
+        logger.warning('Ignoring unreadable reservation {!r}'.format(data))
+        return None
+
+    reservation = {'ReservationType': stored.get('ReservationType')}
+    for field in RESERVATION_FIELDS.get(reservation['ReservationType'], ()):
+        value = stored.get(field)
+        if isinstance(value, dict):
+            value = value.get('value')
+            value = value.get('interpretedValue') if isinstance(value, dict) else None
+        reservation[field] = None if value is None else str(value)
+    return reservation
+
+
+# --- Booking backend ---
+
+
+class BookingError(Exception):
+    """
+    Raised when a reservation could not be placed with the booking backend
+    """
+
+
+def booking_deadline(context):
+    """
+    Returns the time.monotonic() by which a booking call must finish: BOOKING_BACKEND_TIMEOUT_MS
+    from now, or BOOKING_BACKEND_RESERVE_MS before the function times out if that is sooner.
+    """
+    timeout_ms = BOOKING_BACKEND_TIMEOUT_MS
+    if context is not None:
+        timeout_ms = min(timeout_ms, context.get_remaining_time_in_millis() - BOOKING_BACKEND_RESERVE_MS)
+    return time.monotonic() + timeout_ms / 1000.0
+
+
+def booking_idempotency_key(session_id, reservation):
+    """
+    Idempotency key of a booking: the session id and a digest of the encoded reservation, so that
+    retrying a fulfillment in the same session cannot book twice.
+    """
+    return '{}:{}'.format(session_id, hashlib.sha256(reservation.encode('utf-8')).hexdigest()[:16])
+
+
+class LoggingBookingBackend(object):
+    """
+    Stand-in for a booking backend which only logs the reservations
+    """
+
+    def book(self, reservation, idempotency_key, deadline):
+        logger.debug('book reservation={} key={}'.format(reservation, idempotency_key))
+        return None
+
+
+class HttpBookingBackend(object):
+    """
+    Books reservations by POSTing them as JSON to <base_url>/reservations with an Idempotency-Key
+    header, over a pool of keep-alive connections reused across warm invocations. Returns the
+    confirmationId of the JSON response, if any; a response which is not a JSON object raises
+    BookingError. Calls which fail to connect or get a 5xx status are retried with the same key
+    while the deadline allows.
+
+    Any object with the same book method can be assigned to booking_backend instead.
+    """
+
+    def __init__(self, base_url, max_connections=BOOKING_BACKEND_MAX_CONNECTIONS, retries=BOOKING_BACKEND_RETRIES):
+        if urllib3 is None:
+            raise RuntimeError('urllib3 is required to call a booking backend')
+        self.url = base_url.rstrip('/') + '/reservations'
+        self.retries = retries
+        self.pool = urllib3.PoolManager(num_pools=1, maxsize=max_connections, retries=False)
+
+    def book(self, reservation, idempotency_key, deadline):
+        body = json.dumps(reservation).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'Idempotency-Key': idempotency_key}
+        error = None
+        for attempt in range(self.retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                if error is None:
+                    raise BookingError('Not enough time left to call the booking backend')
+                raise BookingError('Deadline exceeded after {} attempts: {}'.format(attempt, error))
+            try:
+                response = self.pool.request('POST', self.url, body=body, headers=headers,
+                                             timeout=urllib3.Timeout(total=remaining))
+            except urllib3.exceptions.HTTPError as e:
+                error = e
+                continue
+            if response.status >= 500:
+                error = 'status {}'.format(response.status)
+                continue
+            if response.status >= 400:
+                raise BookingError('Reservation rejected with status {}: {}'.format(
+                    response.status, response.data.decode('utf-8', 'replace')))
+            try:
+                result = json.loads(response.data or b'{}')
+            except ValueError:
+                result = None
+            if not isinstance(result, dict):
+                raise BookingError('Unreadable response with status {}: {}'.format(
+                    response.status, response.data[:200].decode('utf-8', 'replace')))
+            return result.get('confirmationId')
+        raise BookingError('Booking failed after {} attempts: {}'.format(self.retries + 1, error))
+
+
+def load_booking_backend(url):
+    if url:
+        return HttpBookingBackend(url)
+    return LoggingBookingBackend()
+
+
+def book_reservation(intent_request, context, reservation):
+    """
+    Places an encoded reservation with the booking backend. Returns its confirmation id, or None.
+    """
+    return booking_backend.book(
+        decode_reservation(reservation),
+        booking_idempotency_key(intent_request['sessionId'], reservation),
+        booking_deadline(context)
+    )
+
+
+booking_backend = load_booking_backend(BOOKING_BACKEND_URL)
+
+
+# --- Dialog state machine ---
+
+
+# Emit an Embedded Metric Format record with the transition and its time on every turn
+DIALOG_METRICS = os.environ.get('DIALOG_METRICS', 'false').lower() == 'true'
+DIALOG_METRICS_NAMESPACE = os.environ.get('DIALOG_METRICS_NAMESPACE', 'LexV2Blueprints')
+
+
+class Transition(object):
+    """
+    What a turn does in a state on an event. quote prices the reservation before the action.
+    """
+    __slots__ = ('state', 'event', 'action', 'quote', 'name')
+
+    def __init__(self, state, event, action, quote):
+        self.state = state
+        self.event = event
+        self.action = action
+        self.quote = quote
+        self.name = '{}/{}/{}'.format(state, event, action.__name__)
+
+
+class TransitionStats(object):
+    """
+    Number of turns and time spent per transition, accumulated in the container
+    """
+
+    def __init__(self):
+        self.turns = {}
+        self.lock = threading.Lock()
+
+    def add(self, transition, seconds):
+        with self.lock:
+            stats = self.turns.get(transition.name)
+            if stats is None:
+                self.turns[transition.name] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = max(stats[2], seconds)
+
+    def snapshot(self):
+        """
+        Returns {transition: {count, total_ms, mean_ms, max_ms}}, busiest transitions first
+        """
+        with self.lock:
+            turns = sorted(self.turns.items(), key=lambda item: -item[1][1])
+        return {name: {'count': count, 'total_ms': total * 1000, 'mean_ms': total * 1000 / count, 'max_ms': longest * 1000}
+                for name, (count, total, longest) in turns}
+
+    def reset(self):
+        with self.lock:
+            self.turns = {}
+
+
+class DialogStateMachine(object):
+    """
+    Dialog flow of an intent as a table of (state, event) -> Transition. rows are (states, events,
+    action, quote) and are compiled into the table once; the first row matching a (state, event)
+    gives its transition, and every pair must have one. state_of and event_of classify a turn,
+    actions take the turn and return the response.
+    """
+
+    def __init__(self, intent_name, states, events, rows, state_of, event_of):
+        self.intent_name = intent_name
+        self.state_of = state_of
+        self.event_of = event_of
+        self.table = {}
+        for row_states, row_events, action, quote in rows:
+            for state in row_states:
+                for event in row_events:
+                    if (state, event) not in self.table:
+                        self.table[(state, event)] = Transition(state, event, action, quote)
+        missing = [(state, event) for state in states for event in events if (state, event) not in self.table]
+        if missing:
+            raise ValueError('No transition for {}'.format(missing))
+        self.stats = TransitionStats()
+
+    def handle(self, turn):
+        start = time.perf_counter()
+        state = self.state_of(turn)
+        transition = self.table[(state, self.event_of(state, turn))]
+        if transition.quote:
+            turn.quote()
+        response = transition.action(turn)
+        seconds = time.perf_counter() - start
+        self.stats.add(transition, seconds)
+        logger.debug('{} transition={} ms={:.3f}'.format(self.intent_name, transition.name, seconds * 1000))
+        if DIALOG_METRICS:
+            print(json.dumps({
+                '_aws': {
+                    'Timestamp': int(time.time() * 1000),
+                    'CloudWatchMetrics': [{
+                        'Namespace': DIALOG_METRICS_NAMESPACE,
+                        'Dimensions': [['Intent', 'Transition']],
+                        'Metrics': [{'Name': 'TransitionTime', 'Unit': 'Milliseconds'}]
+                    }]
+                },
+                'Intent': self.intent_name,
+                'Transition': transition.name,
+                'TransitionTime': round(seconds * 1000, 3)
+            }))
+        return response
+
+
 """ --- Functions that control the bot's behavior --- """
 
 
-def book_hotel(intent_request):
+def booking_failed(intent_request, session_attributes, error):
+    """
+    Closes the intent as failed when the booking backend could not place the reservation. The
+    current reservation is kept, so the user can try again.
+    """
+    logger.warning('Booking failed sessionId={}: {}'.format(intent_request['sessionId'], error))
+    return close(
+        session_attributes,
+        intent_request['sessionState']['intent']['name'],
+        'Failed',
+        {
+            'contentType': 'PlainText',
+            'content': 'Sorry, I was not able to place your reservation just now.  Please try again in a moment.'
+        }
+    )
+
+
+def book_hotel(intent_request, context=None):
     """
     Performs dialog management and fulfillment for booking a hotel.
 
@@ -299,56 +1037,79 @@ def book_hotel(intent_request):
     2) Use of sessionAttributes to pass information that can be used to guide conversation
     """
     slots = intent_request['sessionState']['intent']['slots']
-    location = try_ex(lambda: slots['Location'])
-    checkin_date = try_ex(lambda: slots['CheckInDate'])
-    nights = try_ex(lambda: slots['Nights'])
-    room_type = try_ex(lambda: slots['RoomType'])
+    values = book_hotel_slots(slots)
     session_attributes = intent_request['sessionState']['sessionAttributes'] if "sessionAttributes" in intent_request['sessionState'] else {}
 
     # Load confirmation history and track the current reservation.
-    reservation = json.dumps({
-        'ReservationType': 'Hotel',
-        'Location': location,
-        'RoomType': room_type,
-        'CheckInDate': checkin_date,
-        'Nights': nights
-    })
+    reservation = encode_reservation('Hotel', (values.location, values.checkin_date, values.nights, values.room_type))
 
     session_attributes['currentReservation'] = reservation
 
     if intent_request['invocationSource'] == 'DialogCodeHook':
+        # Answer to a suggested city: a denied suggestion is elicited again, a confirmed one is kept
+        # without confirming the intent itself.
+        suggestion_confirmed = False
+        if session_attributes.get('confirmationContext') == 'CitySuggestion':
+            session_attributes.pop('confirmationContext')
+            if intent_request['sessionState']['intent']['confirmationState'] == 'Denied':
+                slots['Location'] = None
+                return elicit_slot(
+                    session_attributes,
+                    intent_request['sessionState']['intent']['name'],
+                    slots,
+                    'Location',
+                    {'contentType': 'PlainText', 'content': 'What city will you be staying in?'}
+                )
+            suggestion_confirmed = True
+
         # Validate any slots which have been specified.  If any are invalid, re-elicit for their value
-        validation_result = validate_hotel(slots)
+        validation_result = validate_hotel(values)
         if not validation_result['isValid']:
-            slotsToOutput = slots
-            slotsToOutput[validation_result['violatedSlot']] = None
-
-            return elicit_slot(
-                session_attributes,
-                intent_request['sessionState']['intent']['name'],
-                slotsToOutput,
-                validation_result['violatedSlot'],
-                validation_result['message']
-            )
+            response = elicit_or_confirm_suggestion(intent_request, session_attributes, slots, validation_result)
+            return clear_confirmation(response) if suggestion_confirmed else response
 
         # Otherwise, let native DM rules determine how to elicit for slots and prompt for confirmation.  Pass price
         # back in sessionAttributes once it can be calculated; otherwise clear any setting from sessionAttributes.
-        if location and checkin_date and nights and room_type:
+        session_attributes['currentReservation'] = reservation
+        if values.location and values.checkin_date and values.nights and values.room_type:
             # The price of the hotel has yet to be confirmed.
-            price = generate_hotel_price(interpreted_value(location), interpreted_value(nights), interpreted_value(room_type))
-            session_attributes['currentReservationPrice'] = price
+            nights = safe_int(values.nights)
+            price, alternatives = hotel_quote(values.location, nights, values.room_type)
+            session_attributes['currentReservationPrice'] = str(price)
+            if suggestion_confirmed or intent_request['sessionState']['intent']['confirmationState'] == 'None':
+                # Confirm the stay with its price; the alternatives are shown in this prompt only
+                return confirm_intent(
+                    session_attributes,
+                    intent_request['sessionState']['intent']['name'],
+                    slots,
+                    {
+                        'contentType': 'PlainText',
+                        'content': quote_prompt(
+                            'A {} room in {} for {} from {}'.format(
+                                values.room_type, values.location, format_duration(nights, 'night'), values.checkin_date
+                            ),
+                            price, alternatives, values.room_type, 'room', nights, 'night'
+                        )
+                    }
+                )
         else:
-            try_ex(lambda: session_attributes.pop('currentReservationPrice'))
+            session_attributes.pop('currentReservationPrice', None)
 
-        session_attributes['currentReservation'] = reservation
-        return delegate(session_attributes, intent_request['sessionState']['intent']['name'], intent_request['sessionState']['intent']['slots'])
+        response = delegate(session_attributes, intent_request['sessionState']['intent']['name'], intent_request['sessionState']['intent']['slots'])
+        return clear_confirmation(response) if suggestion_confirmed else response
 
-    # Booking the hotel.  In a real application, this would likely involve a call to a backend service.
+    # Booking the hotel with the backend service.
     logger.debug('bookHotel under={}'.format(reservation))
+    try:
+        confirmation_id = book_reservation(intent_request, context, reservation)
+    except BookingError as e:
+        return booking_failed(intent_request, session_attributes, e)
 
-    try_ex(lambda: session_attributes.pop('currentReservationPrice'))
-    try_ex(lambda: session_attributes.pop('currentReservation'))
+    session_attributes.pop('currentReservationPrice', None)
+    session_attributes.pop('currentReservation', None)
     session_attributes['lastConfirmedReservation'] = reservation
+    if confirmation_id:
+        session_attributes['lastConfirmationId'] = confirmation_id
 
     return close(
         session_attributes,
@@ -362,154 +1123,260 @@ def book_hotel(intent_request):
     )
 
 
-def book_car(intent_request):
+BOOK_CAR_DIALOG_STATES = (
+    'Unconfirmed', 'AutoPopulateOffered',
+    'Denied', 'AutoPopulateDenied', 'SuggestionDenied',
+    'Confirmed', 'AutoPopulateConfirmed', 'SuggestionConfirmed'
+)
+BOOK_CAR_STATES = BOOK_CAR_DIALOG_STATES + ('Fulfillment',)
+BOOK_CAR_EVENTS = ('Invalid', 'Empty', 'MissingDriverAge', 'MissingCarType', 'Partial', 'Filled')
+
+
+class BookCarTurn(object):
     """
-    Performs dialog management and fulfillment for booking a car.
+    One BookCar turn: the request, its slot values and session attributes. The car is priced
+    only when a transition asks for the quote.
+    """
+    __slots__ = ('intent_request', 'context', 'intent_name', 'slots', 'values', 'session_attributes',
+                 'confirmation_context', 'reservation', 'validation_result', 'price', 'alternatives')
+
+    def __init__(self, intent_request, context):
+        self.intent_request = intent_request
+        self.context = context
+        self.intent_name = intent_request['sessionState']['intent']['name']
+        self.slots = intent_request['sessionState']['intent']['slots']
+        self.values = book_car_slots(self.slots)
+        self.session_attributes = intent_request['sessionState']['sessionAttributes'] if "sessionAttributes" in intent_request['sessionState'] else {}
+        self.confirmation_context = self.session_attributes.get('confirmationContext')
+        if self.confirmation_context == 'CitySuggestion':
+            # This turn answers the suggested city; a later confirmation is of the intent itself
+            self.session_attributes.pop('confirmationContext')
+        self.validation_result = None
+        self.price = None
+        self.alternatives = None
+
+        # Track the current reservation.
+        values = self.values
+        self.reservation = encode_reservation('Car', (values.pickup_city, values.pickup_date, values.return_date, values.car_type))
+        self.session_attributes['currentReservation'] = self.reservation
+
+    def is_filled(self):
+        values = self.values
+        return bool(values.pickup_city and values.pickup_date and values.return_date and values.driver_age and values.car_type)
+
+    def quote(self):
+        """
+        Prices the car and its alternatives once all the slots are filled. The price is passed back
+        in the session attributes; the alternatives are kept for this turn's prompt only.
+        """
+        if not self.is_filled():
+            return
+        values = self.values
+        number_of_days = get_day_difference(values.pickup_date, values.return_date)
+        self.price, self.alternatives = car_quote(values.pickup_city, number_of_days, safe_int(values.driver_age), values.car_type)
+        self.session_attributes['currentReservationPrice'] = str(self.price)
+
+
+def book_car_state(turn):
+    """
+    The state of the conversation: the confirmation state of the intent, and what was asked to be
+    confirmed, or fulfillment
+    """
+    if turn.intent_request['invocationSource'] != 'DialogCodeHook':
+        return 'Fulfillment'
+    confirmation_status = turn.intent_request['sessionState']['intent']['confirmationState']
+    if confirmation_status == 'Denied':
+        return {'AutoPopulate': 'AutoPopulateDenied', 'CitySuggestion': 'SuggestionDenied'}.get(turn.confirmation_context, 'Denied')
+    if confirmation_status == 'Confirmed':
+        return {'AutoPopulate': 'AutoPopulateConfirmed', 'CitySuggestion': 'SuggestionConfirmed'}.get(turn.confirmation_context, 'Confirmed')
+    return 'AutoPopulateOffered' if turn.confirmation_context == 'AutoPopulate' else 'Unconfirmed'
 
-    Beyond fulfillment, the implementation for this intent demonstrates the following:
-    1) Use of elicitSlot in slot validation and re-prompting
-    2) Use of sessionAttributes to pass information that can be used to guide conversation
+
+def book_car_event(state, turn):
     """
-    slots = intent_request['sessionState']['intent']['slots']
-    pickup_city = slots['PickUpCity']
-    pickup_date = slots['PickUpDate']
-    return_date = slots['ReturnDate']
-    driver_age = slots['DriverAge']
-    car_type = slots['CarType']
-    confirmation_status = intent_request['sessionState']['intent']['confirmationState']
-    session_attributes = intent_request['sessionState']['sessionAttributes'] if "sessionAttributes" in intent_request['sessionState'] else {}
-    last_confirmed_reservation = try_ex(lambda: session_attributes['lastConfirmedReservation'])
-    if last_confirmed_reservation:
-        last_confirmed_reservation = json.loads(last_confirmed_reservation)
-    confirmation_context = try_ex(lambda: session_attributes['confirmationContext'])
+    What the user gave this turn: slots which are invalid, or how far the slots are filled
+    """
+    values = turn.values
+    if state != 'Fulfillment':
+        # Validate any slots which have been specified.
+        turn.validation_result = validate_book_car(values)
+        if not turn.validation_result['isValid']:
+            return 'Invalid'
+    if not (values.pickup_city or values.pickup_date or values.return_date or values.driver_age or values.car_type):
+        return 'Empty'
+    if not values.driver_age:
+        return 'MissingDriverAge'
+    if not values.car_type:
+        return 'MissingCarType'
+    return 'Filled' if turn.is_filled() else 'Partial'
+
+
+def book_car_reject_invalid_slot(turn):
+    # Re-elicit the invalid slot, or confirm the suggested value
+    response = elicit_or_confirm_suggestion(turn.intent_request, turn.session_attributes, turn.slots, turn.validation_result)
+    # A confirmed suggestion does not confirm the intent itself
+    return clear_confirmation(response) if turn.confirmation_context == 'CitySuggestion' else response
+
+
+def book_car_delegate(turn):
+    # Let native DM rules determine how to elicit for slots and/or drive confirmation.
+    return delegate(turn.session_attributes, turn.intent_name, turn.slots)
+
+
+def book_car_confirm_quote(turn):
+    # Confirm the rental with its price, and the alternatives the quote priced with it.
+    values = turn.values
+    number_of_days = get_day_difference(values.pickup_date, values.return_date)
+    return confirm_intent(
+        turn.session_attributes,
+        turn.intent_name,
+        turn.slots,
+        {
+            'contentType': 'PlainText',
+            'content': quote_prompt(
+                'A {} car in {} from {} to {}'.format(values.car_type, values.pickup_city, values.pickup_date, values.return_date),
+                turn.price, turn.alternatives, values.car_type, 'car', number_of_days, 'day'
+            )
+        }
+    )
 
-    # Load confirmation history and track the current reservation.
-    reservation = json.dumps({
-        'ReservationType': 'Car',
-        'PickUpCity': pickup_city,
-        'PickUpDate': pickup_date,
-        'ReturnDate': return_date,
-        'CarType': car_type
-    })
-    session_attributes['currentReservation'] = reservation
 
-    if pickup_city and pickup_date and return_date and driver_age and car_type:
-        # Generate the price of the car in case it is necessary for future steps.
-        number_of_days = get_day_difference(interpreted_value(pickup_date), interpreted_value(return_date))
-        price = generate_car_price(interpreted_value(pickup_city), number_of_days, interpreted_value(driver_age), interpreted_value(car_type))
-        session_attributes['currentReservationPrice'] = price
+def book_car_clear_denied(turn):
+    # Clear out auto-population flag for subsequent turns.
+    turn.session_attributes.pop('confirmationContext', None)
+    turn.session_attributes.pop('currentReservation', None)
 
-    if intent_request['invocationSource'] == 'DialogCodeHook':
-        # Validate any slots which have been specified.  If any are invalid, re-elicit for their value
-        validation_result = validate_book_car(slots)
-        if not validation_result['isValid']:
-            slots[validation_result['violatedSlot']] = None
-            return elicit_slot(
-                session_attributes,
-                intent_request['sessionState']['intent']['name'],
-                slots,
-                validation_result['violatedSlot'],
-                validation_result['message']
+
+def book_car_delegate_denied(turn):
+    book_car_clear_denied(turn)
+    return delegate(turn.session_attributes, turn.intent_name, turn.slots)
+
+
+def book_car_elicit_city(turn):
+    # The suggested city was denied; ask for the city again.
+    turn.session_attributes.pop('currentReservation', None)
+    turn.slots['PickUpCity'] = None
+    return elicit_slot(
+        turn.session_attributes,
+        turn.intent_name,
+        turn.slots,
+        'PickUpCity',
+        {
+            'contentType': 'PlainText',
+            'content': 'In what city do you need to rent a car?'
+        }
+    )
+
+
+def book_car_restart(turn):
+    # The auto-populated reservation was denied; start over.
+    book_car_clear_denied(turn)
+    return elicit_slot(
+        turn.session_attributes,
+        turn.intent_name,
+        {
+            'PickUpCity': None,
+            'PickUpDate': None,
+            'ReturnDate': None,
+            'DriverAge': None,
+            'CarType': None
+        },
+        'PickUpCity',
+        {
+            'contentType': 'PlainText',
+            'content': 'Where would you like to make your car reservation?'
+        }
+    )
+
+
+def book_car_offer_auto_populate(turn):
+    # If the user's previous reservation was a hotel - prompt for a rental with auto-populated
+    # values to match this reservation, until it is confirmed or denied.
+    last_confirmed_reservation = decode_reservation(turn.session_attributes.get('lastConfirmedReservation'))
+    if not last_confirmed_reservation or last_confirmed_reservation.get('ReservationType') != 'Hotel':
+        return book_car_delegate(turn)
+
+    turn.session_attributes['confirmationContext'] = 'AutoPopulate'
+    return confirm_intent(
+        turn.session_attributes,
+        turn.intent_name,
+        {
+            'PickUpCity': build_slot_value(last_confirmed_reservation['Location']),
+            'PickUpDate': build_slot_value(last_confirmed_reservation['CheckInDate']),
+            'ReturnDate': build_slot_value(add_days(
+                last_confirmed_reservation['CheckInDate'], safe_int(last_confirmed_reservation['Nights'])
+            )),
+            'CarType': None,
+            'DriverAge': None
+        },
+        {
+            'contentType': 'PlainText',
+            'content': 'Is this car rental for your {} night stay in {} on {}?'.format(
+                last_confirmed_reservation['Nights'],
+                last_confirmed_reservation['Location'],
+                last_confirmed_reservation['CheckInDate']
             )
+        }
+    )
 
-        # Determine if the intent (and current slot settings) has been denied.  The messaging will be different
-        # if the user is denying a reservation he initiated or an auto-populated suggestion.
-        if confirmation_status == 'Denied':
-            # Clear out auto-population flag for subsequent turns.
-            try_ex(lambda: session_attributes.pop('confirmationContext'))
-            try_ex(lambda: session_attributes.pop('currentReservation'))
-            if confirmation_context == 'AutoPopulate':
-                return elicit_slot(
-                    session_attributes,
-                    intent_request['sessionState']['intent']['name'],
-                    {
-                        'PickUpCity': None,
-                        'PickUpDate': None,
-                        'ReturnDate': None,
-                        'DriverAge': None,
-                        'CarType': None
-                    },
-                    'PickUpCity',
-                    {
-                        'contentType': 'PlainText',
-                        'content': 'Where would you like to make your car reservation?'
-                    }
-                )
 
-            return delegate(session_attributes, intent_request['sessionState']['intent']['name'], intent_request['sessionState']['intent']['slots'])
-
-        if confirmation_status == 'None':
-            # If we are currently auto-populating but have not gotten confirmation, keep requesting for confirmation.
-            if (not pickup_city and not pickup_date and not return_date and not driver_age and not car_type)\
-                    or confirmation_context == 'AutoPopulate':
-                if last_confirmed_reservation and try_ex(lambda: last_confirmed_reservation['ReservationType']) == 'Hotel':
-                    # If the user's previous reservation was a hotel - prompt for a rental with
-                    # auto-populated values to match this reservation.
-                    session_attributes['confirmationContext'] = 'AutoPopulate'
-                    return confirm_intent(
-                        session_attributes,
-                        intent_request['sessionState']['intent']['name'],
-                        {
-                            'PickUpCity': last_confirmed_reservation['Location'],
-                            'PickUpDate': last_confirmed_reservation['CheckInDate'],
-                            'ReturnDate': add_days(
-                                last_confirmed_reservation['CheckInDate'], last_confirmed_reservation['Nights']
-                            ),
-                            'CarType': None,
-                            'DriverAge': None
-                        },
-                        {
-                            'contentType': 'PlainText',
-                            'content': 'Is this car rental for your {} night stay in {} on {}?'.format(
-                                last_confirmed_reservation['Nights'],
-                                last_confirmed_reservation['Location'],
-                                last_confirmed_reservation['CheckInDate']
-                            )
-                        }
-                    )
-
-            # Otherwise, let native DM rules determine how to elicit for slots and/or drive confirmation.
-            return delegate(session_attributes, intent_request['sessionState']['intent']['name'], intent_request['sessionState']['intent']['slots'])
-
-        # If confirmation has occurred, continue filling any unfilled slot values or pass to fulfillment.
-        if confirmation_status == 'Confirmed':
-            # Remove confirmationContext from sessionAttributes so it does not confuse future requests
-            try_ex(lambda: session_attributes.pop('confirmationContext'))
-            if confirmation_context == 'AutoPopulate':
-                if not driver_age:
-                    return elicit_slot(
-                        session_attributes,
-                        intent_request['sessionState']['intent']['name'],
-                        intent_request['sessionState']['intent']['slots'],
-                        'DriverAge',
-                        {
-                            'contentType': 'PlainText',
-                            'content': 'How old is the driver of this car rental?'
-                        }
-                    )
-                elif not car_type:
-                    return elicit_slot(
-                        session_attributes,
-                        intent_request['sessionState']['intent']['name'],
-                        intent_request['sessionState']['intent']['slots'],
-                        'CarType',
-                        {
-                            'contentType': 'PlainText',
-                            'content': 'What type of car would you like? Popular models are '
-                                       'economy, midsize, and luxury.'
-                        }
-                    )
-
-            return delegate(session_attributes, intent_request['sessionState']['intent']['name'], intent_request['sessionState']['intent']['slots'])
-
-    # Booking the car.  In a real application, this would likely involve a call to a backend service.
-    logger.debug('bookCar at={}'.format(reservation))
-    del session_attributes['currentReservationPrice']
+def book_car_delegate_confirmed(turn):
+    # Remove confirmationContext from sessionAttributes so it does not confuse future requests
+    turn.session_attributes.pop('confirmationContext', None)
+    return delegate(turn.session_attributes, turn.intent_name, turn.slots)
+
+
+def book_car_elicit_driver_age(turn):
+    turn.session_attributes.pop('confirmationContext', None)
+    return elicit_slot(
+        turn.session_attributes,
+        turn.intent_name,
+        turn.slots,
+        'DriverAge',
+        {
+            'contentType': 'PlainText',
+            'content': 'How old is the driver of this car rental?'
+        }
+    )
+
+
+def book_car_elicit_car_type(turn):
+    turn.session_attributes.pop('confirmationContext', None)
+    return elicit_slot(
+        turn.session_attributes,
+        turn.intent_name,
+        turn.slots,
+        'CarType',
+        {
+            'contentType': 'PlainText',
+            'content': 'What type of car would you like? Popular models are '
+                       'economy, midsize, and luxury.'
+        }
+    )
+
+
+def book_car_delegate_suggestion_confirmed(turn):
+    # The suggested city was confirmed, not the intent itself
+    return clear_confirmation(delegate(turn.session_attributes, turn.intent_name, turn.slots))
+
+
+def book_car_fulfill(turn):
+    # Booking the car with the backend service.
+    session_attributes = turn.session_attributes
+    logger.debug('bookCar at={}'.format(turn.reservation))
+    try:
+        confirmation_id = book_reservation(turn.intent_request, turn.context, turn.reservation)
+    except BookingError as e:
+        return booking_failed(turn.intent_request, session_attributes, e)
+
+    session_attributes.pop('currentReservationPrice', None)
     del session_attributes['currentReservation']
-    session_attributes['lastConfirmedReservation'] = reservation
+    session_attributes['lastConfirmedReservation'] = turn.reservation
+    if confirmation_id:
+        session_attributes['lastConfirmationId'] = confirmation_id
     return close(
         session_attributes,
-        intent_request['sessionState']['intent']['name'],
+        turn.intent_name,
         'Fulfilled',
         {
             'contentType': 'PlainText',
@@ -518,10 +1385,46 @@ def book_car(intent_request):
     )
 
 
+# (states, events, action, quote): the first row matching a (state, event) gives its transition.
+# quote prices a filled reservation before the action, for the prompts which show the price.
+BOOK_CAR_TRANSITIONS = (
+    (('Fulfillment',), BOOK_CAR_EVENTS, book_car_fulfill, False),
+    (('SuggestionDenied',), BOOK_CAR_EVENTS, book_car_elicit_city, False),
+    (BOOK_CAR_DIALOG_STATES, ('Invalid',), book_car_reject_invalid_slot, False),
+    (('Denied',), BOOK_CAR_EVENTS, book_car_delegate_denied, False),
+    (('AutoPopulateDenied',), BOOK_CAR_EVENTS, book_car_restart, False),
+    (('Unconfirmed',), ('Empty',), book_car_offer_auto_populate, False),
+    (('Unconfirmed', 'SuggestionConfirmed'), ('Filled',), book_car_confirm_quote, True),
+    (('Unconfirmed',), BOOK_CAR_EVENTS, book_car_delegate, False),
+    (('AutoPopulateOffered',), BOOK_CAR_EVENTS, book_car_offer_auto_populate, True),
+    (('AutoPopulateConfirmed',), ('Empty', 'MissingDriverAge'), book_car_elicit_driver_age, False),
+    (('AutoPopulateConfirmed',), ('MissingCarType',), book_car_elicit_car_type, False),
+    (('Confirmed', 'AutoPopulateConfirmed'), BOOK_CAR_EVENTS, book_car_delegate_confirmed, True),
+    (('SuggestionConfirmed',), BOOK_CAR_EVENTS, book_car_delegate_suggestion_confirmed, False),
+)
+
+book_car_flow = DialogStateMachine('BookCar', BOOK_CAR_STATES, BOOK_CAR_EVENTS, BOOK_CAR_TRANSITIONS,
+                                   book_car_state, book_car_event)
+
+
+def book_car(intent_request, context=None):
+    """
+    Performs dialog management and fulfillment for booking a car.
+
+    Beyond fulfillment, the implementation for this intent demonstrates the following:
+    1) Use of elicitSlot in slot validation and re-prompting
+    2) Use of sessionAttributes to pass information that can be used to guide conversation
+
+    The flow is the BOOK_CAR_TRANSITIONS table; book_car_flow.stats has the turns and time spent
+    per transition.
+    """
+    return book_car_flow.handle(BookCarTurn(intent_request, context))
+
+
 # --- Intents ---
 
 
-def dispatch(intent_request):
+def dispatch(intent_request, context=None):
     """
     Called when the user specifies an intent for this bot.
     """
@@ -532,9 +1435,9 @@ def dispatch(intent_request):
 
     # Dispatch to your bot's intent handlers
     if intent_name == 'BookHotel':
-        return book_hotel(intent_request)
+        return book_hotel(intent_request, context)
     elif intent_name == 'BookCar':
-        return book_car(intent_request)
+        return book_car(intent_request, context)
 
     raise Exception('Intent with name ' + intent_name + ' not supported')
 
@@ -547,9 +1450,10 @@ def lambda_handler(event, context):
     Route the incoming request based on intent.
     The JSON body of the request is provided in the event slot.
     """
-    # By default, treat the user request as coming from the America/New_York time zone.
-    os.environ['TZ'] = 'America/New_York'
-    time.tzset()
-    logger.debug('event.bot.name={}'.format(event['bot']['name']))
-
-    return dispatch(event)
+    # Dates are checked in the time zone of the user making the request
+    token = request_clock.set(RequestClock(resolve_time_zone(event)))
+    try:
+        logger.debug('event.bot.name={}'.format(event['bot']['name']))
+        return dispatch(event, context)
+    finally:
+        request_clock.reset(token)
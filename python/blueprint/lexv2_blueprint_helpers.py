@@ -0,0 +1,172 @@
+"""
+Helpers shared by the blueprint bots. Package this file next to the bot's Lambda file, e.g.
+lexv2-book-trip.py, and the bot imports what it uses:
+
+    from lexv2_blueprint_helpers import compile_slot_extractor, parse_date
+"""
+
+import os
+import contextvars
+import datetime
+import functools
+import zoneinfo
+import dateutil.parser
+
+
+""" --- Date parsing --- """
+
+
+# Parsed ISO 8601 date slot values are kept across warm invocations, up to this many distinct values
+DATE_CACHE_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_iso_date(date):
+    """
+    Parses an ISO 8601 date, raising ValueError for any other format. Only these are cached: an
+    ISO date names the same day whenever it is parsed, while dateutil reads a value such as
+    'March 3' relative to the day it is parsed.
+    """
+    return datetime.date.fromisoformat(date)
+
+
+def parse_date(date):
+    """
+    Parses a date slot value into a datetime.date, or None if it is not a date.
+    Lex resolves dates to ISO 8601, which takes the cached fast path; other formats go through dateutil.
+    """
+    try:
+        return parse_iso_date(date)
+    except ValueError:
+        pass
+    try:
+        return dateutil.parser.parse(date).date()
+    except (ValueError, OverflowError):
+        return None
+
+
+""" --- Slot extraction --- """
+
+
+class SlotValues(object):
+    """
+    Values of an intent's slots, one attribute per field, None where the slot has no value.
+    The record types are created by compile_slot_extractor.
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__))
+
+
+def compile_slot_extractor(record_name, fields):
+    """
+    Compiles an intent's slot schema into a function which reads all of its slots in one pass.
+    fields is a sequence of (attribute, slot name) pairs, or (attribute, slot name, key) to read
+    another key of the slot value than interpretedValue, e.g. resolvedValues. The function takes
+    the intent's slots and returns a record of the values, with the fields as attributes.
+    """
+    fields = [tuple(field) if len(field) == 3 else tuple(field) + ('interpretedValue',) for field in fields]
+    for attribute, _, _ in fields:
+        if not attribute.isidentifier():
+            raise ValueError('Invalid slot attribute name: {}'.format(attribute))
+    record_type = type(record_name, (SlotValues,), {'__slots__': tuple(attribute for attribute, _, _ in fields)})
+
+    lines = ['def extract(slots):', '    values = new(record_type)', '    get = slots.get']
+    for attribute, slot_name, key in fields:
+        lines.append('    slot = get({!r})'.format(slot_name))
+        lines.append('    values.{} = slot["value"][{!r}] if slot else None'.format(attribute, key))
+    lines.append('    return values')
+    namespace = {'new': object.__new__, 'record_type': record_type}
+    exec('\n'.join(lines), namespace)
+
+    extract = namespace['extract']
+    extract.record_type = record_type
+    return extract
+
+
+""" --- Time zone --- """
+
+
+# Time zone of the user, when the timeZone session attribute does not name one: the zone of the
+# bot locale, or DEFAULT_TIME_ZONE
+DEFAULT_TIME_ZONE = os.environ.get('DEFAULT_TIME_ZONE', 'America/New_York')
+TIME_ZONE_SESSION_ATTRIBUTE = 'timeZone'
+LOCALE_TIME_ZONES = {
+    'de_AT': 'Europe/Vienna',
+    'de_DE': 'Europe/Berlin',
+    'en_AU': 'Australia/Sydney',
+    'en_GB': 'Europe/London',
+    'en_IE': 'Europe/Dublin',
+    'en_IN': 'Asia/Kolkata',
+    'en_NZ': 'Pacific/Auckland',
+    'en_US': 'America/New_York',
+    'en_ZA': 'Africa/Johannesburg',
+    'es_ES': 'Europe/Madrid',
+    'es_US': 'America/New_York',
+    'fr_CA': 'America/Toronto',
+    'fr_FR': 'Europe/Paris',
+    'it_IT': 'Europe/Rome',
+    'ja_JP': 'Asia/Tokyo',
+    'ko_KR': 'Asia/Seoul',
+    'pt_BR': 'America/Sao_Paulo',
+    'pt_PT': 'Europe/Lisbon',
+    'zh_CN': 'Asia/Shanghai',
+}
+
+
+@functools.lru_cache(maxsize=64)
+def get_time_zone(name):
+    """
+    Returns the ZoneInfo for a time zone name, or None if there is no such zone
+    """
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def resolve_time_zone(intent_request):
+    """
+    Time zone of the user making a request: the one named by the timeZone session attribute, else
+    the one of the bot locale, else DEFAULT_TIME_ZONE
+    """
+    session_attributes = intent_request.get('sessionState', {}).get('sessionAttributes') or {}
+    for name in (session_attributes.get(TIME_ZONE_SESSION_ATTRIBUTE),
+                 LOCALE_TIME_ZONES.get(intent_request.get('bot', {}).get('localeId'))):
+        time_zone = get_time_zone(name) if name else None
+        if time_zone is not None:
+            return time_zone
+    return get_time_zone(DEFAULT_TIME_ZONE)
+
+
+class RequestClock(object):
+    """
+    Current date and time in the time zone of one request
+    """
+    __slots__ = ('time_zone',)
+
+    def __init__(self, time_zone):
+        self.time_zone = time_zone
+
+    def now(self):
+        return datetime.datetime.now(self.time_zone)
+
+    def today(self):
+        return self.now().date()
+
+
+# Clock of the request being handled, set by lambda_handler for the duration of the request. Each
+# thread has its own context, so requests handled concurrently each see their own clock.
+request_clock = contextvars.ContextVar('request_clock')
+
+
+def today():
+    """
+    Today's date for the user making the current request
+    """
+    clock = request_clock.get(None)
+    if clock is None:
+        clock = RequestClock(get_time_zone(DEFAULT_TIME_ZONE))
+    return clock.today()
@@ -9,14 +9,16 @@
 """
 
 import json
-import dateutil.parser
 import datetime
-import time
 import os
 import math
 import random
 import logging
 
+# Shared by the blueprint bots; package lexv2_blueprint_helpers.py next to this file
+from lexv2_blueprint_helpers import (RequestClock, compile_slot_extractor, parse_date, request_clock,
+                                     resolve_time_zone, today)
+
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
@@ -132,40 +134,155 @@ def build_slot_value(interpreted_value):
     }    
 
 
-""" --- Helper Functions --- """
+""" --- Availability engine --- """
 
 
-def parse_int(n):
-    try:
-        return int(n)
-    except ValueError:
-        return float('nan')
+# A day's availability is a bitmask of its half-hour slots: bit i is set when the half hour starting
+# i * SLOT_MINUTES after midnight is free. Appointments start during business hours.
+SLOT_MINUTES = 30
+DAY_SLOTS = 24 * 60 // SLOT_MINUTES
+OPENING_SLOT = 10 * 60 // SLOT_MINUTES
+CLOSING_SLOT = 17 * 60 // SLOT_MINUTES
+BUSINESS_HOURS_MASK = ((1 << (CLOSING_SLOT - OPENING_SLOT)) - 1) << OPENING_SLOT
+
+# Time at which each slot starts, as in availabilities, e.g. '10:00' or '16:30'
+SLOT_TIMES = tuple('{}:{:02d}'.format(i * SLOT_MINUTES // 60, i * SLOT_MINUTES % 60) for i in range(DAY_SLOTS))
+# Slot starting at each time, zero padded or not
+TIME_SLOTS = dict(
+    [(time, i) for i, time in enumerate(SLOT_TIMES)] +
+    [('{:02d}:{:02d}'.format(i * SLOT_MINUTES // 60, i * SLOT_MINUTES % 60), i) for i in range(DAY_SLOTS)]
+)
+TIME_BITS = {time: 1 << slot for time, slot in TIME_SLOTS.items()}
+# Bytes of a day in a calendar bitmask
+DAY_BYTES = DAY_SLOTS // 8
+
+# When a date has no availability, the earliest NEXT_AVAILABLE_LIMIT times over the next
+# NEXT_AVAILABLE_DAYS days are offered instead
+NEXT_AVAILABLE_DAYS = int(os.environ.get('NEXT_AVAILABLE_DAYS', '30'))
+NEXT_AVAILABLE_LIMIT = 5
+
+
+def duration_slots(duration):
+    """
+    Number of slots taken by an appointment of duration minutes
+    """
+    if duration and duration > 0 and duration % SLOT_MINUTES == 0:
+        return duration // SLOT_MINUTES
+
+    # Invalid duration ; throw error.  We should not have reached this due to earlier validation.
+    raise Exception('Was not able to understand duration {}'.format(duration))
+
+
+def availability_mask(availabilities):
+    """
+    Bitmask of a list of free half hours given as HH:MM times. Times not starting a slot are ignored.
+    """
+    mask = 0
+    get = TIME_BITS.get
+    for appointment_time in availabilities:
+        mask |= get(appointment_time, 0)
+    return mask
 
 
-def try_ex(func):
+def mask_times(mask):
+    """
+    Times of the slots set in a bitmask, in order
     """
-    Call passed in function in try block. If KeyError is encountered return None.
-    This function is intended to be used to safely access dictionary.
+    times = []
+    while mask:
+        lowest = mask & -mask
+        times.append(SLOT_TIMES[lowest.bit_length() - 1])
+        mask ^= lowest
+    return times
+
 
-    Note that this function would have negative impact on performance.
+def window_mask(slot, slots):
     """
+    Bitmask of slots consecutive slots from slot
+    """
+    return ((1 << slots) - 1) << slot
 
-    try:
-        return func()
-    except KeyError:
-        return None
 
-def interpreted_value(slot):
+def window_starts(mask, slots):
     """
-    Retrieves interprated value from slot object
+    Bitmask of the slots which start slots consecutive free slots of mask. The window is widened
+    by doubling, so this takes about log2(slots) shifts and ANDs.
     """
-    if slot is not None:
-        return slot["value"]["interpretedValue"]
-    return slot  
+    starts = mask
+    width = 1
+    while width < slots:
+        step = min(width, slots - width)
+        starts &= starts >> step
+        width += step
+    return starts
+
+
+def fits(mask, slot, slots):
+    """
+    Whether slots consecutive slots from slot are free in mask
+    """
+    window = window_mask(slot, slots)
+    return mask & window == window
+
+
+def is_free(mask, appointment_time, duration):
+    """
+    Whether an appointment of duration minutes can start at an HH:MM time in a day's availability bitmask
+    """
+    slots = duration_slots(duration)
+    slot = TIME_SLOTS.get(appointment_time)
+    return slot is not None and fits(mask, slot, slots)
+
+
+def free_windows(mask, duration):
+    """
+    Times at which an appointment of duration minutes can start in a day's availability bitmask
+    """
+    return mask_times(window_starts(mask, duration_slots(duration)) & BUSINESS_HOURS_MASK)
+
+
+def calendar_mask(day_masks):
+    """
+    Days x slots availability matrix packed into one bitmask, a day after the other: bit
+    day * DAY_SLOTS + slot is the slot of that day
+    """
+    return int.from_bytes(b''.join(mask.to_bytes(DAY_BYTES, 'little') for mask in day_masks), 'little')
+
+
+def calendar_windows(calendar, days, duration):
+    """
+    Bitmask of the slots of a calendar at which an appointment of duration minutes can start:
+    during business hours, and ending the same day. All days are searched in one pass.
+    """
+    slots = duration_slots(duration)
+    day_starts = BUSINESS_HOURS_MASK & ((1 << max(DAY_SLOTS - slots + 1, 0)) - 1)
+    return window_starts(calendar, slots) & calendar_mask([day_starts] * days)
+
+
+def earliest_slots(mask, limit):
+    """
+    (day, slot) of the first limit slots set in a calendar bitmask
+    """
+    found = []
+    while mask and len(found) < limit:
+        lowest = mask & -mask
+        found.append(divmod(lowest.bit_length() - 1, DAY_SLOTS))
+        mask ^= lowest
+    return found
+
+
+""" --- Helper Functions --- """
+
+
+def parse_int(n):
+    try:
+        return int(n)
+    except ValueError:
+        return float('nan')
+
 
 def increment_time_by_thirty_mins(appointment_time):
-    hour, minute = list(map(int, appointment_time.split(':')))
-    return '{}:00'.format(hour + 1) if minute == 30 else '{}:30'.format(hour)
+    return SLOT_TIMES[(TIME_SLOTS[appointment_time] + 1) % DAY_SLOTS]
 
 
 def get_random_int(minimum, maximum):
@@ -189,7 +306,7 @@ def get_availabilities(date):
     On Mondays, availability is randomized; otherwise there is no availability on Tuesday / Thursday and availability at
     10:00 - 10:30 and 4:00 - 5:00 on Wednesday / Friday.
     """
-    day_of_week = dateutil.parser.parse(date).weekday()
+    day_of_week = parse_date(date).weekday()
     availabilities = []
     available_probability = 0.3
     if day_of_week == 0:
@@ -216,49 +333,64 @@ def get_availabilities(date):
 
 
 def isvalid_date(date):
-    try:
-        dateutil.parser.parse(date)
-        return True
-    except ValueError:
-        return False
+    return parse_date(date) is not None
 
 
 def is_available(appointment_time, duration, availabilities):
     """
     Helper function to check if the given time and duration fits within a known set of availability windows.
-    Duration is assumed to be one of 30, 60 (meaning minutes).  Availabilities is expected to contain entries of the format HH:MM.
+    Duration is in minutes, a multiple of 30.  Availabilities is expected to contain entries of the format HH:MM.
     """
-    if duration == 30:
-        return interpreted_value(appointment_time) in availabilities
-    elif duration == 60:
-        second_half_hour_time = increment_time_by_thirty_mins(interpreted_value(appointment_time))
-        return interpreted_value(appointment_time) in availabilities and second_half_hour_time in availabilities
-
-    # Invalid duration ; throw error.  We should not have reached this branch due to earlier validation.
-    raise Exception('Was not able to understand duration {}'.format(duration))
+    return is_free(availability_mask(availabilities), appointment_time, duration)
 
 
 def get_duration(appointment_type):
     appointment_duration_map = {'cleaning': 30, 'root canal': 60, 'whitening': 30}
-    return try_ex(lambda: appointment_duration_map[interpreted_value(appointment_type).lower()])
+    return appointment_duration_map.get(appointment_type.lower())
 
 
 def get_availabilities_for_duration(duration, availabilities):
     """
     Helper function to return the windows of availability of the given duration, when provided a set of 30 minute windows.
     """
-    duration_availabilities = []
-    start_time = '10:00'
-    while start_time != '17:00':
-        if start_time in availabilities:
-            if duration == 30:
-                duration_availabilities.append(start_time)
-            elif increment_time_by_thirty_mins(start_time) in availabilities:
-                duration_availabilities.append(start_time)
+    return free_windows(availability_mask(availabilities), duration)
+
 
-        start_time = increment_time_by_thirty_mins(start_time)
+def remove_availability(appointment_time, duration, availabilities):
+    """
+    Helper function to return the 30 minute windows left once an appointment of the given duration is booked.
+    """
+    mask = availability_mask(availabilities)
+    slot = TIME_SLOTS.get(appointment_time)
+    if slot is not None:
+        mask &= ~window_mask(slot, duration_slots(duration))
+    return mask_times(mask)
+
+
+def next_available(start_date, days, duration, booking_map, limit=NEXT_AVAILABLE_LIMIT):
+    """
+    Helper function to return the earliest (date, time) at which an appointment of the given duration can start, up to
+    limit of them, over the given number of days from start_date.  Availabilities already in booking_map are used as is;
+    the availabilities of the dates returned are added to it, so that they stay the same when one is picked.
 
-    return duration_availabilities
+    The days are searched as calendar bitmasks, the first week in one pass, then twice as many days in each pass until
+    enough availabilities are found.
+    """
+    found = []
+    first_day = 0
+    pass_days = 7
+    while first_day < days and len(found) < limit:
+        pass_days = min(pass_days, days - first_day)
+        dates = [(start_date + datetime.timedelta(days=day)).isoformat() for day in range(first_day, first_day + pass_days)]
+        day_availabilities = [booking_map[date] if date in booking_map else get_availabilities(date) for date in dates]
+        calendar = calendar_mask([availability_mask(availabilities) for availabilities in day_availabilities])
+
+        for day, slot in earliest_slots(calendar_windows(calendar, pass_days, duration), limit - len(found)):
+            booking_map[dates[day]] = day_availabilities[day]
+            found.append((dates[day], SLOT_TIMES[slot]))
+        first_day += pass_days
+        pass_days *= 2
+    return found
 
 
 def build_validation_result(is_valid, violated_slot, message_content):
@@ -269,17 +401,20 @@ def build_validation_result(is_valid, violated_slot, message_content):
     }
 
 
-def validate_book_appointment(appointment_type, date, appointment_time):
-    if appointment_type and not get_duration(appointment_type):
+def validate_book_appointment(values):
+    """
+    Validates the MakeAppointment slot values read by make_appointment_slots
+    """
+    if values.appointment_type and not get_duration(values.appointment_type):
         return build_validation_result(False, 'AppointmentType', 'I did not recognize that, can I book you a root canal, cleaning, or whitening?')
 
-    if appointment_time:
-        if len(appointment_time["value"]["resolvedValues"]) != 1:
+    if values.time:
+        if len(values.time_resolutions) != 1:
             return build_validation_result(False, 'Time', 'I did not understand that, what time would you like to book your appointment? Please specify AM or PM')
-        if len(interpreted_value(appointment_time)) != 5:
+        if len(values.time) != 5:
             return build_validation_result(False, 'Time', 'I did not recognize that, what time would you like to book your appointment?')
 
-        hour, minute = interpreted_value(appointment_time).split(':')
+        hour, minute = values.time.split(':')
         hour = parse_int(hour)
         minute = parse_int(minute)
         if math.isnan(hour) or math.isnan(minute):
@@ -293,13 +428,13 @@ def validate_book_appointment(appointment_type, date, appointment_time):
             # Must be booked on the hour or half hour
             return build_validation_result(False, 'Time', 'We schedule appointments every half hour, what time works best for you?')
 
-    if date:
-        interpreted_date = interpreted_value(date)
-        if not isvalid_date(interpreted_date):
+    if values.date:
+        appointment_day = parse_date(values.date)
+        if appointment_day is None:
             return build_validation_result(False, 'Date', 'I did not understand that, what date works best for you?')
-        elif datetime.datetime.strptime(interpreted_date, '%Y-%m-%d').date() <= datetime.date.today():
+        elif appointment_day <= today():
             return build_validation_result(False, 'Date', 'Appointments must be scheduled a day in advance.  Can you try a different date?')
-        elif dateutil.parser.parse(interpreted_date).weekday() == 5 or dateutil.parser.parse(interpreted_date).weekday() == 6:
+        elif appointment_day.weekday() == 5 or appointment_day.weekday() == 6:
             return build_validation_result(False, 'Date', 'Our office is not open on the weekends, can you provide a work day?')
 
     return build_validation_result(True, None, None)
@@ -332,6 +467,34 @@ def build_available_time_string(availabilities):
     return '{}, {} and {}'.format(prefix, build_time_output_string(availabilities[1]), build_time_output_string(availabilities[2]))
 
 
+def build_date_output_string(date):
+    return parse_date(date).strftime('%A, %B %d')
+
+
+def build_next_available_string(next_availabilities):
+    """
+    Build a string offering the earliest availabilities on the following days.
+    """
+    times = ['{} on {}'.format(build_time_output_string(appointment_time), build_date_output_string(date))
+             for date, appointment_time in next_availabilities]
+    if len(times) == 1:
+        return 'Our next availability is {}'.format(times[0])
+    return 'Our next availabilities are {} and {}'.format(', '.join(times[:-1]), times[-1])
+
+
+def build_next_available_options(next_availabilities):
+    """
+    Build a list of the earliest availabilities on the following days, to be used in responseCard generation.
+    """
+    day_strings = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+    options = []
+    for date, appointment_time in next_availabilities:
+        day = parse_date(date)
+        options.append({'text': '{}-{} ({}) {}'.format(day.month, day.day, day_strings[day.weekday()], build_time_output_string(appointment_time)),
+                        'value': '{} at {}'.format(day.strftime('%A, %B %d, %Y'), build_time_output_string(appointment_time))})
+    return options
+
+
 def build_options(slot, appointment_type, date, booking_map):
     """
     Build a list of potential options for a given slot, to be used in responseCard generation.
@@ -346,7 +509,7 @@ def build_options(slot, appointment_type, date, booking_map):
     elif slot == 'Date':
         # Return the next five weekdays.
         options = []
-        potential_date = datetime.date.today()
+        potential_date = today()
         while len(options) < 5:
             potential_date = potential_date + datetime.timedelta(days=1)
             if potential_date.weekday() < 5:
@@ -358,8 +521,7 @@ def build_options(slot, appointment_type, date, booking_map):
         if not appointment_type or not date:
             return None
 
-        interpreted_date = interpreted_value(date)    
-        availabilities = try_ex(lambda: booking_map[interpreted_date])
+        availabilities = booking_map.get(date)
         if not availabilities:
             return None
 
@@ -374,6 +536,17 @@ def build_options(slot, appointment_type, date, booking_map):
         return options
 
 
+""" --- Slot extraction --- """
+
+
+make_appointment_slots = compile_slot_extractor('MakeAppointmentSlots', (
+    ('appointment_type', 'AppointmentType'),
+    ('date', 'Date'),
+    ('time', 'Time'),
+    ('time_resolutions', 'Time', 'resolvedValues'),
+))
+
+
 """ --- Functions that control the bot's behavior --- """
 
 
@@ -386,17 +559,18 @@ def make_appointment(intent_request):
     2) Use of confirmIntent to support the confirmation of inferred slot values, when confirmation is required
     on the bot model and the inferred slot values fully specify the intent.
     """
-    appointment_type = intent_request['sessionState']['intent']['slots']['AppointmentType']
-    date = intent_request['sessionState']['intent']['slots']['Date']
-    appointment_time = intent_request['sessionState']['intent']['slots']['Time']
+    values = make_appointment_slots(intent_request['sessionState']['intent']['slots'])
+    appointment_type = values.appointment_type
+    date = values.date
+    appointment_time = values.time
     source = intent_request['invocationSource']
     output_session_attributes = intent_request['sessionState']['sessionAttributes'] if "sessionAttributes" in intent_request['sessionState'] else {}
-    booking_map = json.loads(try_ex(lambda: output_session_attributes['bookingMap']) or '{}')
+    booking_map = json.loads(output_session_attributes.get('bookingMap') or '{}')
 
     if source == 'DialogCodeHook':
         # Perform basic validation on the supplied input slots.
         slots = intent_request['sessionState']['intent']['slots']
-        validation_result = validate_book_appointment(appointment_type, date, appointment_time)
+        validation_result = validate_book_appointment(values)
         if not validation_result['isValid']:
             slots[validation_result['violatedSlot']] = None
             return elicit_slot(
@@ -431,28 +605,48 @@ def make_appointment(intent_request):
                 intent_request['sessionState']['intent']['name'],
                 intent_request['sessionState']['intent']['slots'],
                 'Date',
-                {'contentType': 'PlainText', 'content': 'When would you like to schedule your {}?'.format(interpreted_value(appointment_type))},
+                {'contentType': 'PlainText', 'content': 'When would you like to schedule your {}?'.format(appointment_type)},
                 build_response_card(
                     'Specify Date',
-                    'When would you like to schedule your {}?'.format(interpreted_value(appointment_type)),
+                    'When would you like to schedule your {}?'.format(appointment_type),
                     build_options('Date', appointment_type, date, None)
                 )
             )
 
         if appointment_type and date:
             # Fetch or generate the availabilities for the given date.
-            interpreted_date = interpreted_value(date)
-            booking_availabilities = try_ex(lambda: booking_map[interpreted_date])
+            booking_availabilities = booking_map.get(date)
             if booking_availabilities is None:
-                booking_availabilities = get_availabilities(interpreted_date)
-                booking_map[interpreted_date] = booking_availabilities
+                booking_availabilities = get_availabilities(date)
+                booking_map[date] = booking_availabilities
                 output_session_attributes['bookingMap'] = json.dumps(booking_map)
 
-            appointment_type_availabilities = get_availabilities_for_duration(get_duration(appointment_type), booking_availabilities)
+            availability = availability_mask(booking_availabilities)
+            appointment_type_availabilities = free_windows(availability, get_duration(appointment_type))
             if len(appointment_type_availabilities) == 0:
-                # No availability on this day at all; ask for a new date and time.
+                # No availability on this day at all; offer the availabilities on the days after it and ask for a new date and time.
                 slots['Date'] = None
                 slots['Time'] = None
+                next_availabilities = next_available(parse_date(date) + datetime.timedelta(days=1), NEXT_AVAILABLE_DAYS,
+                                                     get_duration(appointment_type), booking_map)
+                output_session_attributes['bookingMap'] = json.dumps(booking_map)
+                if next_availabilities:
+                    return elicit_slot(
+                        output_session_attributes,
+                        intent_request['sessionState']['intent']['name'],
+                        slots,
+                        'Date',
+                        {
+                            'contentType': 'PlainText',
+                            'content': 'We do not have any availability on that date.  {}.  Which day works for you?'.format(
+                                build_next_available_string(next_availabilities))
+                        },
+                        build_response_card(
+                            'Specify Date',
+                            'What day works best for you?',
+                            build_next_available_options(next_availabilities)
+                        )
+                    )
                 return elicit_slot(
                     output_session_attributes,
                     intent_request['sessionState']['intent']['name'],
@@ -466,12 +660,12 @@ def make_appointment(intent_request):
                     )
                 )
 
-            message_content = 'What time on {} works for you? '.format(interpreted_value(date))
+            message_content = 'What time on {} works for you? '.format(date)
             if appointment_time:
-                output_session_attributes['formattedTime'] = build_time_output_string(interpreted_value(appointment_time))
+                output_session_attributes['formattedTime'] = build_time_output_string(appointment_time)
                 # Validate that proposed time for the appointment can be booked by first fetching the availabilities for the given day.  To
                 # give consistent behavior in the sample, this is stored in sessionAttributes after the first lookup.
-                if is_available(appointment_time, get_duration(appointment_type), booking_availabilities):
+                if is_free(availability, appointment_time, get_duration(appointment_type)):
                     return delegate(output_session_attributes, intent_request['sessionState']['intent']['name'], slots)
                 message_content = 'The time you requested is not available. '
 
@@ -489,7 +683,7 @@ def make_appointment(intent_request):
                     },
                     build_response_card(
                         'Confirm Appointment',
-                        'Is {} on {} okay?'.format(build_time_output_string(appointment_type_availabilities[0]), interpreted_value(date)),
+                        'Is {} on {} okay?'.format(build_time_output_string(appointment_type_availabilities[0]), date),
                         [{'text': 'yes', 'value': 'yes'}, {'text': 'no', 'value': 'no'}]
                     )
                 )
@@ -512,16 +706,10 @@ def make_appointment(intent_request):
 
     # Book the appointment.  In a real bot, this would likely involve a call to a backend service.
     duration = get_duration(appointment_type)
-    interpreted_date = interpreted_value(date)
-    booking_availabilities = booking_map[interpreted_date]
+    booking_availabilities = booking_map[date]
     if booking_availabilities:
-        # Remove the availability slot for the given date as it has now been booked.
-        booking_availabilities.remove(interpreted_value(appointment_time))
-        if duration == 60:
-            second_half_hour_time = increment_time_by_thirty_mins(interpreted_value(appointment_time))
-            booking_availabilities.remove(second_half_hour_time)
-
-        booking_map[interpreted_date] = booking_availabilities
+        # Remove the availability slots for the given date as they have now been booked.
+        booking_map[date] = remove_availability(appointment_time, duration, booking_availabilities)
         output_session_attributes['bookingMap'] = json.dumps(booking_map)
     else:
         # This is not treated as an error as this code sample supports functionality either as fulfillment or dialog code hook.
@@ -534,7 +722,7 @@ def make_appointment(intent_request):
         'Fulfilled',
         {
             'contentType': 'PlainText',
-            'content': 'Okay, I have booked your appointment.  We will see you at {} on {}'.format(build_time_output_string(interpreted_value(appointment_time)), interpreted_date)
+            'content': 'Okay, I have booked your appointment.  We will see you at {} on {}'.format(build_time_output_string(appointment_time), date)
         }
     )
 
@@ -564,9 +752,10 @@ def lambda_handler(event, context):
     Route the incoming request based on intent.
     The JSON body of the request is provided in the event slot.
     """
-    # By default, treat the user request as coming from the America/New_York time zone.
-    os.environ['TZ'] = 'America/New_York'
-    time.tzset()
-    logger.debug('event.bot.name={}'.format(event['bot']['name']))
-
-    return dispatch(event)
+    # Dates are checked in the time zone of the user making the request
+    token = request_clock.set(RequestClock(resolve_time_zone(event)))
+    try:
+        logger.debug('event.bot.name={}'.format(event['bot']['name']))
+        return dispatch(event)
+    finally:
+        request_clock.reset(token)
@@ -8,12 +8,12 @@ For instructions on how to set up and test this bot, as well as additional sampl
 visit the Lex Getting Started documentation https://docs.aws.amazon.com/lexv2/latest/dg/what-is.html.
 """
 import math
-import dateutil.parser
-import datetime
-import time
-import os
 import logging
 
+# Shared by the blueprint bots; package lexv2_blueprint_helpers.py next to this file
+from lexv2_blueprint_helpers import (RequestClock, compile_slot_extractor, parse_date, request_clock,
+                                     resolve_time_zone, today)
+
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
@@ -102,44 +102,36 @@ def build_validation_result(is_valid, violated_slot, message_content):
         'message': {'contentType': 'PlainText', 'content': message_content}
     }
 
-def interpreted_value(slot):
-    """
-    Retrieves interprated value from slot object
-    """
-    if slot is not None:
-        return slot["value"]["interpretedValue"]
-    return slot   
-
 def isvalid_date(date):
-    try:
-        dateutil.parser.parse(date)
-        return True
-    except ValueError:
-        return False
+    return parse_date(date) is not None
 
 
-def validate_order_flowers(flower_type, date, pickup_time):
+def validate_order_flowers(values):
+    """
+    Validates the OrderFlowers slot values read by order_flowers_slots
+    """
     flower_types = ['lilies', 'roses', 'tulips']
-    if flower_type is not None and interpreted_value(flower_type).lower() not in flower_types:
+    if values.flower_type is not None and values.flower_type.lower() not in flower_types:
         return build_validation_result(False,
                                        'FlowerType',
                                        'We do not have {}, would you like a different type of flower?  '
-                                       'Our most popular flowers are roses'.format(interpreted_value(flower_type)))
+                                       'Our most popular flowers are roses'.format(values.flower_type))
 
-    if date is not None:
-        if not isvalid_date(interpreted_value(date)):
+    if values.pickup_date is not None:
+        pickup_day = parse_date(values.pickup_date)
+        if pickup_day is None:
             return build_validation_result(False, 'PickupDate', 'I did not understand that, what date would you like to pick the flowers up?')
-        elif datetime.datetime.strptime(interpreted_value(date), '%Y-%m-%d').date() <= datetime.date.today():
+        elif pickup_day <= today():
             return build_validation_result(False, 'PickupDate', 'You can pick up the flowers from tomorrow onwards.  What day would you like to pick them up?')
 
-    if pickup_time is not None:
-        if len(pickup_time["value"]["resolvedValues"]) != 1:
+    if values.pickup_time is not None:
+        if len(values.pickup_time_resolutions) != 1:
             return build_validation_result(False, 'PickupTime', 'I did not understand that, what time would you like to pick the flowers up? Please specify AM or PM')
-        elif len(interpreted_value(pickup_time)) != 5:
+        elif len(values.pickup_time) != 5:
             # Not a valid time; use a prompt defined on the build-time model.
             return build_validation_result(False, 'PickupTime', None)
 
-        hour, minute = interpreted_value(pickup_time).split(':')
+        hour, minute = values.pickup_time.split(':')
         hour = parse_int(hour)
         minute = parse_int(minute)
         if math.isnan(hour) or math.isnan(minute):
@@ -153,6 +145,17 @@ def validate_order_flowers(flower_type, date, pickup_time):
     return build_validation_result(True, None, None)
 
 
+""" --- Slot extraction --- """
+
+
+order_flowers_slots = compile_slot_extractor('OrderFlowersSlots', (
+    ('flower_type', 'FlowerType'),
+    ('pickup_date', 'PickupDate'),
+    ('pickup_time', 'PickupTime'),
+    ('pickup_time_resolutions', 'PickupTime', 'resolvedValues'),
+))
+
+
 """ --- Functions that control the bot's behavior --- """
 
 
@@ -163,9 +166,7 @@ def order_flowers(intent_request):
     in slot validation and re-prompting.
     """
 
-    flower_type = get_slots(intent_request)["FlowerType"]
-    date = get_slots(intent_request)["PickupDate"]
-    pickup_time = get_slots(intent_request)["PickupTime"]
+    values = order_flowers_slots(get_slots(intent_request))
     source = intent_request['invocationSource']
 
     if source == 'DialogCodeHook':
@@ -173,7 +174,7 @@ def order_flowers(intent_request):
         # Use the elicitSlot dialog action to re-prompt for the first violation detected.
         slots = get_slots(intent_request)
 
-        validation_result = validate_order_flowers(flower_type, date, pickup_time)
+        validation_result = validate_order_flowers(values)
         if not validation_result['isValid']:
             slots[validation_result['violatedSlot']] = None
             return elicit_slot(intent_request['sessionState']['sessionAttributes'],
@@ -185,8 +186,8 @@ def order_flowers(intent_request):
         # Pass the price of the flowers back through session attributes to be used in various prompts defined
         # on the bot model.
         output_session_attributes  = intent_request['sessionState']['sessionAttributes'] if "sessionAttributes" in intent_request['sessionState'] else {}
-        if flower_type is not None:
-            output_session_attributes['Price'] = len(interpreted_value(flower_type)) * 5  # Elegant pricing model
+        if values.flower_type is not None:
+            output_session_attributes['Price'] = len(values.flower_type) * 5  # Elegant pricing model
 
         return delegate(output_session_attributes, intent_request['sessionState']['intent']['name'], get_slots(intent_request))
 
@@ -196,7 +197,7 @@ def order_flowers(intent_request):
                  intent_request['sessionState']['intent']['name'],
                  'Fulfilled',
                  {'contentType': 'PlainText',
-                  'content': 'Thanks, your order for {} has been placed and will be ready for pickup by {} on {}'.format(interpreted_value(flower_type), interpreted_value(pickup_time), interpreted_value(date))})
+                  'content': 'Thanks, your order for {} has been placed and will be ready for pickup by {} on {}'.format(values.flower_type, values.pickup_time, values.pickup_date)})
 
 
 """ --- Intents --- """
@@ -226,9 +227,10 @@ def lambda_handler(event, context):
     Route the incoming request based on intent.
     The JSON body of the request is provided in the event slot.
     """
-    # By default, treat the user request as coming from the America/New_York time zone.
-    os.environ['TZ'] = 'America/New_York'
-    time.tzset()
-    logger.debug('event.bot.name={}'.format(event['bot']['name']))
-
-    return dispatch(event)
+    # Dates are checked in the time zone of the user making the request
+    token = request_clock.set(RequestClock(resolve_time_zone(event)))
+    try:
+        logger.debug('event.bot.name={}'.format(event['bot']['name']))
+        return dispatch(event)
+    finally:
+        request_clock.reset(token)
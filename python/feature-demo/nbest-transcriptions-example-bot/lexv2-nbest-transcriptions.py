@@ -6,8 +6,6 @@ For instructions on how to set up and test this bot, as well as additional sampl
 visit the Lex Getting Started documentation https://docs.aws.amazon.com/lexv2/latest/dg/what-is.html.
 """
 
-import time
-import os
 import logging
 
 logger = logging.getLogger()
@@ -186,9 +184,6 @@ def lambda_handler(event, context):
     The JSON body of the request is provided in the event slot.
 
     """
-    # By default, treat the user request as coming from the America/New_York time zone.
-    os.environ['TZ'] = 'America/New_York'
-    time.tzset()
     logger.debug('event={}'.format(event))
 
     return dispatch(event)
\ No newline at end of file
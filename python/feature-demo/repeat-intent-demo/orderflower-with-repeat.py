@@ -10,8 +10,6 @@ visit the Lex Getting Started documentation https://docs.aws.amazon.com/lexv2/la
 import math
 import dateutil.parser
 import datetime
-import time
-import os
 import io
 import logging
 import json
@@ -211,9 +209,6 @@ def lambda_handler(event, context):
     Route the incoming request based on intent.
     The JSON body of the request is provided in the event slot.
     """
-    # By default, treat the user request as coming from the America/New_York time zone.
-    os.environ['TZ'] = 'America/New_York'
-    time.tzset()
     logger.debug('Input={}'.format(json.dumps(event)))
 
     output = dispatch(event)
@@ -3,8 +3,6 @@ This is the Lambda function used in the "Example Code" section of https://docs.a
 """
 
 import json
-import time
-import os
 import logging
 
 logger = logging.getLogger()
@@ -152,11 +150,6 @@ def lambda_handler(event, context):
     The JSON body of the request is provided in the event slot.
     """
 
-    # By default, treat the user request as coming from 
-    # Eastern Standard Time.
-    os.environ['TZ'] = 'America/New_York'
-    time.tzset()
-
     logger.debug('event={}'.format(json.dumps(event)))
     response = dispatch(event)
     logger.debug("response={}".format(json.dumps(response)))
@@ -0,0 +1,184 @@
+"""
+Checks the circuit breaker and the latency budget: the breaker opens after the failure threshold,
+lets one probe through once it has been open for ADAPTER_BREAKER_OPEN_SECONDS and closes again
+when the probe succeeds; a call overrunning its budget raises FallbackRequired, and the fallback
+is a Delegate for a dialog code hook and a Close for fulfillment. Then measures what the breaker
+and budget add to a call.
+
+The checks swap the in-process handler of a target for one that fails or is slow.
+"""
+
+import io
+import sys
+import time
+import contextlib
+
+import common
+
+MIN_CALLS = 4
+OPEN_SECONDS = 0.2
+ITERATIONS = 20000
+
+ENV = {
+    'ROUTE_BookHotel': 'python:common.echo_v1_handler',
+    'ROUTE_BookCar': 'python:common.echo_v1_handler',
+    'ADAPTER_BREAKER_MIN_CALLS': str(MIN_CALLS),
+    'ADAPTER_BREAKER_ERROR_RATE': '0.5',
+    'ADAPTER_BREAKER_OPEN_SECONDS': str(OPEN_SECONDS),
+    'ADAPTER_BUDGET_RESERVE_MS': '0',
+    'ADAPTER_MIN_BUDGET_MS': '50',
+    'ADAPTER_STAGE_METRICS': 'false',
+    'ADAPTER_LOG_LEVEL': 'CRITICAL',
+}
+
+
+class FakeContext(object):
+    """
+    Lambda context of an invocation with timeout_ms left
+    """
+
+    def __init__(self, timeout_ms):
+        self.deadline = time.monotonic() + timeout_ms / 1000.0
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+class ControlledHandler(object):
+    """
+    V1 handler which echoes, fails or sleeps as told, counting its calls
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+        self.delay = 0
+
+    def __call__(self, event, context):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError('V1 function failed')
+        return common.echo_v1_handler(event, context)
+
+
+def handle(adapter, event, context=None):
+    """
+    The adapter's response to a turn, or the exception it raised
+    """
+    try:
+        return adapter.lambda_handler(event, context)
+    except Exception as e:
+        return e
+
+
+def check_breaker(adapter):
+    event = common.sample_v2_event('BookHotel')
+    target = adapter.route(event)
+    handler = ControlledHandler()
+    target.handler = handler
+    breaker = adapter.get_breaker(target.name)
+
+    handler.fail = True
+    for _ in range(MIN_CALLS):
+        assert isinstance(handle(adapter, event), RuntimeError)
+    assert breaker.state == breaker.OPEN, breaker.state
+
+    # While open, turns get the fallback without calling the target
+    response = handle(adapter, event)
+    assert response['sessionState']['dialogAction']['type'] == 'Delegate', response
+    assert handler.calls == MIN_CALLS
+
+    # After OPEN_SECONDS one probe is let through; a failed probe opens the breaker again
+    time.sleep(OPEN_SECONDS * 1.25)
+    assert isinstance(handle(adapter, event), RuntimeError)
+    assert handler.calls == MIN_CALLS + 1
+    assert breaker.state == breaker.OPEN, breaker.state
+
+    # A successful probe closes it
+    time.sleep(OPEN_SECONDS * 1.25)
+    handler.fail = False
+    response = handle(adapter, event)
+    assert response['sessionState']['dialogAction']['type'] == 'Delegate', response
+    assert handler.calls == MIN_CALLS + 2
+    assert breaker.state == breaker.CLOSED, breaker.state
+    assert handle(adapter, event)['sessionState']['dialogAction']['type'] == 'Delegate'
+    assert handler.calls == MIN_CALLS + 3
+
+    transitions = adapter.breaker_metrics()['transitions']
+    prefix = target.name + ':'
+    assert transitions == {
+        prefix + 'closed->open': 1,
+        prefix + 'open->half_open': 2,
+        prefix + 'half_open->open': 1,
+        prefix + 'half_open->closed': 1,
+    }, transitions
+    assert adapter.breaker_metrics()['states'][target.name] == 'closed'
+
+
+def check_budget(adapter):
+    event = common.sample_v2_event('BookCar')
+    target = adapter.route(event)
+    handler = ControlledHandler()
+    target.handler = handler
+    v1_event = target.transform(event)
+
+    # Too little time left: the target is not called
+    try:
+        adapter.call_target(v1_event, target, FakeContext(20), adapter.StageTimings())
+    except adapter.FallbackRequired as e:
+        assert e.reason == 'LatencyBudget', e.reason
+    else:
+        raise AssertionError('a budget below ADAPTER_MIN_BUDGET_MS must raise FallbackRequired')
+    assert handler.calls == 0
+
+    # The call overruns its budget
+    handler.delay = 0.3
+    try:
+        adapter.call_target(v1_event, target, FakeContext(100), adapter.StageTimings())
+    except adapter.FallbackRequired as e:
+        assert e.reason == 'Timeout', e.reason
+    else:
+        raise AssertionError('a call overrunning its budget must raise FallbackRequired')
+
+    # The fallback of a dialog code hook hands the turn back to Lex; fulfillment is closed
+    start = time.monotonic()
+    response = handle(adapter, event, FakeContext(100))
+    assert time.monotonic() - start < 0.2
+    assert response['sessionState']['dialogAction']['type'] == 'Delegate', response
+    fulfillment = common.sample_v2_event('BookCar')
+    fulfillment['invocationSource'] = 'FulfillmentCodeHook'
+    response = handle(adapter, fulfillment, FakeContext(100))
+    assert response['sessionState']['dialogAction']['type'] == 'Close', response
+    assert response['sessionState']['intent']['state'] == 'Failed'
+    assert response['messages'] == adapter.FALLBACK_MESSAGES
+
+
+def main():
+    adapter = common.load_adapter(ENV)
+    # Transitions and fallbacks write metrics records to stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        check_breaker(adapter)
+    print('breaker opens, probes, reopens and closes: ok')
+    with contextlib.redirect_stdout(io.StringIO()):
+        check_budget(adapter)
+    print('budget fallbacks, Delegate for dialog and Close for fulfillment: ok')
+
+    adapter = common.load_adapter(ENV)
+    event = common.sample_v2_event('BookHotel')
+    target = adapter.route(event)
+    v1_event = target.transform(event)
+    timings = adapter.StageTimings()
+    baseline, candidate = common.compare(lambda: adapter.router(v1_event, target, timings),
+                                         lambda: adapter.call_target(v1_event, target, None, timings), ITERATIONS)
+    common.print_mean('router', baseline)
+    common.print_mean('call_target, breaker', candidate, baseline)
+    context = FakeContext(60000)
+    baseline, candidate = common.compare(lambda: adapter.call_target(v1_event, target, None, timings),
+                                         lambda: adapter.call_target(v1_event, target, context, timings), ITERATIONS)
+    common.print_mean('call_target, no budget', baseline)
+    common.print_mean('call_target, budget', candidate, baseline)
+
+if __name__ == '__main__':
+    sys.exit(main())
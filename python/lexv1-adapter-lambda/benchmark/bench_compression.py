@@ -0,0 +1,71 @@
+"""
+Round-trip check and size/latency comparison of plain and compressed invoke payloads for
+representative V1 events, and per-turn latency against the local Lambda stand-in with
+compression off and on.
+"""
+
+import io
+import sys
+import json
+import contextlib
+
+import common
+import lexv1_adapter_envelope
+
+ITERATIONS = 500
+
+
+def large_session_event():
+    attributes = {
+        'reservation{}'.format(i): json.dumps({'ReservationType': 'Hotel', 'Location': 'chicago', 'Nights': i % 7 + 1,
+                                               'CheckInDate': '2030-01-{:02d}'.format(i % 28 + 1), 'Notes': 'x' * 200})
+        for i in range(200)
+    }
+    return common.sample_v2_event(session_attributes=attributes)
+
+
+def decoding_echo_handler(event, context):
+    return common.echo_v1_handler(lexv1_adapter_envelope.decode_event(event), context)
+
+
+def main():
+    adapter = common.load_adapter({'ADAPTER_COMPRESS_MIN_BYTES': '0'})
+    events = [
+        ('single', common.sample_v2_event(interpretations=1)),
+        ('n-best (5)', common.sample_v2_event(interpretations=5)),
+        ('kendra', common.sample_v2_event(interpretations=3, kendra=True)),
+        ('large session', large_session_event()),
+    ]
+    for label, event in events:
+        v1_event = adapter.transform_v2_input_to_v1(event)
+        plain = adapter.encode_payload(v1_event)
+        compressed = adapter.encode_payload(v1_event, compress=True)
+        assert lexv1_adapter_envelope.decode_event(json.loads(compressed)) == json.loads(plain) == \
+            lexv1_adapter_envelope.decode_event(json.loads(plain))
+        print('{:<40} payload {:>7} -> {:>7} bytes ({:.0%})'.format(
+            label, len(plain), len(compressed), len(compressed) / len(plain)))
+        baseline, candidate = common.compare(lambda: adapter.encode_payload(v1_event),
+                                             lambda: adapter.encode_payload(v1_event, compress=True), ITERATIONS)
+        common.print_mean(label + ', encode (plain)', baseline)
+        common.print_mean(label + ', encode (compressed)', candidate, baseline)
+        plain_event = json.loads(plain)
+        compressed_event = json.loads(compressed)
+        baseline, candidate = common.compare(lambda: lexv1_adapter_envelope.decode_event(plain_event),
+                                             lambda: lexv1_adapter_envelope.decode_event(compressed_event),
+                                             ITERATIONS)
+        common.print_mean(label + ', decode (plain)', baseline)
+        common.print_mean(label + ', decode (compressed)', candidate)
+
+    # End to end: the V1 function decodes the envelope itself
+    event = events[3][1]
+    with common.LocalLambdaServer({'BookHotelV1': decoding_echo_handler}) as server:
+        for label, compress in (('large session, turn (plain)', 'false'), ('large session, turn (compressed)', 'true')):
+            adapter = common.load_adapter({'ROUTE_BookHotel': 'BookHotelV1', 'ADAPTER_LAMBDA_ENDPOINT_URL': server.endpoint_url,
+                                           'ADAPTER_COMPRESS': compress, 'ADAPTER_COMPRESS_MIN_BYTES': '32768',
+                                           'ADAPTER_STAGE_METRICS': 'false'})
+            with contextlib.redirect_stdout(io.StringIO()):
+                stats = common.measure(lambda: adapter.lambda_handler(event, None), ITERATIONS)
+            common.print_stats(label, stats)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,30 @@
+"""
+Compares per-turn adapter latency when the V1 handler is reached through client.invoke
+(against the local Lambda stand-in) and when it is called in-process.
+"""
+
+import io
+import sys
+import contextlib
+
+import common
+
+ITERATIONS = 500
+
+
+def main():
+    event = common.sample_v2_event('BookHotel')
+
+    with common.LocalLambdaServer({'BookHotelV1': common.echo_v1_handler}) as server:
+        modes = [
+            ('client.invoke (local stand-in)', 'BookHotelV1'),
+            ('in-process', 'python:common.echo_v1_handler'),
+        ]
+        for label, target in modes:
+            adapter = common.load_adapter({'ROUTE_BookHotel': target, 'ADAPTER_LAMBDA_ENDPOINT_URL': server.endpoint_url})
+            with contextlib.redirect_stdout(io.StringIO()):
+                stats = common.measure(lambda: adapter.lambda_handler(event, None), ITERATIONS)
+            common.print_stats(label, stats)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Calls a validator and an enrichment function for the same turn through a fan-out against the
+local Lambda stand-in, checks the merge strategies, and compares the per-turn latency with
+calling the two functions one after the other.
+"""
+
+import io
+import sys
+import json
+import contextlib
+
+import common
+
+ITERATIONS = 100
+DELAYS = {'ValidateHotelV1': 0.020, 'EnrichHotelV1': 0.030}
+
+
+def validate_hotel(event, context):
+    slots = event['currentIntent']['slots']
+    if not slots.get('RoomType'):
+        return {
+            'sessionAttributes': dict(event['sessionAttributes'], validated='true'),
+            'dialogAction': {'type': 'ElicitSlot', 'intentName': event['currentIntent']['name'], 'slots': slots,
+                             'slotToElicit': 'RoomType',
+                             'message': {'contentType': 'PlainText', 'content': 'Which room type?'}}
+        }
+    return common.echo_v1_handler(event, context)
+
+
+def enrich_hotel(event, context):
+    response = common.echo_v1_handler(event, context)
+    response['sessionAttributes'] = dict(event['sessionAttributes'], loyaltyTier='gold')
+    return response
+
+
+def fan_out_adapter(server, merge):
+    config = {'intents': {'BookHotel': {'targets': ['ValidateHotelV1', 'EnrichHotelV1'], 'merge': merge}}}
+    return common.load_adapter({'ADAPTER_ROUTING_CONFIG': json.dumps(config),
+                                'ADAPTER_LAMBDA_ENDPOINT_URL': server.endpoint_url})
+
+
+def main():
+    event = common.sample_v2_event('BookHotel')
+    handlers = {'ValidateHotelV1': validate_hotel, 'EnrichHotelV1': enrich_hotel}
+
+    with common.LocalLambdaServer(handlers, delay=DELAYS.get) as server:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            first = fan_out_adapter(server, 'first_non_delegate').lambda_handler(event, None)
+            merged = fan_out_adapter(server, 'merge_session_attributes').lambda_handler(event, None)
+        assert first['sessionState']['dialogAction']['slotToElicit'] == 'RoomType'
+        assert 'loyaltyTier' not in first['sessionState']['sessionAttributes']
+        assert merged['sessionState']['dialogAction']['slotToElicit'] == 'RoomType'
+        assert merged['sessionState']['sessionAttributes']['loyaltyTier'] == 'gold'
+        assert merged['sessionState']['sessionAttributes']['validated'] == 'true'
+        print('merge strategies: ok')
+
+        adapter = fan_out_adapter(server, 'merge_session_attributes')
+        target = adapter.route(event)
+
+        def sequential():
+            adapter.merge_session_attributes([adapter.call_member(event, member, None, adapter.StageTimings())
+                                               for member in target.members])
+
+        with contextlib.redirect_stdout(output):
+            sequential_stats = common.measure(sequential, ITERATIONS, warmup=5)
+            fan_out_stats = common.measure(lambda: adapter.lambda_handler(event, None), ITERATIONS, warmup=5)
+        common.print_stats('sequential', sequential_stats)
+        common.print_stats('fan-out', fan_out_stats)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""
+Measures tail latency of the adapter against a local Lambda stand-in whose answers are
+occasionally slow, with and without hedged invocation.
+"""
+
+import io
+import sys
+import random
+import contextlib
+
+import common
+
+ITERATIONS = 400
+SLOW_FRACTION = 0.02
+FAST_SECONDS = 0.005
+SLOW_SECONDS = 0.150
+
+
+def downstream_delay(fn_name):
+    return SLOW_SECONDS if random.random() < SLOW_FRACTION else FAST_SECONDS
+
+
+def main():
+    random.seed(7)
+    event = common.sample_v2_event('BookHotel')
+
+    with common.LocalLambdaServer({'BookHotelV1': common.echo_v1_handler}, delay=downstream_delay) as server:
+        for hedge in ('false', 'true'):
+            adapter = common.load_adapter({
+                'ROUTE_BookHotel': 'BookHotelV1',
+                'ADAPTER_LAMBDA_ENDPOINT_URL': server.endpoint_url,
+                'ADAPTER_HEDGE': hedge,
+            })
+            invocations = server.invocations
+            with contextlib.redirect_stdout(io.StringIO()):
+                stats = common.measure(lambda: adapter.lambda_handler(event, None), ITERATIONS)
+            common.print_stats('hedging {}'.format('on' if hedge == 'true' else 'off'), stats)
+            print('    downstream invokes {}, hedges sent {}, hedges won {}'.format(
+                server.invocations - invocations, adapter.hedge_stats['sent'], adapter.hedge_stats['won']))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
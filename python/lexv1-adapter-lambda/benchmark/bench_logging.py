@@ -0,0 +1,53 @@
+"""
+Measures the per-turn cost of payload logging on a large event (Kendra response and n-best
+interpretations) with logging off, sampled and on for every session. Log records are formatted
+and written to a discarding stream, as the Lambda log handler would.
+"""
+
+import io
+import sys
+import logging
+
+import common
+
+ITERATIONS = 2000
+SESSIONS = 1000
+
+
+class DiscardingHandler(logging.StreamHandler):
+    def __init__(self):
+        logging.StreamHandler.__init__(self, io.StringIO())
+
+    def emit(self, record):
+        logging.StreamHandler.emit(self, record)
+        self.stream.seek(0)
+        self.stream.truncate()
+
+
+def main():
+    events = []
+    for i in range(SESSIONS):
+        event = common.sample_v2_event(interpretations=5, kendra=True)
+        event['sessionId'] = 'session-{}'.format(i)
+        events.append(event)
+
+    modes = [
+        ('payload logging off', {'ADAPTER_LOG_LEVEL': 'INFO', 'ADAPTER_PAYLOAD_LOG_SAMPLE_RATE': '1'}),
+        ('payload logging sampled 10%', {'ADAPTER_LOG_LEVEL': 'DEBUG', 'ADAPTER_PAYLOAD_LOG_SAMPLE_RATE': '0.1'}),
+        ('payload logging full', {'ADAPTER_LOG_LEVEL': 'DEBUG', 'ADAPTER_PAYLOAD_LOG_SAMPLE_RATE': '1'}),
+    ]
+    root = logging.getLogger()
+    handler = DiscardingHandler()
+    root.handlers = [handler]
+    for label, env in modes:
+        env['ROUTE_BookHotel'] = 'python:common.echo_v1_handler'
+        # Stage metrics would print a record per turn; only logging is measured here
+        env['ADAPTER_STAGE_METRICS'] = 'false'
+        adapter = common.load_adapter(env)
+        turn = iter(range(10 ** 9))
+        common.print_stats(label, common.measure(
+            lambda: adapter.lambda_handler(events[next(turn) % SESSIONS], None), ITERATIONS))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""
+Compares per-turn adapter latency of the V2/V1 translation path and the passthrough path for
+V2-native targets, with the target called in-process and through client.invoke (against the
+local Lambda stand-in). The two paths are timed alternately. The V1 and V2 stand-in functions
+answer with the same content, so only the event sent and the transformations differ.
+"""
+
+import io
+import sys
+import json
+import contextlib
+
+import common
+
+ITERATIONS = 100
+
+
+def main():
+    event = common.sample_v2_event('BookHotel', kendra=True)
+    handlers = {'BookHotelV1': common.echo_v1_handler, 'BookHotelV2': common.echo_v2_handler}
+
+    with common.LocalLambdaServer(handlers) as server:
+        modes = [
+            ('in-process', 'python:common.echo_v1_handler', 'python:common.echo_v2_handler'),
+            ('client.invoke', 'BookHotelV1', 'BookHotelV2'),
+        ]
+        for label, v1_target, v2_target in modes:
+            adapters = []
+            for target in ({'function': v1_target}, {'function': v2_target, 'v2_native': True}):
+                config = {'intents': {'BookHotel': target}}
+                adapters.append(common.load_adapter({'ADAPTER_ROUTING_CONFIG': json.dumps(config),
+                                                     'ADAPTER_LAMBDA_ENDPOINT_URL': server.endpoint_url,
+                                                     'ADAPTER_STAGE_METRICS': 'false'}))
+            translated, passthrough = adapters
+            target = translated.route(event)
+            print('{}: V1 event {} bytes, V2 event {} bytes'.format(
+                label, len(json.dumps(target.transform(event))), len(json.dumps(event))))
+            with contextlib.redirect_stdout(io.StringIO()):
+                baseline, candidate = common.compare(lambda: translated.lambda_handler(event, None),
+                                                     lambda: passthrough.lambda_handler(event, None),
+                                                     ITERATIONS, repeat=9)
+            common.print_mean('  {}, translated'.format(label), baseline)
+            common.print_mean('  {}, passthrough'.format(label), candidate, baseline)
+            print('  {:<42} {:>+8.1f}us per turn'.format('saved by passthrough', baseline - candidate))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Compares the full V2 -> V1 input transformation with a field projection for small, n-best and
+Kendra events: transform time, time to build the serialized invoke payload (transform and
+json.dumps) and payload size.
+
+First checks that a projection keeping currentIntent.slots but not currentIntent.slotDetails builds
+the slots alone, and compares it with building both maps and dropping the details.
+"""
+
+import sys
+import json
+
+import common
+
+ITERATIONS = 5000
+
+# The fields read by the BookTrip V1 functions
+FIELDS = ['currentIntent.name', 'currentIntent.slots', 'currentIntent.confirmationStatus',
+          'invocationSource', 'sessionAttributes']
+
+
+def check_slots_projection(adapter):
+    event = common.sample_v2_event()
+    full = adapter.transform_v2_input_to_v1(event)
+    for selected, convert in (('currentIntent.slots', adapter.v1_slot_values),
+                              ('currentIntent.slotDetails', adapter.v1_slot_details)):
+        fields = adapter.project_fields(adapter.V2_INPUT_TO_V1_FIELDS, {selected})
+        assert [(field.target, field.convert) for field in fields] == [(selected, convert)], fields
+        transform = adapter.compile_transformer('transform', ('event',), fields)
+        name = selected.split('.')[1]
+        assert transform(event) == {'currentIntent': {name: full['currentIntent'][name]}}
+    both = adapter.project_fields(adapter.V2_INPUT_TO_V1_FIELDS, {'currentIntent.slots', 'currentIntent.slotDetails'})
+    assert [field.convert for field in both] == [adapter.v1_slots]
+    print('slots and slotDetails projected alone build one map: ok')
+
+    # Before: the tuple target kept, with the details built and dropped
+    field = [field for field in adapter.V2_INPUT_TO_V1_FIELDS if field.convert is adapter.v1_slots][0]
+    dropped = adapter.compile_transformer('transform', ('event',), (field._replace(target=('currentIntent.slots', None)),))
+    alone = adapter.compile_transformer('transform', ('event',), adapter.project_fields((field,), {'currentIntent.slots'}))
+    baseline, candidate = common.compare(lambda: dropped(event), lambda: alone(event), ITERATIONS * 10)
+    common.print_mean('slots, details built and dropped', baseline)
+    common.print_mean('slots, built alone', candidate, baseline)
+
+
+def main():
+    config = {'intents': {'BookHotel': {'function': 'python:common.echo_v1_handler', 'fields': FIELDS}}}
+    adapter = common.load_adapter({'ADAPTER_ROUTING_CONFIG': json.dumps(config)})
+    check_slots_projection(adapter)
+    events = [
+        ('single', common.sample_v2_event(interpretations=1)),
+        ('n-best (5)', common.sample_v2_event(interpretations=5)),
+        ('kendra', common.sample_v2_event(interpretations=3, kendra=True)),
+    ]
+    full = adapter.transform_v2_input_to_v1
+    projected = adapter.route(events[0][1]).transform
+    for label, event in events:
+        full_mean, projected_mean = common.compare(lambda: full(event), lambda: projected(event), ITERATIONS)
+        common.print_mean(label + ', transform (full)', full_mean)
+        common.print_mean(label + ', transform (projected)', projected_mean, full_mean)
+        full_mean, projected_mean = common.compare(lambda: json.dumps(full(event)),
+                                                   lambda: json.dumps(projected(event)), ITERATIONS)
+        common.print_mean(label + ', payload (full)', full_mean)
+        common.print_mean(label + ', payload (projected)', projected_mean, full_mean)
+        print('{:<40} payload {:>6} -> {:>6} bytes'.format(
+            label, len(json.dumps(full(event))), len(json.dumps(projected(event)))))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,42 @@
+"""
+Replay throughput against the local Lambda stand-in, with 5ms of simulated function latency,
+for several worker counts.
+"""
+
+import io
+import os
+import sys
+import json
+import contextlib
+import importlib.util
+
+import common
+
+EVENTS = 1000
+DELAY_SECONDS = 0.005
+REPLAY_PATH = os.path.join(os.path.dirname(common.ADAPTER_PATH), 'lexv1-adapter-replay.py')
+
+
+def load_replay():
+    spec = importlib.util.spec_from_file_location('lexv1_adapter_replay', REPLAY_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    replay = load_replay()
+    lines = [json.dumps(common.sample_v2_event('BookHotel', interpretations=3)) for _ in range(EVENTS)]
+
+    with common.LocalLambdaServer({'BookHotelV1': common.echo_v1_handler}, delay=lambda name: DELAY_SECONDS) as server:
+        for workers in (1, 8, 32):
+            adapter = common.load_adapter({'ROUTE_BookHotel': 'BookHotelV1', 'ADAPTER_LAMBDA_ENDPOINT_URL': server.endpoint_url,
+                                           'ADAPTER_MAX_POOL_CONNECTIONS': str(workers), 'ADAPTER_STAGE_METRICS': 'false'})
+            with contextlib.redirect_stdout(io.StringIO()):
+                stats = replay.replay(lines, io.StringIO(), adapter, workers)
+            print('workers {:>3}: {:>8.1f} events/s, invoke p50 {:.2f}ms p99 {:.2f}ms, errors {}'.format(
+                workers, stats['events_per_second'], stats['stages']['invoke']['p50_ms'],
+                stats['stages']['invoke']['p99_ms'], stats['errors']))
+
+if __name__ == '__main__':
+    sys.exit(main())
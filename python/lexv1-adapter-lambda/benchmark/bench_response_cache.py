@@ -0,0 +1,119 @@
+"""
+Checks the response cache: hit and miss counters, least recently used eviction, expiry after the
+time to live, the memory cap, copies handed out on hits, and cache_metrics keyed by scope and
+target for a function cached in two aliases. Then compares per-turn latency of a cached and an
+uncached target over client.invoke against the local Lambda stand-in.
+"""
+
+import io
+import sys
+import json
+import time
+import contextlib
+
+import common
+
+ITERATIONS = 500
+
+
+class CountingHandler(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, event, context):
+        self.calls += 1
+        return common.echo_v1_handler(event, context)
+
+
+def check_cache(adapter):
+    response = {'dialogAction': {'type': 'Delegate', 'slots': {'Nights': '3'}}, 'sessionAttributes': {}}
+
+    cache = adapter.ResponseCache(adapter.CACHE_DEFAULT_KEY, 300, 10, 1 << 20)
+    assert cache.get(b'a') is None
+    cache.put(b'a', response)
+    hit = cache.get(b'a')
+    assert hit == response
+    # Every hit is a copy the turn may change
+    hit['dialogAction']['slots']['Nights'] = '4'
+    assert cache.get(b'a') == response
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (2, 1, 1), stats
+
+    # Least recently used out first
+    cache = adapter.ResponseCache(adapter.CACHE_DEFAULT_KEY, 300, 2, 1 << 20)
+    cache.put(b'a', response)
+    cache.put(b'b', response)
+    cache.get(b'a')
+    cache.put(b'c', response)
+    assert cache.get(b'b') is None and cache.get(b'a') is not None and cache.get(b'c') is not None
+    assert cache.stats()['evictions'] == 1
+
+    # Expiry after the time to live
+    cache = adapter.ResponseCache(adapter.CACHE_DEFAULT_KEY, 0.05, 10, 1 << 20)
+    cache.put(b'a', response)
+    assert cache.get(b'a') is not None
+    time.sleep(0.06)
+    assert cache.get(b'a') is None
+    stats = cache.stats()
+    assert (stats['expirations'], stats['entries'], stats['bytes']) == (1, 0, 0), stats
+
+    # Memory cap: the oldest entries make room, and a response larger than the cap is not kept
+    size = len(json.dumps(response).encode('utf-8'))
+    cache = adapter.ResponseCache(adapter.CACHE_DEFAULT_KEY, 300, 10, size * 2)
+    for key in (b'a', b'b', b'c'):
+        cache.put(key, response)
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['evictions']) == (2, size * 2, 1), stats
+    assert cache.get(b'a') is None
+    cache.put(b'd', dict(response, sessionAttributes={'large': 'x' * size * 2}))
+    assert cache.get(b'd') is None and cache.stats()['bytes'] <= size * 2
+
+
+def check_turns(adapter):
+    event = common.sample_v2_event('BookHotel')
+    prod = common.sample_v2_event('BookHotel')
+    prod['bot']['aliasName'] = 'Prod'
+    handlers = {}
+    for e in (event, prod):
+        handlers[e['bot']['aliasName']] = adapter.route(e).handler = CountingHandler()
+
+    for _ in range(3):
+        adapter.lambda_handler(event, None)
+    adapter.lambda_handler(prod, None)
+    fulfillment = common.sample_v2_event('BookHotel')
+    fulfillment['invocationSource'] = 'FulfillmentCodeHook'
+    adapter.lambda_handler(fulfillment, None)
+    adapter.lambda_handler(fulfillment, None)
+    # One call for the repeated dialog turns, two for fulfillment, which is never cached
+    assert handlers['TestBotAlias'].calls == 3, handlers['TestBotAlias'].calls
+    assert handlers['Prod'].calls == 1
+
+    # The same function cached in two aliases keeps two sets of counters
+    metrics = adapter.cache_metrics()
+    assert set(metrics) == {'*/*/python:common.echo_v1_handler', 'Prod/*/python:common.echo_v1_handler'}, metrics
+    assert (metrics['*/*/python:common.echo_v1_handler']['hits'], metrics['*/*/python:common.echo_v1_handler']['misses']) == (2, 1)
+    assert (metrics['Prod/*/python:common.echo_v1_handler']['hits'], metrics['Prod/*/python:common.echo_v1_handler']['misses']) == (0, 1)
+
+
+def main():
+    routing = {
+        'intents': {'BookHotel': {'function': 'python:common.echo_v1_handler', 'cache': True}},
+        'aliases': {'Prod': {'intents': {'BookHotel': {'function': 'python:common.echo_v1_handler', 'cache': {'max_entries': 10}}}}},
+    }
+    adapter = common.load_adapter({'ADAPTER_ROUTING_CONFIG': json.dumps(routing), 'ADAPTER_STAGE_METRICS': 'false'})
+    check_cache(adapter)
+    print('hits, misses, LRU eviction, expiry and memory cap: ok')
+    with contextlib.redirect_stdout(io.StringIO()):
+        check_turns(adapter)
+    print('cached dialog turns and cache_metrics by scope and target: ok')
+
+    with common.LocalLambdaServer({'BookHotelV1': common.echo_v1_handler}) as server:
+        routing = {'intents': {'BookHotel': 'BookHotelV1', 'BookCar': {'function': 'BookHotelV1', 'cache': True}}}
+        adapter = common.load_adapter({'ADAPTER_ROUTING_CONFIG': json.dumps(routing), 'ADAPTER_STAGE_METRICS': 'false',
+                                       'ADAPTER_LAMBDA_ENDPOINT_URL': server.endpoint_url})
+        for label, intent_name in (('no cache', 'BookHotel'), ('cache hit', 'BookCar')):
+            event = common.sample_v2_event(intent_name)
+            common.print_stats(label, common.measure(lambda: adapter.lambda_handler(event, None), ITERATIONS))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Checks how the routing table is read from environment variables: ROUTE_<intent name> variables,
+the unprefixed intent name variables of earlier versions of the adapter, and the warnings logged
+for each at cold start. Then measures the per-turn route lookup.
+
+Run in a fresh process: the adapter is loaded with only the unprefixed variables set.
+"""
+
+import sys
+import logging
+
+import common
+
+ITERATIONS = 100000
+
+
+class WarningRecorder(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def check_environment_routes(adapter):
+    """
+    Reads the routes of a few environments in each ADAPTER_UNPREFIXED_ROUTES mode
+    """
+    recorder = WarningRecorder()
+    adapter.logger.addHandler(recorder)
+    level = adapter.logger.level
+    adapter.logger.setLevel('WARNING')
+    runtime = {'AWS_REGION': 'us-east-1', 'PATH': '/usr/bin', 'ADAPTER_LOG_LEVEL': 'INFO'}
+    legacy = dict(runtime, BookHotel='BookHotelV1')
+    mixed = dict(runtime, BookHotel='BookHotelV1', ROUTE_BookCar='BookCarV1')
+    cases = [
+        # (environment, mode, expected intents, expected warning)
+        (legacy, 'auto', {'BookHotel': 'BookHotelV1'}, 'Reading routes from unprefixed environment variables BookHotel'),
+        (mixed, 'auto', {'BookCar': 'BookCarV1'}, 'Ignoring environment variables BookHotel'),
+        (mixed, 'true', {'BookHotel': 'BookHotelV1', 'BookCar': 'BookCarV1'}, 'Reading routes'),
+        (mixed, 'false', {'BookCar': 'BookCarV1'}, 'Ignoring environment variables BookHotel'),
+        (legacy, 'false', {}, 'Ignoring environment variables BookHotel'),
+        (dict(runtime, ROUTE_BookCar='BookCarV1'), 'auto', {'BookCar': 'BookCarV1'}, None),
+    ]
+    try:
+        for environ, mode, intents, warning in cases:
+            recorder.messages = []
+            config = adapter.routing_config_from_environment(environ, mode)
+            assert config['intents'] == intents, (mode, config)
+            if warning is None:
+                assert not recorder.messages, recorder.messages
+            else:
+                assert len(recorder.messages) == 1 and recorder.messages[0].startswith(warning), recorder.messages
+        try:
+            adapter.routing_config_from_environment(legacy, 'yes')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('an unknown mode must fail the cold start')
+    finally:
+        adapter.logger.removeHandler(recorder)
+        adapter.logger.setLevel(level)
+    print('environment routes in auto, true and false modes: ok')
+
+
+def main():
+    # A deployment configured as documented before ROUTE_ variables existed keeps routing
+    adapter = common.load_adapter({'BookHotel': 'python:common.echo_v1_handler', 'ADAPTER_LOG_LEVEL': 'ERROR',
+                                   'ADAPTER_STAGE_METRICS': 'false'})
+    event = common.sample_v2_event('BookHotel')
+    response = adapter.lambda_handler(event, None)
+    assert response['sessionState']['dialogAction']['type'] == 'Delegate', response
+    print('unprefixed BookHotel variable without ROUTE_ variables: routed')
+
+    check_environment_routes(adapter)
+
+    stats = common.measure(lambda: adapter.route(event), ITERATIONS)
+    common.print_stats('route lookup', stats)
+
+if __name__ == '__main__':
+    sys.exit(main())
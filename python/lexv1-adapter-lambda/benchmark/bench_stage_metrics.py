@@ -0,0 +1,72 @@
+"""
+Checks that turns handled concurrently, single targets and fan-outs, each write the timings of
+their own stages only: one value per stage in every metrics record. Then measures the per-turn
+cost of the stage timings, including writing their metrics record, with an in-process V1
+handler so that the adapter's own work dominates.
+"""
+
+import io
+import sys
+import json
+import time
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import common
+
+ITERATIONS = 2000
+TURNS = 200
+WORKERS = 8
+
+
+class DiscardingStream(io.StringIO):
+    def write(self, text):
+        return len(text)
+
+
+def slow_v1_handler(event, context):
+    time.sleep(0.002)
+    return common.echo_v1_handler(event, context)
+
+
+def other_slow_v1_handler(event, context):
+    return slow_v1_handler(event, context)
+
+
+def check_concurrent_turns():
+    config = {'intents': {
+        'BookHotel': 'python:__main__.slow_v1_handler',
+        'BookCar': {'targets': ['python:__main__.slow_v1_handler', 'python:__main__.other_slow_v1_handler']},
+    }}
+    adapter = common.load_adapter({'ADAPTER_ROUTING_CONFIG': json.dumps(config), 'ADAPTER_STAGE_METRICS': 'true'})
+    events = [common.sample_v2_event('BookHotel'), common.sample_v2_event('BookCar')]
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            list(pool.map(lambda i: adapter.lambda_handler(events[i % 2], None), range(TURNS)))
+
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    # A single target writes one record per turn; a fan-out one for itself and one per member
+    assert len(records) == TURNS // 2 * (1 + 3), len(records)
+    for record in records:
+        for metric in record['_aws']['CloudWatchMetrics'][0]['Metrics']:
+            assert len(record[metric['Name']]) == 1, record
+    print('{} concurrent turns in {} threads, one value per stage and record: ok'.format(TURNS, WORKERS))
+
+
+def main():
+    check_concurrent_turns()
+
+    event = common.sample_v2_event('BookHotel')
+    env = {'ROUTE_BookHotel': 'python:common.echo_v1_handler', 'ADAPTER_ROUTING_CONFIG': ''}
+    without_metrics = common.load_adapter(dict(env, ADAPTER_STAGE_METRICS='false'))
+    with_metrics = common.load_adapter(dict(env, ADAPTER_STAGE_METRICS='true'))
+    with contextlib.redirect_stdout(DiscardingStream()):
+        baseline, candidate = common.compare(lambda: without_metrics.lambda_handler(event, None),
+                                             lambda: with_metrics.lambda_handler(event, None), ITERATIONS)
+    common.print_mean('stage metrics off', baseline)
+    common.print_mean('stage metrics on', candidate)
+    print('{:<40} {:>9.2f}us per turn'.format('overhead', candidate - baseline))
+
+if __name__ == '__main__':
+    sys.exit(main())
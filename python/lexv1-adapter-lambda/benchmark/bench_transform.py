@@ -0,0 +1,46 @@
+"""
+Compares the compiled field-mapping transformers with the hand-written transformations they
+replaced, on event shapes seen in practice.
+"""
+
+import sys
+
+import common
+import legacy_transform
+
+ITERATIONS = 5000
+
+V1_RESPONSE = {
+    'sessionAttributes': {'currentReservation': '{"ReservationType": "Hotel"}', 'currentReservationPrice': '429'},
+    'dialogAction': {
+        'type': 'ElicitSlot',
+        'intentName': 'BookHotel',
+        'slotToElicit': 'RoomType',
+        'slots': {'Location': 'chicago', 'CheckInDate': '2030-01-04', 'Nights': '3', 'RoomType': None},
+        'message': {'contentType': 'PlainText', 'content': 'What type of room would you like, queen, king, or deluxe?'}
+    }
+}
+
+
+def main():
+    adapter = common.load_adapter()
+    events = [
+        ('input, 1 interpretation', common.sample_v2_event(interpretations=1)),
+        ('input, 5 interpretations', common.sample_v2_event(interpretations=5)),
+        ('input, kendra response', common.sample_v2_event(interpretations=3, kendra=True)),
+    ]
+    for label, event in events:
+        legacy, compiled = common.compare(lambda: legacy_transform.transform_v2_input_to_v1(event),
+                                          lambda: adapter.transform_v2_input_to_v1(event), ITERATIONS)
+        common.print_mean(label + ' (legacy)', legacy)
+        common.print_mean(label + ' (compiled)', compiled, legacy)
+
+    event = events[0][1]
+    legacy, compiled = common.compare(lambda: legacy_transform.transform_v1_response_to_v2(V1_RESPONSE, event),
+                                      lambda: adapter.transform_v1_response_to_v2(V1_RESPONSE, event), ITERATIONS)
+    common.print_mean('response, ElicitSlot (legacy)', legacy)
+    common.print_mean('response, ElicitSlot (compiled)', compiled, legacy)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
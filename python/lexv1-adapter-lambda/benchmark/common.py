@@ -0,0 +1,259 @@
+"""
+Shared helpers for the adapter benchmarks.
+
+Provides a loader for lexv1-adapter-lambda.py, sample Lex V2 events, a minimal V1 handler and
+a local stand-in for the Lambda Invoke API, so the benchmarks run without an AWS account.
+Run the benchmarks from this directory, e.g. python bench_dispatch.py
+"""
+
+import os
+import sys
+import json
+import time
+import timeit
+import threading
+import importlib.util
+from urllib.parse import unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ADAPTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexv1-adapter-lambda.py')
+# The adapter imports lexv1_adapter_envelope, packaged next to it in Lambda
+sys.path.insert(0, os.path.dirname(os.path.abspath(ADAPTER_PATH)))
+
+# Dummy credentials so botocore can sign requests sent to the local stand-in
+LOCAL_AWS_ENV = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'local',
+    'AWS_SECRET_ACCESS_KEY': 'local',
+}
+
+
+def load_adapter(env=None):
+    """
+    Loads a fresh copy of the adapter module, as a cold start would, with the given environment.
+    lexv1_adapter_envelope, packaged next to it, is imported once, as any other module.
+    """
+    for key, value in dict(LOCAL_AWS_ENV, **(env or {})).items():
+        os.environ[key] = value
+    spec = importlib.util.spec_from_file_location('lexv1_adapter_lambda', ADAPTER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def echo_v1_handler(event, context):
+    """
+    Minimal Lex V1 code hook: delegates back to Lex with the slots it received
+    """
+    return {
+        'sessionAttributes': event['sessionAttributes'],
+        'dialogAction': {
+            'type': 'Delegate',
+            'slots': event['currentIntent']['slots']
+        }
+    }
+
+
+def echo_v2_handler(event, context):
+    """
+    Minimal Lex V2 code hook: delegates back to Lex with the slots it received. Like
+    echo_v1_handler, it returns the slots and session attributes and nothing else of the intent.
+    """
+    intent = event['sessionState']['intent']
+    return {
+        'sessionState': {
+            'sessionAttributes': event['sessionState']['sessionAttributes'],
+            'dialogAction': {'type': 'Delegate'},
+            'intent': {
+                'name': intent['name'],
+                'slots': intent['slots'],
+                'state': intent['state'],
+                'confirmationState': intent['confirmationState']
+            }
+        }
+    }
+
+
+def sample_v2_event(intent_name='BookHotel', interpretations=3, kendra=False, session_attributes=None):
+    """
+    Builds a Lex V2 DialogCodeHook event shaped like the ones the BookTrip bot sends
+    """
+    slots = {
+        'Location': {
+            'shape': 'Scalar',
+            'value': {'originalValue': 'chicago', 'interpretedValue': 'chicago', 'resolvedValues': ['chicago']}
+        },
+        'CheckInDate': {
+            'shape': 'Scalar',
+            'value': {'originalValue': 'next friday', 'interpretedValue': '2030-01-04', 'resolvedValues': ['2030-01-04']}
+        },
+        'Nights': {
+            'shape': 'Scalar',
+            'value': {'originalValue': 'three', 'interpretedValue': '3', 'resolvedValues': ['3']}
+        },
+        'RoomType': None
+    }
+    intent = {
+        'name': intent_name,
+        'slots': slots,
+        'state': 'InProgress',
+        'confirmationState': 'None'
+    }
+    event = {
+        'sessionId': '123456789012345',
+        'inputTranscript': 'three nights in chicago next friday',
+        'interpretations': [{'intent': dict(intent), 'nluConfidence': 0.93}] + [
+            {'intent': {'name': 'Alternative{}'.format(i), 'slots': {}, 'state': 'InProgress', 'confirmationState': 'None'},
+             'nluConfidence': round(0.5 / (i + 1), 2)}
+            for i in range(interpretations - 1)
+        ],
+        'responseContentType': 'text/plain; charset=utf-8',
+        'invocationSource': 'DialogCodeHook',
+        'inputMode': 'Text',
+        'messageVersion': '1.0',
+        'bot': {'id': 'BOTID12345', 'name': 'BookTrip', 'aliasId': 'TSTALIASID', 'aliasName': 'TestBotAlias',
+                'localeId': 'en_US', 'version': 'DRAFT'},
+        'sessionState': {
+            'activeContexts': [
+                {'name': 'booking', 'timeToLive': {'timeToLiveInSeconds': 600, 'turnsToLive': 5},
+                 'contextAttributes': {'reservationId': 'R-1'}}
+            ],
+            'sessionAttributes': dict(session_attributes or {'lastConfirmedReservation': '{}'}),
+            'intent': intent,
+            'originatingRequestId': 'a1b2c3d4'
+        },
+        'requestAttributes': {'x-amz-lex:channel-type': 'Test'}
+    }
+    if kendra:
+        # Lex sends the Kendra results once, with the intent in the session state
+        intent['kendraResponse'] = {
+            'ResultItems': [
+                {'Id': str(i), 'Type': 'DOCUMENT', 'DocumentTitle': {'Text': 'Document {}'.format(i)},
+                 'DocumentExcerpt': {'Text': 'Lorem ipsum dolor sit amet ' * 40}}
+                for i in range(25)
+            ]
+        }
+    return event
+
+
+def measure(fn, iterations, warmup=20):
+    """
+    Calls fn repeatedly and returns per-call latency statistics in microseconds
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        'mean': sum(samples) / len(samples),
+        'p50': samples[len(samples) // 2],
+        'p95': samples[int(len(samples) * 0.95)],
+        'p99': samples[int(len(samples) * 0.99)],
+    }
+
+
+def measure_mean(fn, iterations, repeat=5):
+    """
+    Best-of-repeat mean latency of fn in microseconds, for calls too short to time one by one
+    """
+    return min(timeit.repeat(fn, number=iterations, repeat=repeat)) / iterations * 1e6
+
+
+def compare(baseline, candidate, iterations, repeat=15):
+    """
+    Best-of-repeat mean latencies (microseconds) of two functions, timed alternately so that
+    both see the same machine conditions
+    """
+    baseline_times = []
+    candidate_times = []
+    for _ in range(repeat):
+        baseline_times.append(timeit.timeit(baseline, number=iterations))
+        candidate_times.append(timeit.timeit(candidate, number=iterations))
+    return min(baseline_times) / iterations * 1e6, min(candidate_times) / iterations * 1e6
+
+
+def print_mean(label, mean, baseline=None):
+    speedup = '  ({:.2f}x)'.format(baseline / mean) if baseline else ''
+    print('{:<40} mean {:>9.2f}us{}'.format(label, mean, speedup))
+
+
+def print_stats(label, stats):
+    print('{:<40} mean {:>9.1f}us  p50 {:>9.1f}us  p95 {:>9.1f}us  p99 {:>9.1f}us'.format(
+        label, stats['mean'], stats['p50'], stats['p95'], stats['p99']))
+
+
+class LocalLambdaServer(object):
+    """
+    Local stand-in for the Lambda Invoke API (POST /2015-03-31/functions/<name>/invocations).
+
+    handlers maps a function name to a callable(event, context). delay, when given, is a
+    callable(function_name) returning seconds to sleep before answering, to simulate
+    downstream latency.
+    """
+
+    def __init__(self, handlers, delay=None):
+        self.handlers = handlers
+        self.delay = delay
+        self.invocations = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._request_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def endpoint_url(self):
+        return 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _request_handler(self):
+        server = self
+
+        class InvokeHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                parts = self.path.split('/')
+                fn_name = unquote(parts[3]) if len(parts) > 4 and parts[4].startswith('invocations') else None
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with server._lock:
+                    server.invocations += 1
+                if fn_name not in server.handlers:
+                    self._reply(404, {'Type': 'User', 'Message': 'Function not found: {}'.format(fn_name)},
+                                {'x-amzn-ErrorType': 'ResourceNotFoundException'})
+                    return
+                if server.delay:
+                    time.sleep(server.delay(fn_name))
+                try:
+                    result = server.handlers[fn_name](json.loads(body or b'{}'), None)
+                    self._reply(200, result, {'X-Amz-Executed-Version': '$LATEST'})
+                except Exception as e:
+                    self._reply(200, {'errorMessage': str(e), 'errorType': type(e).__name__},
+                                {'X-Amz-Function-Error': 'Unhandled'})
+
+            def _reply(self, status, body, headers):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return InvokeHandler
+
@@ -1,162 +1,1379 @@
 import os
 import json
+import time
+import zlib
+import base64
+import hashlib
+import logging
+import threading
+import importlib
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FutureTimeoutError, wait
 import boto3
+from botocore.config import Config
+
+# Packaged next to this file; the V1 functions decode compressed events with the same module
+from lexv1_adapter_envelope import ENVELOPE_KEY, ENVELOPE_ENCODING
+
+# Connection pool, timeouts and retries for the Lambda client. Keep-alive connections in the pool
+# are reused across warm invocations.
+MAX_POOL_CONNECTIONS = int(os.environ.get('ADAPTER_MAX_POOL_CONNECTIONS', '20'))
+CONNECT_TIMEOUT = float(os.environ.get('ADAPTER_CONNECT_TIMEOUT', '2'))
+READ_TIMEOUT = float(os.environ.get('ADAPTER_READ_TIMEOUT', '25'))
+RETRY_MODE = os.environ.get('ADAPTER_RETRY_MODE', 'adaptive')
+MAX_ATTEMPTS = int(os.environ.get('ADAPTER_MAX_ATTEMPTS', '3'))
+TCP_KEEPALIVE = os.environ.get('ADAPTER_TCP_KEEPALIVE', 'true').lower() == 'true'
+# Overrides the Lambda endpoint, e.g. to point the adapter at a local stand-in for the Invoke API
+LAMBDA_ENDPOINT_URL = os.environ.get('ADAPTER_LAMBDA_ENDPOINT_URL') or None
+
+# Payload compression: events of targets with compression enabled are sent in an envelope
+# holding the zlib-compressed JSON when they are at least COMPRESS_MIN_BYTES long. The V1
+# function decodes it with lexv1_adapter_envelope.decode_event.
+COMPRESS_DEFAULT = os.environ.get('ADAPTER_COMPRESS', 'false').lower() == 'true'
+COMPRESS_MIN_BYTES = int(os.environ.get('ADAPTER_COMPRESS_MIN_BYTES', '32768'))
+COMPRESS_LEVEL = int(os.environ.get('ADAPTER_COMPRESS_LEVEL', '1'))
+
+# Hedged invocation: when a DialogCodeHook invoke has not answered after the observed p95
+# latency of its target, a second identical invoke is sent and the first answer wins.
+HEDGE_DEFAULT = os.environ.get('ADAPTER_HEDGE', 'false').lower() == 'true'
+HEDGE_PERCENTILE = float(os.environ.get('ADAPTER_HEDGE_PERCENTILE', '0.95'))
+HEDGE_INITIAL_DELAY_MS = float(os.environ.get('ADAPTER_HEDGE_INITIAL_DELAY_MS', '200'))
+HEDGE_MIN_DELAY_MS = float(os.environ.get('ADAPTER_HEDGE_MIN_DELAY_MS', '10'))
+HEDGE_MIN_SAMPLES = int(os.environ.get('ADAPTER_HEDGE_MIN_SAMPLES', '20'))
+LATENCY_WINDOW_SIZE = int(os.environ.get('ADAPTER_LATENCY_WINDOW_SIZE', '200'))
+
+# Circuit breaker per target, evaluated over a rolling time window of calls. The breaker opens
+# when too many calls fail or are slow, rejects calls while open, and lets a single trial call
+# through after ADAPTER_BREAKER_OPEN_SECONDS to decide whether to close again.
+BREAKER_WINDOW_SECONDS = float(os.environ.get('ADAPTER_BREAKER_WINDOW_SECONDS', '60'))
+BREAKER_MIN_CALLS = int(os.environ.get('ADAPTER_BREAKER_MIN_CALLS', '10'))
+BREAKER_ERROR_RATE = float(os.environ.get('ADAPTER_BREAKER_ERROR_RATE', '0.5'))
+BREAKER_SLOW_CALL_MS = float(os.environ.get('ADAPTER_BREAKER_SLOW_CALL_MS', '3000'))
+BREAKER_SLOW_CALL_RATE = float(os.environ.get('ADAPTER_BREAKER_SLOW_CALL_RATE', '0.5'))
+BREAKER_OPEN_SECONDS = float(os.environ.get('ADAPTER_BREAKER_OPEN_SECONDS', '30'))
+
+# Latency budget: time kept back from context.get_remaining_time_in_millis() to transform and
+# return the response, and the smallest budget worth calling a V1 function with.
+BUDGET_RESERVE_MS = float(os.environ.get('ADAPTER_BUDGET_RESERVE_MS', '250'))
+MIN_BUDGET_MS = float(os.environ.get('ADAPTER_MIN_BUDGET_MS', '500'))
+
+# Returned when the budget is exhausted or the target's breaker is open. 'Delegate' hands the
+# turn back to Lex, 'Close' ends the intent with ADAPTER_FALLBACK_MESSAGE. Fulfillment turns
+# always use 'Close' since they cannot be delegated.
+FALLBACK_ACTION = os.environ.get('ADAPTER_FALLBACK_ACTION', 'Delegate')
+FALLBACK_MESSAGES = [{
+    'contentType': 'PlainText',
+    'content': os.environ.get('ADAPTER_FALLBACK_MESSAGE', 'Sorry, I am having trouble right now. Please try again later.')
+}]
+
+METRICS_NAMESPACE = os.environ.get('ADAPTER_METRICS_NAMESPACE', 'LexV1Adapter')
+# Per-stage timings of every turn, written as one metrics record per invocation
+STAGE_METRICS = os.environ.get('ADAPTER_STAGE_METRICS', 'true').lower() == 'true'
+
+# Events and responses are logged at DEBUG level, for the given share of sessions (all turns of
+# a sampled session are logged) and cut to PAYLOAD_LOG_MAX_LENGTH characters. They are only
+# serialized when they are actually written.
+LOG_LEVEL = os.environ.get('ADAPTER_LOG_LEVEL', 'INFO')
+PAYLOAD_LOG_SAMPLE_RATE = float(os.environ.get('ADAPTER_PAYLOAD_LOG_SAMPLE_RATE', '1'))
+PAYLOAD_LOG_MAX_LENGTH = int(os.environ.get('ADAPTER_PAYLOAD_LOG_MAX_LENGTH', '16384'))
+
+logger = logging.getLogger()
+logger.setLevel(LOG_LEVEL)
 
 # reuse client connection as global
-client = boto3.client('lambda')
+client = boto3.client(
+    'lambda',
+    endpoint_url=LAMBDA_ENDPOINT_URL,
+    config=Config(
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        tcp_keepalive=TCP_KEEPALIVE,
+        retries={'mode': RETRY_MODE, 'max_attempts': MAX_ATTEMPTS}
+    )
+)
+
+# Runs V1 calls which are hedged or have a latency budget; sized to the connection pool so hedges
+# never wait for a connection. Its workers only ever run calls, so none waits on another.
+executor = ThreadPoolExecutor(max_workers=MAX_POOL_CONNECTIONS)
+
+# Mapping values with this prefix name a Python function packaged with the adapter,
+# e.g. 'python:book_trip_v1.lambda_handler', which is called in-process instead of
+# through client.invoke. Any other value is treated as a Lambda function name.
+IN_PROCESS_PREFIX = 'python:'
+
+# Path to a JSON/YAML routing file packaged with the adapter, or inline JSON. When unset the
+# routing table is built from environment variables named ROUTE_<intent name>.
+ROUTING_CONFIG = os.environ.get('ADAPTER_ROUTING_CONFIG')
+ROUTE_ENV_PREFIX = 'ROUTE_'
+
+# Compatibility with earlier versions of the adapter, which read routes from variables named after
+# the intent itself. 'auto' reads them only when no ROUTE_ variable is set, so existing deployments
+# keep routing until they are migrated; 'true' always reads them and 'false' never does. Every
+# other variable is then read as a route, and a warning is logged at cold start whenever such
+# variables are read or ignored.
+UNPREFIXED_ROUTES = os.environ.get('ADAPTER_UNPREFIXED_ROUTES', 'auto').lower()
+UNPREFIXED_ROUTES_MODES = ('auto', 'true', 'false')
+
+# Environment variables which configure the adapter or are set by the Lambda runtime are never
+# read as unprefixed intent mappings.
+CONFIG_ENV_PREFIX = 'ADAPTER_'
+RUNTIME_ENV_PREFIXES = ('AWS_', 'LAMBDA_', '_', 'LD_', 'PYTHON')
+RUNTIME_ENV_NAMES = ('PATH', 'TZ', 'LANG', 'HOME', 'PWD', 'SHLVL')
+
+# Returned, without calling any V1 function, for intents which have no route
+UNKNOWN_INTENT_MESSAGES = [{
+    'contentType': 'PlainText',
+    'content': os.environ.get('ADAPTER_UNKNOWN_INTENT_MESSAGE', 'Sorry, I am not able to help with that request.')
+}]
+
+# Defaults for response caches enabled per target in the routing configuration. The cache key
+# is a hash of these fields of the V1 event; a target's configuration can narrow it to the fields
+# its responses actually depend on.
+CACHE_DEFAULT_KEY = ('currentIntent.name', 'currentIntent.slots', 'currentIntent.confirmationStatus', 'sessionAttributes')
+CACHE_DEFAULT_TTL_SECONDS = float(os.environ.get('ADAPTER_CACHE_TTL_SECONDS', '300'))
+CACHE_DEFAULT_MAX_ENTRIES = int(os.environ.get('ADAPTER_CACHE_MAX_ENTRIES', '1000'))
+CACHE_DEFAULT_MAX_BYTES = int(os.environ.get('ADAPTER_CACHE_MAX_BYTES', str(4 * 1024 * 1024)))
+
+# Imported in-process handlers, reused across warm invocations
+in_process_handlers = {}
+
+
+# --- Response cache ---
+
+
+class ResponseCache(object):
+    """
+    LRU cache with a time to live for the V1 responses of one target, kept in the warm container.
+    Responses are stored serialized: the size of an entry is known exactly, and every hit hands
+    out a fresh copy which the rest of the turn may modify.
+    """
+
+    def __init__(self, key_fields, ttl_seconds, max_entries, max_bytes):
+        self.key_paths = tuple(tuple(field.split('.')) for field in key_fields)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (expires_at, serialized response)
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+
+    def key(self, event):
+        """
+        Canonical hash of the configured projection of a V1 event
+        """
+        projection = []
+        for path in self.key_paths:
+            value = event
+            for segment in path:
+                value = value.get(segment) if isinstance(value, dict) else None
+            projection.append(value)
+        canonical = json.dumps(projection, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return json.loads(entry[1])
+
+    def put(self, key, response):
+        data = json.dumps(response).encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, data)
+            self.size_bytes += len(data)
+            while len(self.entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.size_bytes -= len(self.entries.pop(key)[1])
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'expirations': self.expirations, 'entries': len(self.entries), 'bytes': self.size_bytes}
+
+
+def parse_cache(value, where):
+    """
+    Builds the ResponseCache for a target's 'cache' setting: true, false or an object with any
+    of ttl_seconds, max_entries, max_bytes and key (list of dotted V1 event paths)
+    """
+    if value is False:
+        return None
+    if value is True:
+        value = {}
+    if not isinstance(value, dict):
+        raise ValueError('{} must be true, false or an object'.format(where))
+    unknown = set(value) - {'ttl_seconds', 'max_entries', 'max_bytes', 'key'}
+    if unknown:
+        raise ValueError('Unknown keys {} in {}'.format(sorted(unknown), where))
+    key_fields = value.get('key', CACHE_DEFAULT_KEY)
+    if not isinstance(key_fields, (list, tuple)) or not key_fields or \
+            not all(isinstance(field, str) and field for field in key_fields):
+        raise ValueError('{}.key must be a non-empty list of field paths'.format(where))
+    limits = {}
+    for name, default in (('ttl_seconds', CACHE_DEFAULT_TTL_SECONDS), ('max_entries', CACHE_DEFAULT_MAX_ENTRIES),
+                          ('max_bytes', CACHE_DEFAULT_MAX_BYTES)):
+        limits[name] = value.get(name, default)
+        if isinstance(limits[name], bool) or not isinstance(limits[name], (int, float)) or limits[name] <= 0:
+            raise ValueError('{}.{} must be a positive number'.format(where, name))
+    return ResponseCache(key_fields, **limits)
+
+
+# --- Routing ---
+
+
+def get_in_process_handler(target):
+    """
+    Imports (once per container) and returns the function named by module.function
+    """
+    handler = in_process_handlers.get(target)
+    if handler is None:
+        module_name, _, function_name = target.rpartition('.')
+        if not module_name:
+            raise ValueError('In-process target must be of the form module.function: ' + target)
+        handler = getattr(importlib.import_module(module_name), function_name)
+        in_process_handlers[target] = handler
+    return handler
+
+
+class RouteTarget(object):
+    """
+    A validated routing entry: either a Lambda function name or an in-process handler. V2-native
+    targets already implement the Lex V2 interface and are called without transformation. The
+    others get the V1 event built by transform, which only contains their selected fields.
+    """
+    __slots__ = ('name', 'handler', 'hedge', 'compress', 'cache', 'v2_native', 'transform')
+
+    def __init__(self, name, hedge=HEDGE_DEFAULT, compress=COMPRESS_DEFAULT, cache=None, v2_native=False, fields=None):
+        self.name = name
+        self.handler = get_in_process_handler(name[len(IN_PROCESS_PREFIX):]) if name.startswith(IN_PROCESS_PREFIX) else None
+        self.hedge = hedge and self.handler is None
+        self.compress = compress and self.handler is None
+        self.cache = cache
+        self.v2_native = v2_native
+        self.transform = None if v2_native else input_transformer(fields)
+
+
+class RoutingTable(object):
+    """
+    Intent to target mapping compiled at cold start. Holds one merged intent dictionary per
+    (alias, locale) combination mentioned in the configuration, so a lookup is a couple of
+    dictionary reads.
+    """
+
+    def __init__(self, scopes, aliases, locales):
+        self.scopes = scopes
+        self.aliases = aliases
+        self.locales = locales
+
+    def lookup(self, intent_name, alias_name=None, locale_id=None):
+        intents, default = self.scopes[(
+            alias_name if alias_name in self.aliases else None,
+            locale_id if locale_id in self.locales else None
+        )]
+        return intents.get(intent_name, default)
+
+
+def parse_target(value, where):
+    options = {}
+    if isinstance(value, dict) and 'targets' in value:
+        return parse_fan_out(value, where)
+    if isinstance(value, dict):
+        unknown = set(value) - {'function', 'hedge', 'compress', 'cache', 'v2_native', 'fields'}
+        if unknown:
+            raise ValueError('Unknown keys {} in {}'.format(sorted(unknown), where))
+        for flag in ('hedge', 'compress', 'v2_native'):
+            if flag in value:
+                if not isinstance(value[flag], bool):
+                    raise ValueError('{}.{} must be true or false'.format(where, flag))
+                options[flag] = value[flag]
+        if 'cache' in value:
+            if options.get('v2_native'):
+                raise ValueError('{}: the response cache is not available for V2-native targets'.format(where))
+            options['cache'] = parse_cache(value['cache'], where + '.cache')
+        if 'fields' in value:
+            options['fields'] = parse_fields(value['fields'], where + '.fields', options)
+        value = value.get('function')
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError('Target in {} must be a non-empty function name'.format(where))
+    return RouteTarget(value.strip(), **options)
+
+
+def parse_fan_out(value, where):
+    """
+    Validates a fan-out entry: {"targets": [...], "merge": strategy name}
+    """
+    unknown = set(value) - {'targets', 'merge'}
+    if unknown:
+        raise ValueError('Unknown keys {} in {}'.format(sorted(unknown), where))
+    members = value['targets']
+    if not isinstance(members, list) or len(members) < 2:
+        raise ValueError('{}.targets must be a list of at least two targets'.format(where))
+    targets = []
+    for i, member in enumerate(members):
+        member_where = '{}.targets[{}]'.format(where, i)
+        if isinstance(member, dict) and 'targets' in member:
+            raise ValueError('{}: fan-out targets cannot be nested'.format(member_where))
+        target = parse_target(member, member_where)
+        if target.v2_native:
+            raise ValueError('{}: V2-native targets cannot be part of a fan-out'.format(member_where))
+        targets.append(target)
+    merge = value.get('merge', 'first_non_delegate')
+    if merge not in MERGE_STRATEGIES:
+        raise ValueError('{}.merge must be one of {}'.format(where, sorted(MERGE_STRATEGIES)))
+    return FanOutTarget(targets, merge)
+
+
+def parse_fields(value, where, options):
+    """
+    Validates a target's 'fields' setting: the list of dotted V1 event paths its function reads
+    """
+    if options.get('v2_native'):
+        raise ValueError('{}: field projection is not available for V2-native targets'.format(where))
+    if not isinstance(value, (list, tuple)) or not value or not all(isinstance(path, str) and path for path in value):
+        raise ValueError('{} must be a non-empty list of field paths'.format(where))
+    targets = [target for field in V2_INPUT_TO_V1_FIELDS
+               for target in (field.target if isinstance(field.target, tuple) else (field.target,))]
+    for path in value:
+        if not any(target == path or target.startswith(path + '.') for target in targets):
+            raise ValueError('{}: unknown V1 field {}'.format(where, path))
+    cache = options.get('cache')
+    if cache is not None:
+        for key_path in cache.key_paths:
+            if not any(key_path[:len(path.split('.'))] == tuple(path.split('.')) for path in value):
+                raise ValueError('{}: cache key field {} is not one of the fields'.format(where, '.'.join(key_path)))
+    return tuple(value)
+
+
+def parse_scope(block, where, nested=()):
+    """
+    Validates one level of the routing configuration, returning (intents, default)
+    """
+    if not isinstance(block, dict):
+        raise ValueError('{} must be an object'.format(where))
+    unknown = set(block) - {'default', 'intents'} - set(nested)
+    if unknown:
+        raise ValueError('Unknown keys {} in {}'.format(sorted(unknown), where))
+    intents = block.get('intents', {})
+    if not isinstance(intents, dict):
+        raise ValueError('{}.intents must be an object'.format(where))
+    default = block.get('default')
+    return (
+        {name: parse_target(value, '{}.intents.{}'.format(where, name)) for name, value in intents.items()},
+        parse_target(default, where + '.default') if default is not None else None
+    )
+
+
+def compile_routing_table(config):
+    """
+    Builds a RoutingTable from a configuration of the form
+
+        {
+            "default": "FallbackFunction",
+            "intents": {"BookHotel": "BookHotelV1", "BookCar": "python:book_car.lambda_handler"},
+            "locales": {"en_GB": {"intents": {"BookHotel": "BookHotelV1UK"}}},
+            "aliases": {"Prod": {"intents": {...}, "locales": {"en_GB": {...}}}}
+        }
+
+    Precedence, most specific first: alias locale, alias, locale, top level. Within a level an
+    intent entry wins over that level's default. Raises ValueError for invalid configuration.
+    """
+    base = parse_scope(config, 'routing config', nested=('aliases', 'locales'))
+    locales = {
+        locale: parse_scope(block, 'locales.' + locale)
+        for locale, block in config.get('locales', {}).items()
+    }
+    aliases = {}
+    alias_locales = {}
+    for alias, block in config.get('aliases', {}).items():
+        aliases[alias] = parse_scope(block, 'aliases.' + alias, nested=('locales',))
+        for locale, locale_block in block.get('locales', {}).items():
+            alias_locales[(alias, locale)] = parse_scope(locale_block, 'aliases.{}.locales.{}'.format(alias, locale))
+
+    known_locales = set(locales) | {locale for _, locale in alias_locales}
+    scopes = {}
+    for alias in [None] + list(aliases):
+        for locale in [None] + list(known_locales):
+            intents = {}
+            default = None
+            for layer in (base, locales.get(locale), aliases.get(alias), alias_locales.get((alias, locale))):
+                if layer is not None:
+                    intents.update(layer[0])
+                    default = layer[1] or default
+            scopes[(alias, locale)] = (intents, default)
+
+    return RoutingTable(scopes, set(aliases), known_locales)
+
+
+def load_routing_config(source):
+    """
+    Reads the routing configuration from inline JSON, a JSON file or a YAML file
+    """
+    if source.lstrip().startswith('{'):
+        return json.loads(source)
+    if not os.path.isabs(source):
+        source = os.path.join(os.path.dirname(os.path.abspath(__file__)), source)
+    with open(source) as f:
+        if source.endswith(('.yaml', '.yml')):
+            # PyYAML is not part of the Lambda runtime and has to be packaged with the adapter
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def routing_config_from_environment(environ, unprefixed='auto'):
+    """
+    Reads the ROUTE_<intent name> -> function name environment variables, and the intent name ->
+    function name ones as the unprefixed mode ('auto', 'true' or 'false') says
+    """
+    if unprefixed not in UNPREFIXED_ROUTES_MODES:
+        raise ValueError('ADAPTER_UNPREFIXED_ROUTES must be one of {}'.format(', '.join(UNPREFIXED_ROUTES_MODES)))
+    prefixed = {
+        name[len(ROUTE_ENV_PREFIX):]: value for name, value in environ.items()
+        if value and name.startswith(ROUTE_ENV_PREFIX) and len(name) > len(ROUTE_ENV_PREFIX)
+    }
+    legacy = {
+        name: value for name, value in environ.items()
+        if value and not name.startswith((CONFIG_ENV_PREFIX, ROUTE_ENV_PREFIX))
+        and not name.startswith(RUNTIME_ENV_PREFIXES) and name not in RUNTIME_ENV_NAMES
+    }
+    intents = {}
+    if unprefixed == 'true' or (unprefixed == 'auto' and not prefixed):
+        if legacy:
+            logger.warning('Reading routes from unprefixed environment variables %s; rename them to %s<intent name>',
+                           ', '.join(sorted(legacy)), ROUTE_ENV_PREFIX)
+        intents.update(legacy)
+    elif legacy:
+        logger.warning('Ignoring environment variables %s: routes are read from %s<intent name> variables',
+                       ', '.join(sorted(legacy)), ROUTE_ENV_PREFIX)
+    intents.update(prefixed)
+    config = {'intents': intents}
+    if environ.get('ADAPTER_DEFAULT_TARGET'):
+        config['default'] = environ['ADAPTER_DEFAULT_TARGET']
+    return config
+
+
+def cache_metrics():
+    """
+    Counters of the response caches in the routing table, by '<alias>/<locale>/<target name>',
+    '*' standing for any alias or locale. A cache inherited by more specific scopes is reported
+    once, under the least specific scope routing to it.
+    """
+    metrics = {}
+    seen = set()
+    for (alias, locale), (intents, default) in routing_table.scopes.items():
+        for target in list(intents.values()) + [default]:
+            if target is None:
+                continue
+            for member in (target.members if isinstance(target, FanOutTarget) else (target,)):
+                if member.cache is None or id(member.cache) in seen:
+                    continue
+                seen.add(id(member.cache))
+                metrics['{}/{}/{}'.format(alias or '*', locale or '*', member.name)] = member.cache.stats()
+    return metrics
+
+
+def route(event):
+    """
+    Returns the RouteTarget for a V2 event, or None when the intent has no route
+    """
+    bot = event['bot']
+    return routing_table.lookup(event['sessionState']['intent']['name'], bot.get('aliasName'), bot.get('localeId'))
+
+
+def close_response(event, messages):
+    session_state = event['sessionState']
+    return {
+        'sessionState': {
+            'dialogAction': {
+                'type': 'Close'
+            },
+            'intent': {
+                'name': session_state['intent']['name'],
+                'state': 'Failed'
+            },
+            'sessionAttributes': session_state.get('sessionAttributes', {})
+        },
+        'messages': messages
+    }
+
+
+def delegate_response(event):
+    session_state = event['sessionState']
+    return {
+        'sessionState': {
+            'dialogAction': {
+                'type': 'Delegate'
+            },
+            'intent': session_state['intent'],
+            'sessionAttributes': session_state.get('sessionAttributes', {})
+        }
+    }
+
+
+def unknown_intent_response(event):
+    return close_response(event, UNKNOWN_INTENT_MESSAGES)
+
+
+def fallback_response(event, reason, target):
+    logger.warning('Fallback for intent: %s -> Lambda: %s (%s)', event['sessionState']['intent']['name'], target.name, reason)
+    emit_metric('Fallback', {'Target': target.name, 'Reason': reason})
+    if FALLBACK_ACTION == 'Delegate' and event['invocationSource'] == 'DialogCodeHook':
+        return delegate_response(event)
+    return close_response(event, FALLBACK_MESSAGES)
+
+
+# --- Logging ---
+
+
+class LazyJson(object):
+    """
+    Log argument which serializes its payload only when the log record is formatted
+    """
+    __slots__ = ('payload',)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        text = json.dumps(self.payload, default=str)
+        if len(text) > PAYLOAD_LOG_MAX_LENGTH:
+            return '{}... ({} characters truncated)'.format(text[:PAYLOAD_LOG_MAX_LENGTH], len(text) - PAYLOAD_LOG_MAX_LENGTH)
+        return text
+
+
+def payload_logging_enabled(session_id):
+    """
+    Decides once per request whether its payloads are logged. Sampling hashes the session id so
+    that a session is either logged completely or not at all.
+    """
+    if PAYLOAD_LOG_SAMPLE_RATE <= 0 or not logger.isEnabledFor(logging.DEBUG):
+        return False
+    if PAYLOAD_LOG_SAMPLE_RATE >= 1:
+        return True
+    return zlib.crc32(session_id.encode('utf-8')) % 10000 < PAYLOAD_LOG_SAMPLE_RATE * 10000
+
+
+def log_payload(enabled, label, payload):
+    if enabled:
+        logger.debug('%s: %s', label, LazyJson(payload))
+
+
+# --- Metrics ---
+
+
+def emit_metric(name, dimensions, value=1, unit='Count'):
+    """
+    Writes one metric in CloudWatch Embedded Metric Format to the function log
+    """
+    emit_metrics(dimensions, {name: value}, unit)
+
+
+def emit_metrics(dimensions, values, unit):
+    """
+    Writes metrics which share dimensions and unit as one Embedded Metric Format record. A value
+    may be a list of up to 100 values.
+    """
+    # The metric definitions of a record shape are serialized once per container
+    shape = (tuple(dimensions), tuple(values), unit)
+    definitions = metric_definitions.get(shape)
+    if definitions is None:
+        definitions = json.dumps([{
+            'Namespace': METRICS_NAMESPACE,
+            'Dimensions': [list(dimensions)],
+            'Metrics': [{'Name': name, 'Unit': unit} for name in values]
+        }])
+        metric_definitions[shape] = definitions
+    fields = dict(values)
+    fields.update(dimensions)
+    print('{{"_aws": {{"Timestamp": {}, "CloudWatchMetrics": {}}}, {}'.format(
+        int(time.time() * 1000), definitions, json.dumps(fields)[1:]))
+
+
+metric_definitions = {}
+
+
+class StageTimings(object):
+    """
+    Timings of the pipeline stages of one invocation, by target. lambda_handler creates one for
+    each invocation and passes it down, so concurrent invocations and the members of a fan-out
+    never mix their numbers. Stages may be recorded from any thread; flush writes what was
+    recorded for each target as one metrics record, in milliseconds. Stages recorded after the
+    flush, by a call left running in the background, are dropped.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def add(self, target_name, stage, seconds):
+        if STAGE_METRICS:
+            with self.lock:
+                self.values.setdefault(target_name, {}).setdefault(stage, []).append(round(seconds * 1000, 3))
+
+    def flush(self, intent_name):
+        with self.lock:
+            values, self.values = self.values, {}
+        for target_name, stages in values.items():
+            emit_metrics({'Intent': intent_name, 'Target': target_name}, stages, 'Milliseconds')
+
+
+# --- Circuit breaker ---
+
+
+# (target, from state, to state) -> number of transitions since the container started
+breaker_transitions = {}
+
+
+class CircuitBreaker(object):
+    """
+    Tracks the outcome of calls to one target over a rolling time window
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name):
+        self.name = name
+        self.state = self.CLOSED
+        self.calls = deque()  # (timestamp, failed, slow)
+        self.failures = 0
+        self.slow_calls = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns whether a call may be made now
+        """
+        with self.lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < BREAKER_OPEN_SECONDS:
+                    return False
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self.trial_in_flight:
+                    return False
+                self.trial_in_flight = True
+            return True
+
+    def record(self, latency, failed):
+        with self.lock:
+            now = time.monotonic()
+            slow = latency * 1000 >= BREAKER_SLOW_CALL_MS
+            if self.state == self.HALF_OPEN:
+                self.trial_in_flight = False
+                self._transition(self.OPEN if failed or slow else self.CLOSED)
+                return
+
+            self.calls.append((now, failed, slow))
+            self.failures += failed
+            self.slow_calls += slow
+            while self.calls and now - self.calls[0][0] > BREAKER_WINDOW_SECONDS:
+                _, old_failed, old_slow = self.calls.popleft()
+                self.failures -= old_failed
+                self.slow_calls -= old_slow
+
+            count = len(self.calls)
+            if self.state == self.CLOSED and count >= BREAKER_MIN_CALLS and (
+                    self.failures >= count * BREAKER_ERROR_RATE or self.slow_calls >= count * BREAKER_SLOW_CALL_RATE):
+                self._transition(self.OPEN)
+
+    def _transition(self, state):
+        key = (self.name, self.state, state)
+        breaker_transitions[key] = breaker_transitions.get(key, 0) + 1
+        logger.warning('Circuit breaker for %s: %s -> %s', self.name, self.state, state)
+        emit_metric('BreakerTransition', {'Target': self.name, 'Transition': '{}->{}'.format(self.state, state)})
+        self.state = state
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+        self.calls.clear()
+        self.failures = 0
+        self.slow_calls = 0
+
+
+# Target name -> CircuitBreaker, kept in the warm container
+breakers = {}
+
+
+def get_breaker(name):
+    breaker = breakers.get(name)
+    if breaker is None:
+        breaker = breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def breaker_metrics():
+    """
+    Current breaker state per target and transition counts since the container started
+    """
+    return {
+        'states': {name: breaker.state for name, breaker in breakers.items()},
+        'transitions': {'{}:{}->{}'.format(*key): count for key, count in breaker_transitions.items()}
+    }
 
-def router(event):
-    intent_name = event['currentIntent']['name']
 
-    # Read Environment variable for intent to Lambda function mapping
-    # This can be used for bots in Lex V1 which use different lambda functions
-    fn_name = os.environ.get(intent_name)
-    print(f"Intent: {intent_name} -> Lambda: {fn_name}")
+# --- Invocation ---
 
-    if (fn_name):
-        # invoke lambda and return result
-        invoke_response = client.invoke(FunctionName=fn_name, Payload = json.dumps(event))
-        print(json.dumps(invoke_response))
-        payload = json.load(invoke_response['Payload'])
-        return payload
 
-    raise Exception('No environment variable for intent: ' + intent_name)
+class LatencyWindow(object):
+    """
+    Rolling window of invoke latencies (seconds) for one target, shared by request threads
+    """
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, latency):
+        with self.lock:
+            self.samples.append(latency)
+
+    def percentile(self, fraction):
+        with self.lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+# Function name -> LatencyWindow, kept in the warm container
+latency_windows = {}
+
+# Number of second invokes sent by invoke_hedged, and how many of them answered first
+hedge_stats = {'sent': 0, 'won': 0}
+# Hedges are counted from concurrent request threads
+hedge_stats_lock = threading.Lock()
+
+
+def get_latency_window(fn_name):
+    window = latency_windows.get(fn_name)
+    if window is None:
+        window = latency_windows.setdefault(fn_name, LatencyWindow(LATENCY_WINDOW_SIZE))
+    return window
+
+
+def call_lambda(fn_name, payload, timings):
+    """
+    Invokes fn_name synchronously and returns the decoded response payload
+    """
+    start = time.perf_counter()
+    invoke_response = client.invoke(FunctionName=fn_name, Payload=payload)
+    received = time.perf_counter()
+    # The payload is read from the connection while it is decoded
+    response = json.load(invoke_response['Payload'])
+    decoded = time.perf_counter()
+    get_latency_window(fn_name).add(decoded - start)
+    timings.add(fn_name, 'InvokeTime', received - start)
+    timings.add(fn_name, 'DecodeTime', decoded - received)
+    logger.debug('Invoked %s: status %s, version %s', fn_name, invoke_response.get('StatusCode'), invoke_response.get('ExecutedVersion'))
+    if 'FunctionError' in invoke_response:
+        raise Exception('Lambda {} failed: {}'.format(fn_name, json.dumps(response)))
+    return response
+
+
+def hedge_delay(fn_name):
+    """
+    Seconds to wait for the first invoke before sending the hedge
+    """
+    window = get_latency_window(fn_name)
+    if len(window) < HEDGE_MIN_SAMPLES:
+        return HEDGE_INITIAL_DELAY_MS / 1000.0
+    return max(HEDGE_MIN_DELAY_MS / 1000.0, window.percentile(HEDGE_PERCENTILE))
+
+
+def invoke_hedged(fn_name, payload, timings, timeout=None):
+    """
+    Sends a second invoke if the first is slower than the target's p95, returning whichever
+    answers successfully first. The slower invoke is left to finish in the background. Raises
+    FutureTimeoutError when neither answers within timeout seconds.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    first = executor.submit(call_lambda, fn_name, payload, timings)
+    delay = hedge_delay(fn_name)
+    done, _ = wait([first], timeout=delay if timeout is None else min(delay, timeout))
+    if done:
+        return first.result()
+    if deadline is not None and time.monotonic() >= deadline:
+        raise FutureTimeoutError()
+
+    with hedge_stats_lock:
+        hedge_stats['sent'] += 1
+    pending = {first, executor.submit(call_lambda, fn_name, payload, timings)}
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=None if deadline is None else max(deadline - time.monotonic(), 0),
+                             return_when=FIRST_COMPLETED)
+        if not done:
+            raise FutureTimeoutError()
+        for future in done:
+            if future.exception() is None:
+                if future is not first:
+                    with hedge_stats_lock:
+                        hedge_stats['won'] += 1
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def call_with_timeout(timeout, fn, *args):
+    """
+    Calls fn, on the executor when a timeout is given. Raises FutureTimeoutError when it has not
+    returned after timeout seconds; it then keeps running in the background.
+    """
+    if timeout is None:
+        return fn(*args)
+    return executor.submit(fn, *args).result(timeout=timeout)
+
+
+def encode_payload(event, compress=False):
+    """
+    Serializes an event for client.invoke, in a compression envelope if compress is set and
+    the JSON is at least COMPRESS_MIN_BYTES long
+    """
+    payload = json.dumps(event, separators=(',', ':'))
+    if compress and len(payload) >= COMPRESS_MIN_BYTES:
+        data = base64.b64encode(zlib.compress(payload.encode('utf-8'), COMPRESS_LEVEL)).decode('ascii')
+        payload = json.dumps({ENVELOPE_KEY: {'encoding': ENVELOPE_ENCODING, 'data': data}})
+    return payload
+
+
+def invoke_lambda(fn_name, event, timings, hedge=False, compress=False, timeout=None):
+    payload = encode_payload(event, compress)
+    if hedge:
+        return invoke_hedged(fn_name, payload, timings, timeout)
+    return call_with_timeout(timeout, call_lambda, fn_name, payload, timings)
+
+
+def call_handler(target, event, context, timings):
+    start = time.perf_counter()
+    response = target.handler(event, context)
+    timings.add(target.name, 'InvokeTime', time.perf_counter() - start)
+    return response
+
+
+def router(event, target, timings, context=None, timeout=None):
+    """
+    Calls the target with the V1 event. Raises FutureTimeoutError when it has not answered after
+    timeout seconds. Calls run on the executor only when a timeout or a hedge needs it, and never
+    wait on the executor from one of its own workers.
+    """
+    logger.debug('Calling %s', target.name)
+
+    if target.handler is not None:
+        return call_with_timeout(timeout, call_handler, target, event, context, timings)
+    # Only dialog code hooks are hedged; repeating a fulfillment call could repeat its side effects
+    return invoke_lambda(target.name, event, timings, hedge=target.hedge and event['invocationSource'] == 'DialogCodeHook',
+                         compress=target.compress, timeout=timeout)
+
+
+def remaining_budget(context):
+    """
+    Seconds the V1 call may take, or None when running without a Lambda context
+    """
+    if context is None:
+        return None
+    return (context.get_remaining_time_in_millis() - BUDGET_RESERVE_MS) / 1000.0
+
+
+class FallbackRequired(Exception):
+    """
+    Raised when a target is not called, or does not answer in time, and the fallback response
+    has to be returned instead
+    """
+
+    def __init__(self, reason):
+        Exception.__init__(self, reason)
+        self.reason = reason
+
+
+def call_target(event, target, context, timings):
+    """
+    Calls the target within the latency budget and through its circuit breaker, recording the
+    outcome on the breaker. Raises FallbackRequired when the call is not made or times out.
+    """
+    budget = remaining_budget(context)
+    if budget is not None and budget * 1000 < MIN_BUDGET_MS:
+        raise FallbackRequired('LatencyBudget')
+    breaker = get_breaker(target.name)
+    if not breaker.allow():
+        raise FallbackRequired('CircuitOpen')
+
+    start = time.monotonic()
+    try:
+        response = router(event, target, timings, context, budget)
+    except FutureTimeoutError:
+        # The call keeps running in the background; its result is discarded
+        breaker.record(time.monotonic() - start, True)
+        raise FallbackRequired('Timeout')
+    except Exception:
+        breaker.record(time.monotonic() - start, True)
+        raise
+    breaker.record(time.monotonic() - start, False)
+    return response
+
+
+# --- Main handler ---
+
 
 def lambda_handler(event, context):
-    # Transform V2 input to V1 Format
-    trasformed_event = transform_v2_input_to_v1(event)
-    print("Transformed Input to V1 Lambda" + json.dumps(trasformed_event))
+    start = time.perf_counter()
+    target = route(event)
+    if target is None:
+        logger.warning('No route for intent: %s', event['sessionState']['intent']['name'])
+        return unknown_intent_response(event)
+    timings = StageTimings()
+    try:
+        if isinstance(target, FanOutTarget):
+            return fan_out_turn(event, target, context, timings)
+        return handle_turn(event, target, context, timings)
+    finally:
+        timings.add(target.name, 'TotalTime', time.perf_counter() - start)
+        timings.flush(event['sessionState']['intent']['name'])
+
 
-    # Route the request to V1 lambda
-    response = router(trasformed_event)
+def handle_turn(event, target, context, timings):
+    log_payloads = payload_logging_enabled(event['sessionId'])
+    log_payload(log_payloads, 'Input from Lex', event)
+    try:
+        if target.v2_native:
+            # V2-native targets get the Lex event as is, and their response goes back to Lex as is
+            response = call_target(event, target, context, timings)
+            log_payload(log_payloads, 'Output from V2 Lambda', response)
+            return response
+
+        # Transform V2 input to V1 Format
+        start = time.perf_counter()
+        trasformed_event = target.transform(event)
+        timings.add(target.name, 'TransformInputTime', time.perf_counter() - start)
+        log_payload(log_payloads, 'Transformed Input to V1 Lambda', trasformed_event)
+
+        # Route the request to V1 lambda
+        response = call_v1_target(event, trasformed_event, target, context, timings)
+    except FallbackRequired as e:
+        return fallback_response(event, e.reason, target)
 
     # Transform V1 output to V2 Format and return
+    log_payload(log_payloads, 'Output from V1 Lambda', response)
+    return transform_response(log_payloads, response, event, target, timings)
+
+
+def call_v1_target(event, trasformed_event, target, context, timings):
+    """
+    Returns the V1 response of a target, from its response cache when possible
+    """
+    # Dialog code hook responses of cacheable targets may be served from the cache
+    cache_key = None
+    if target.cache is not None and event['invocationSource'] == 'DialogCodeHook':
+        start = time.perf_counter()
+        cache_key = target.cache.key(trasformed_event)
+        response = target.cache.get(cache_key)
+        timings.add(target.name, 'CacheLookupTime', time.perf_counter() - start)
+        if response is not None:
+            return response
+
+    response = call_target(trasformed_event, target, context, timings)
+    if cache_key is not None:
+        target.cache.put(cache_key, response)
+    return response
+
+
+def transform_response(log_payloads, response, event, target, timings):
+    start = time.perf_counter()
     transformed_response = transform_v1_response_to_v2(response, event)
-    print("Transformed Output from V2 Lambda" + json.dumps(transformed_response))
+    timings.add(target.name, 'TransformOutputTime', time.perf_counter() - start)
+    log_payload(log_payloads, 'Transformed Output to Lex', transformed_response)
     return transformed_response
 
-def transform_v2_input_to_v1(event):
-    print(json.dumps(event))
-    trasformed_event = {}
-
-    # Active contexts
-    trasformed_event['activeContexts'] = []
-    for activeContext in event['sessionState']['activeContexts'] if 'activeContexts' in event['sessionState'] else []:
-        transformed_context = {}
-        transformed_context['timeToLive'] = activeContext['timeToLive']
-        transformed_context['name'] = activeContext['name']
-        transformed_context['parameters'] = activeContext['contextAttributes']
-        trasformed_event['activeContexts'].append(transformed_context)
-
-    # Alternative intents
-    trasformed_event['alternativeIntents'] = event['interpretations'][1:]
+
+# --- Fan-out ---
+
+
+def merge_first_non_delegate(responses):
+    """
+    The first response, in target order, which does more than delegate back to Lex
+    """
+    for response in responses:
+        if response['dialogAction']['type'] != 'Delegate':
+            return response
+    return responses[0]
+
+
+def merge_session_attributes(responses):
+    """
+    The dialog action of merge_first_non_delegate with the session attributes of all responses,
+    later targets winning on conflicts
+    """
+    merged = dict(merge_first_non_delegate(responses))
+    session_attributes = {}
+    for response in responses:
+        session_attributes.update(response.get('sessionAttributes') or {})
+    merged['sessionAttributes'] = session_attributes
+    return merged
+
+
+MERGE_STRATEGIES = {
+    'first_non_delegate': merge_first_non_delegate,
+    'merge_session_attributes': merge_session_attributes,
+}
+
+
+class FanOutTarget(object):
+    """
+    A routing entry which calls several V1 targets for the same turn at the same time and
+    merges their responses
+    """
+    __slots__ = ('name', 'members', 'merge')
+
+    def __init__(self, members, merge='first_non_delegate'):
+        self.name = '+'.join(member.name for member in members)
+        self.members = members
+        self.merge = MERGE_STRATEGIES[merge]
+
+
+def call_member(event, member, context, timings):
+    start = time.perf_counter()
+    trasformed_event = member.transform(event)
+    timings.add(member.name, 'TransformInputTime', time.perf_counter() - start)
+    return call_v1_target(event, trasformed_event, member, context, timings)
+
+
+def gather_members(event, target, context, timings):
+    """
+    Calls all targets of a fan-out concurrently, each on a fan_out_executor worker, and returns
+    the merged V1 response. Raises FallbackRequired if any target is not called or times out.
+    """
+    futures = [fan_out_executor.submit(call_member, event, member, context, timings) for member in target.members]
+    return target.merge([future.result() for future in futures])
+
+
+def fan_out_turn(event, target, context, timings):
+    log_payloads = payload_logging_enabled(event['sessionId'])
+    log_payload(log_payloads, 'Input from Lex', event)
+    try:
+        response = gather_members(event, target, context, timings)
+    except FallbackRequired as e:
+        return fallback_response(event, e.reason, target)
+    log_payload(log_payloads, 'Merged output from V1 Lambdas', response)
+    return transform_response(log_payloads, response, event, target, timings)
+
+
+# Runs the fan-out calls; reused across warm invocations. Kept apart from executor, on which the
+# calls wait for their latency budget, so that fan-out workers never wait on their own pool.
+fan_out_executor = ThreadPoolExecutor(max_workers=MAX_POOL_CONNECTIONS)
+
+
+# --- Transformations ---
+
+
+# One entry of a field-mapping spec. target is a dotted path in the output document, or a tuple
+# of paths when convert returns one value per path; such a convert can have a parts attribute
+# with one converter per path, used when a projection keeps only that path. source is a dotted path starting with the
+# name of an input document, a tuple of such paths (the first one with a value wins) or a
+# Literal. A trailing '?' marks the last segment as optional: a missing key yields None instead
+# of a KeyError. default is an empty container literal which replaces a missing or empty source
+# value, and convert, when given, is applied to the value. Fields with omit_missing are left out
+# of the output when their value is None.
+Field = namedtuple('Field', 'target source convert default omit_missing', defaults=(None, None, False))
+Literal = namedtuple('Literal', 'value')
+
+
+def compile_transformer(name, roots, fields):
+    """
+    Generates a function of the input documents named in roots which builds the output document
+    described by fields in a single pass. Objects read by more than one field are looked up
+    once, and the output is built as one dict display.
+    """
+    def split(path):
+        segments = path.split('.')
+        optional = segments[-1].endswith('?')
+        if optional:
+            segments[-1] = segments[-1][:-1]
+        if segments[0] not in roots or any(segment.endswith('?') for segment in segments[:-1]):
+            raise ValueError('Invalid source path in {}: {}'.format(name, path))
+        return segments, optional
+
+    def subscript(segment):
+        return '[{}]'.format(segment if segment.isdigit() else repr(segment))
+
+    # Count how many source paths go through each object, to hoist the shared ones into locals
+    paths = []
+    for field in fields:
+        if isinstance(field.source, Literal):
+            continue
+        paths.extend(field.source if isinstance(field.source, tuple) else (field.source,))
+    uses = {}
+    for path in paths:
+        segments, optional = split(path)
+        for i in range(2, len(segments) + (not optional)):
+            uses[tuple(segments[:i])] = uses.get(tuple(segments[:i]), 0) + 1
+
+    namespace = {}
+    lines = []
+    locals_by_path = {}
+
+    def access(path):
+        segments, optional = split(path)
+        expr = segments[0]
+        for i in range(1, len(segments) - optional):
+            key = tuple(segments[:i + 1])
+            if key in locals_by_path:
+                expr = locals_by_path[key]
+            elif uses[key] > 1:
+                locals_by_path[key] = '_p{}'.format(len(locals_by_path))
+                lines.append('    {} = {}{}'.format(locals_by_path[key], expr, subscript(segments[i])))
+                expr = locals_by_path[key]
+            else:
+                expr += subscript(segments[i])
+        if optional:
+            return '{}.get({!r})'.format(expr, segments[-1])
+        return expr
+
+    output = {}
+    omitted = []
+    for i, field in enumerate(fields):
+        if isinstance(field.source, Literal):
+            namespace['_k{}'.format(i)] = field.source.value
+            expr = '_k{}'.format(i)
+        elif isinstance(field.source, tuple):
+            # Coalesce: the first path with a value wins
+            expr = '_v{}'.format(i)
+            lines.append('    {} = {}'.format(expr, access(field.source[0])))
+            for alternative in field.source[1:]:
+                alternative_expr = access(alternative)
+                lines.append('    if {} is None:'.format(expr))
+                lines.append('        {} = {}'.format(expr, alternative_expr))
+        else:
+            expr = access(field.source)
+        if field.default is not None:
+            expr = '({} or {!r})'.format(expr, field.default)
+        if field.convert is not None:
+            namespace['_c{}'.format(i)] = field.convert
+            expr = '_c{}({})'.format(i, expr)
+
+        # A None in a tuple target drops that part of the converter's result
+        targets = field.target if isinstance(field.target, tuple) else (field.target,)
+        if len(targets) > 1:
+            values = ['_v{}_{}'.format(i, j) for j in range(len(targets))]
+            lines.append('    {} = {}'.format(', '.join(values), expr))
+        elif field.omit_missing:
+            values = ['_v{}'.format(i)]
+            if expr != values[0]:
+                lines.append('    {} = {}'.format(values[0], expr))
+        else:
+            values = [expr]
+        for target, value in zip(targets, values):
+            if target is None:
+                continue
+            segments = target.split('.')
+            if field.omit_missing:
+                omitted.append((segments, value))
+                continue
+            node = output
+            for segment in segments[:-1]:
+                node = node.setdefault(segment, {})
+            node[segments[-1]] = value
+
+    def render(node):
+        return '{' + ', '.join('{!r}: {}'.format(key, render(value) if isinstance(value, dict) else value)
+                               for key, value in node.items()) + '}'
+
+    lines.append('    _out = ' + render(output))
+    for segments, value in omitted:
+        lines.append('    if {} is not None:'.format(value))
+        lines.append('        _out{} = {}'.format(''.join(subscript(segment) for segment in segments), value))
+    lines.append('    return _out')
+
+    source = 'def {}({}):\n{}\n'.format(name, ', '.join(roots), '\n'.join(lines))
+    exec(compile(source, '<{}>'.format(name), 'exec'), namespace)
+    return namespace[name]
+
+
+def project_fields(fields, selected):
+    """
+    Keeps the entries of a field spec whose targets are, or are inside, one of the selected
+    dotted paths. Of a tuple target only the selected paths are kept; the others become None.
+    When a single path is kept and the converter has parts, that path's part replaces it, so
+    the values of the other paths are not built at all.
+    """
+    def wanted(target):
+        return any(target == path or target.startswith(path + '.') for path in selected)
+
+    projected = []
+    for field in fields:
+        if isinstance(field.target, tuple):
+            targets = tuple(target if wanted(target) else None for target in field.target)
+            kept = [i for i, target in enumerate(targets) if target]
+            parts = getattr(field.convert, 'parts', None)
+            if len(kept) == 1 and parts:
+                projected.append(field._replace(target=targets[kept[0]], convert=parts[kept[0]]))
+            elif kept:
+                projected.append(field._replace(target=targets))
+        elif wanted(field.target):
+            projected.append(field)
+    return tuple(projected)
+
+
+def v1_active_contexts(contexts):
+    if not contexts:
+        return []
+    return [
+        {'timeToLive': context['timeToLive'], 'name': context['name'], 'parameters': context['contextAttributes']}
+        for context in contexts
+    ]
+
+
+def v1_alternative_intents(interpretations):
     # To see the details from the recentIntentSummaryView, use the GetSession operation.
+    return interpretations[1:]
 
-    # Bot
-    trasformed_event['bot'] = {}
-    trasformed_event['bot']['name'] = event['bot']['name']
-    trasformed_event['bot']['alias'] = event['bot']['aliasName'] # Convert to $LATEST
-    trasformed_event['bot']['version'] = event['bot']['version'] # Convert to $LATEST
-
-    # Current intent
-    trasformed_event['currentIntent'] = {}
-    trasformed_event['currentIntent']['name'] = event['sessionState']['intent']['name']
-    trasformed_event['currentIntent']['nluConfidenceScore'] = event['interpretations'][0]['nluConfidence']
-    trasformed_event['currentIntent']['confirmationStatus'] = event['sessionState']['intent']['confirmationState']
-
-    # Slots
-    trasformed_event['currentIntent']['slots'] = {}
-    trasformed_event['currentIntent']['slotDetails'] = {}
-    for slotname, slot in event['sessionState']['intent']['slots'].items():
+
+def v1_slots(slots):
+    """
+    Splits V2 slots into the V1 slots and slotDetails maps in one loop
+    """
+    values = {}
+    details = {}
+    for slotname, slot in slots.items():
         if slot is None:
-            trasformed_event['currentIntent']['slots'][slotname] = None
-            trasformed_event['currentIntent']['slotDetails'][slotname] = None
+            values[slotname] = None
+            details[slotname] = None
         else:
-            transformed_slot = {}
-            trasformed_event['currentIntent']['slots'][slotname] = slot['value']['interpretedValue']
-
-            transformed_slotDetail = {}
-            transformed_slotDetail['resolutions'] = slot['value']['resolvedValues']
-            transformed_slotDetail['originalValue'] = slot['value']['originalValue']
-            trasformed_event['currentIntent']['slotDetails'][slotname] = transformed_slotDetail
-
-
-    trasformed_event['currentIntent']['confirmationStatus'] = event['sessionState']['intent']['confirmationState']
-    trasformed_event['currentIntent']['confirmationStatus'] = event['sessionState']['intent']['confirmationState']
-    trasformed_event['currentIntent']['confirmationStatus'] = event['sessionState']['intent']['confirmationState']
-
-    # Dialog action
-
-    # Amazon Kendra
-    trasformed_event['kendraResponse'] = event['sessionState']['intent']['kendraResponse'] if 'kendraResponse' in event['sessionState']['intent'] else None
-
-    # Sentiment
-    if 'sentimentResponse' in ['interpretations'][0]:
-        trasformed_event['sentimentResponse'] = {}
-        trasformed_event['sentimentResponse']['sentimentLabel'] = event['interpretations'][0]['sentimentResponse']['sentiment']
-        trasformed_event['sentimentResponse']['sentimentScore'] = event['interpretations'][0]['sentimentResponse']['sentimentScore']
-    else:
-        trasformed_event['sentimentResponse'] = None
-
-    # Others
-    trasformed_event['userId'] = event['sessionId']
-    trasformed_event['inputTranscript'] = event['inputTranscript']
-    trasformed_event['invocationSource'] = event['invocationSource']
-    trasformed_event['outputDialogMode'] = event['responseContentType']
-    trasformed_event['messageVersion'] = "1.0",
-    trasformed_event['sessionAttributes'] = event['sessionState']['sessionAttributes']
-    trasformed_event['requestAttributes'] = event['requestAttributes'] if 'requestAttributes' in event else None
-
-    return trasformed_event
-
-def transform_v1_response_to_v2(response, request):
-    print(json.dumps(response))
-    trasformed_response = {}
-    trasformed_response['sessionState'] = {}
-
-    # Dialog action
-    trasformed_response['sessionState']['dialogAction'] = {}
-    trasformed_response['sessionState']['dialogAction']['type'] = response['dialogAction']['type']
-    trasformed_response['sessionState']['dialogAction']['slotToElicit'] = response['dialogAction']['slotToElicit'] if 'slotToElicit' in response['dialogAction'] else None
-    trasformed_response['sessionState']['dialogAction']['kendraQueryRequestPayload'] = response['dialogAction']['kendraQueryRequestPayload'] if 'kendraQueryRequestPayload' in response['dialogAction'] else None
-    trasformed_response['sessionState']['dialogAction']['kendraQueryFilterString'] = response['dialogAction']['kendraQueryFilterString'] if 'kendraQueryFilterString' in response['dialogAction'] else None
-
-    # Messages
-    trasformed_response['messages'] = []
-    if 'message' in response['dialogAction']:
-        transformed_message = {}
-        transformed_message['contentType'] = response['dialogAction']['message']['contentType']
-        transformed_message['content'] = response['dialogAction']['message']['content']
-        trasformed_response['messages'].append(transformed_message)
-
-    if 'responseCard' in response['dialogAction']:
-        for message in response['dialogAction']['responseCard']['genericAttachments']:
-            transformed_message = {}
-            transformed_message['contentType'] = response['dialogAction']['responseCard']['contentType']
-            transformed_message['imageResponseCard']['title'] = message['title']
-            transformed_message['imageResponseCard']['subtitle'] = message['subTitle']
-            transformed_message['imageResponseCard']['imageUrl'] = message['imageUrl']
-            transformed_message['imageResponseCard']['buttons'] = message['buttons']
-            trasformed_response['messages'].append(transformed_message)
-
-    # Intents and slots
-    transformed_intent = {}
-    if 'intentName' in response['dialogAction']:
-        transformed_intent['name'] = response['dialogAction']['intentName']
-    elif 'name' in request['sessionState']['intent']:
-        transformed_intent['name'] = request['sessionState']['intent']['name']
-
-    if 'fulfillmentState' in response['dialogAction']:
-        transformed_intent['state'] = response['dialogAction']['fulfillmentState']
-    transformed_intent['slots'] = {}
-    for slotname, slotvalue in response['dialogAction']['slots'].items() if 'slots' in response['dialogAction'] else []:
-        transformed_slot = {}
-        transformed_slot['value'] = {}
-        transformed_slot['value']['interpretedValue'] = slotvalue if slotvalue is not None else None
-        transformed_slot['value']['originalValue'] = slotvalue if slotvalue is not None else None # Should not be required
-        transformed_intent['slots'][slotname] = transformed_slot
-    trasformed_response['sessionState']['intent'] = transformed_intent
-
-    # Session Attribute
-    trasformed_response['sessionState']['sessionAttributes'] = response['sessionAttributes']
-    return trasformed_response
+            value = slot['value']
+            values[slotname] = value['interpretedValue']
+            details[slotname] = {'resolutions': value['resolvedValues'], 'originalValue': value['originalValue']}
+    return values, details
+
+
+def v1_slot_values(slots):
+    return {slotname: slot['value']['interpretedValue'] if slot is not None else None for slotname, slot in slots.items()}
+
+
+def v1_slot_details(slots):
+    return {
+        slotname: {'resolutions': slot['value']['resolvedValues'], 'originalValue': slot['value']['originalValue']}
+        if slot is not None else None
+        for slotname, slot in slots.items()
+    }
+
+
+# Projections which keep only one of the two maps build it alone
+v1_slots.parts = (v1_slot_values, v1_slot_details)
+
+
+def v1_sentiment(sentiment):
+    if sentiment is None:
+        return None
+    return {'sentimentLabel': sentiment['sentiment'], 'sentimentScore': sentiment['sentimentScore']}
+
+
+def v2_messages(dialog_action):
+    messages = []
+    message = dialog_action.get('message')
+    if message:
+        messages.append({'contentType': message['contentType'], 'content': message['content']})
+
+    response_card = dialog_action.get('responseCard')
+    if response_card:
+        for attachment in response_card.get('genericAttachments') or []:
+            image_response_card = {'title': attachment['title']}
+            for v1_key, v2_key in (('subTitle', 'subtitle'), ('imageUrl', 'imageUrl'), ('buttons', 'buttons')):
+                if attachment.get(v1_key) is not None:
+                    image_response_card[v2_key] = attachment[v1_key]
+            messages.append({'contentType': 'ImageResponseCard', 'imageResponseCard': image_response_card})
+    return messages
+
+
+def v2_slots(slots):
+    return {
+        slotname: {'value': {'interpretedValue': slotvalue, 'originalValue': slotvalue}} if slotvalue is not None else None
+        for slotname, slotvalue in slots.items()
+    }
+
+
+# Lex V2 code hook input -> Lex V1 code hook input
+V2_INPUT_TO_V1_FIELDS = (
+    Field('activeContexts', 'event.sessionState.activeContexts?', v1_active_contexts),
+    Field('alternativeIntents', 'event.interpretations', v1_alternative_intents),
+    Field('bot.name', 'event.bot.name'),
+    Field('bot.alias', 'event.bot.aliasName'),
+    Field('bot.version', 'event.bot.version'),
+    Field('currentIntent.name', 'event.sessionState.intent.name'),
+    Field('currentIntent.nluConfidenceScore', 'event.interpretations.0.nluConfidence?'),
+    Field('currentIntent.confirmationStatus', 'event.sessionState.intent.confirmationState'),
+    Field(('currentIntent.slots', 'currentIntent.slotDetails'), 'event.sessionState.intent.slots', v1_slots),
+    Field('kendraResponse', 'event.sessionState.intent.kendraResponse?'),
+    Field('sentimentResponse', 'event.interpretations.0.sentimentResponse?', v1_sentiment),
+    Field('userId', 'event.sessionId'),
+    Field('inputTranscript', 'event.inputTranscript'),
+    Field('invocationSource', 'event.invocationSource'),
+    Field('outputDialogMode', 'event.responseContentType'),
+    Field('messageVersion', Literal('1.0')),
+    Field('sessionAttributes', 'event.sessionState.sessionAttributes?', default={}),
+    Field('requestAttributes', 'event.requestAttributes?'),
+)
+
+# Lex V1 code hook response -> Lex V2 code hook response
+V1_RESPONSE_TO_V2_FIELDS = (
+    Field('sessionState.dialogAction.type', 'response.dialogAction.type'),
+    Field('sessionState.dialogAction.slotToElicit', 'response.dialogAction.slotToElicit?'),
+    Field('sessionState.dialogAction.kendraQueryRequestPayload', 'response.dialogAction.kendraQueryRequestPayload?'),
+    Field('sessionState.dialogAction.kendraQueryFilterString', 'response.dialogAction.kendraQueryFilterString?'),
+    Field('sessionState.intent.name', ('response.dialogAction.intentName?', 'request.sessionState.intent.name?')),
+    Field('sessionState.intent.state', 'response.dialogAction.fulfillmentState?', omit_missing=True),
+    Field('sessionState.intent.slots', 'response.dialogAction.slots?', v2_slots, default={}),
+    Field('sessionState.sessionAttributes', 'response.sessionAttributes?', default={}),
+    Field('messages', 'response.dialogAction', v2_messages),
+)
+
+# Compiled once per container
+transform_v2_input_to_v1 = compile_transformer('transform_v2_input_to_v1', ('event',), V2_INPUT_TO_V1_FIELDS)
+transform_v1_response_to_v2 = compile_transformer('transform_v1_response_to_v2', ('response', 'request'), V1_RESPONSE_TO_V2_FIELDS)
+
+
+# Input transformers of targets with a field projection, by projection
+input_transformers = {}
+
+
+def input_transformer(fields):
+    """
+    Returns the V2 -> V1 input transformer which builds only the given V1 fields (all of them
+    when fields is None). Each distinct projection is compiled once.
+    """
+    if fields is None:
+        return transform_v2_input_to_v1
+    key = frozenset(fields)
+    transformer = input_transformers.get(key)
+    if transformer is None:
+        transformer = compile_transformer('transform_v2_input_to_v1', ('event',),
+                                          project_fields(V2_INPUT_TO_V1_FIELDS, key))
+        input_transformers[key] = transformer
+    return transformer
+
+
+# Parsed and validated once per container, after the transformers it refers to are compiled
+routing_table = compile_routing_table(
+    load_routing_config(ROUTING_CONFIG) if ROUTING_CONFIG else routing_config_from_environment(os.environ, UNPREFIXED_ROUTES)
+)
@@ -0,0 +1,188 @@
+"""
+Replays recorded Lex V2 code hook events through the adapter pipeline, outside of Lambda.
+
+Each line of the input is a V2 event. It is routed and transformed to V1 as the adapter would,
+sent to its V1 function (or functions, for a fan-out), and the V1 response is transformed back
+to V2. One JSON line per event is written to the output, in input order, with the V1 request,
+the V1 response and the V2 response, or the error. Throughput and per-stage timings are printed at the end.
+
+Routing comes from the same environment variables as the adapter, or from --routing-config. V1
+functions are called with client.invoke (use --endpoint-url for a local stand-in) or, for
+python: targets, in-process. The circuit breaker, latency budget and response cache are not
+used, so every event reaches its function.
+
+    python lexv1-adapter-replay.py events.jsonl --output results.jsonl --workers 16
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import importlib.util
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+ADAPTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexv1-adapter-lambda.py')
+STAGES = ('transform_input', 'invoke', 'transform_output')
+
+
+def load_adapter():
+    spec = importlib.util.spec_from_file_location('lexv1_adapter_lambda', ADAPTER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def replay_event(adapter, line_number, line):
+    """
+    Runs one V2 event through the pipeline. Returns the output record and the stage timings.
+    """
+    timings = {}
+    record = {'line': line_number}
+    try:
+        event = json.loads(line)
+        record['sessionId'] = event.get('sessionId')
+        record['intent'] = event['sessionState']['intent']['name']
+        target = adapter.route(event)
+        if target is None:
+            record['error'] = 'No route for intent'
+            record['response'] = adapter.unknown_intent_response(event)
+            return record, timings
+        record['target'] = target.name
+        # The stages are timed here; what the adapter records on the way is discarded
+        discarded = adapter.StageTimings()
+        # The targets of a fan-out are called one after the other and their responses merged
+        fan_out = isinstance(target, adapter.FanOutTarget)
+        if not fan_out and target.v2_native:
+            start = time.perf_counter()
+            record['response'] = adapter.router(event, target, discarded)
+            timings['invoke'] = time.perf_counter() - start
+            return record, timings
+
+        members = target.members if fan_out else (target,)
+        start = time.perf_counter()
+        requests = [member.transform(event) for member in members]
+        timings['transform_input'] = time.perf_counter() - start
+        record['v1Request'] = requests if fan_out else requests[0]
+
+        start = time.perf_counter()
+        responses = [adapter.router(request, member, discarded) for request, member in zip(requests, members)]
+        response = target.merge(responses) if fan_out else responses[0]
+        timings['invoke'] = time.perf_counter() - start
+        record['v1Response'] = responses if fan_out else response
+
+        start = time.perf_counter()
+        record['response'] = adapter.transform_v1_response_to_v2(response, event)
+        timings['transform_output'] = time.perf_counter() - start
+    except Exception as e:
+        record['error'] = '{}: {}'.format(type(e).__name__, e)
+    return record, timings
+
+
+def replay(lines, output, adapter, workers=8):
+    """
+    Replays the V2 events in lines (an iterable of JSON strings) and writes one JSON line per
+    event to output. At most twice the number of workers events are in flight, so inputs of any
+    size are streamed. Returns the statistics. Load the adapter with ADAPTER_STAGE_METRICS=false,
+    as the replay does not flush the adapter's own stage timings.
+    """
+    samples = {stage: [] for stage in STAGES}
+    count = 0
+    errors = 0
+    pending = deque()
+
+    def write_next():
+        nonlocal count, errors
+        record, timings = pending.popleft().result()
+        output.write(json.dumps(record, default=str) + '\n')
+        count += 1
+        errors += 'error' in record
+        for stage, seconds in timings.items():
+            samples[stage].append(seconds)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            pending.append(pool.submit(replay_event, adapter, line_number, line))
+            if len(pending) >= workers * 2:
+                write_next()
+        while pending:
+            write_next()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'events': count,
+        'errors': errors,
+        'seconds': elapsed,
+        'events_per_second': count / elapsed if elapsed else 0.0,
+        'stages': {stage: stage_stats(values) for stage, values in samples.items() if values},
+    }
+
+
+def stage_stats(seconds):
+    values = sorted(value * 1000 for value in seconds)
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values),
+        'p50_ms': values[len(values) // 2],
+        'p95_ms': values[int(len(values) * 0.95)],
+        'p99_ms': values[int(len(values) * 0.99)],
+        'max_ms': values[-1],
+    }
+
+
+def print_stats(stats, out):
+    print('{events} events, {errors} errors in {seconds:.2f}s ({events_per_second:.1f} events/s)'.format(**stats),
+          file=out)
+    for stage in STAGES:
+        if stage in stats['stages']:
+            print('{:<18} mean {mean_ms:>9.3f}ms  p50 {p50_ms:>9.3f}ms  p95 {p95_ms:>9.3f}ms  p99 {p99_ms:>9.3f}ms  '
+                  'max {max_ms:>9.3f}ms'.format(stage, **stats['stages'][stage]), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replays recorded Lex V2 events through the V1 adapter pipeline')
+    parser.add_argument('input', help='JSONL file of Lex V2 code hook events, or - for stdin')
+    parser.add_argument('--output', '-o', default='-', help='JSONL file for the results, or - for stdout')
+    parser.add_argument('--workers', '-w', type=int, default=8, help='Number of concurrent invocations')
+    parser.add_argument('--routing-config', help='Routing file or inline JSON, as ADAPTER_ROUTING_CONFIG')
+    parser.add_argument('--endpoint-url', help='Lambda endpoint, e.g. a local stand-in, as ADAPTER_LAMBDA_ENDPOINT_URL')
+    parser.add_argument('--stats', help='Also write the statistics to this JSON file')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    # The adapter reads its configuration from the environment when it is loaded
+    if args.routing_config:
+        os.environ['ADAPTER_ROUTING_CONFIG'] = args.routing_config
+    if args.endpoint_url:
+        os.environ['ADAPTER_LAMBDA_ENDPOINT_URL'] = args.endpoint_url
+    os.environ.setdefault('ADAPTER_MAX_POOL_CONNECTIONS', str(args.workers))
+    # Stage timings are reported by the replay itself
+    os.environ.setdefault('ADAPTER_STAGE_METRICS', 'false')
+    # python: targets are imported from the current directory
+    sys.path.insert(0, os.getcwd())
+    adapter = load_adapter()
+
+    source = sys.stdin if args.input == '-' else open(args.input)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        stats = replay(source, output, adapter, args.workers)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+    print_stats(stats, sys.stderr)
+    if args.stats:
+        with open(args.stats, 'w') as f:
+            json.dump(stats, f, indent=2)
+    return 1 if stats['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""
+Helper for Lex V1 functions called by the Lex V1 adapter with payload compression enabled.
+
+Large events are sent by the adapter as {"lexV1AdapterEnvelope": {"encoding": "zlib+base64",
+"data": "..."}}. Package this file with the V1 function and decode the event first:
+
+    from lexv1_adapter_envelope import decode_event
+
+    def lambda_handler(event, context):
+        event = decode_event(event)
+        ...
+
+Events which are not in an envelope are returned unchanged, so the function keeps working
+with compression turned off and when called directly.
+"""
+
+import json
+import zlib
+import base64
+
+ENVELOPE_KEY = 'lexV1AdapterEnvelope'
+ENVELOPE_ENCODING = 'zlib+base64'
+
+
+def is_envelope(event):
+    return isinstance(event, dict) and len(event) == 1 and ENVELOPE_KEY in event
+
+
+def decode_event(event):
+    """
+    Returns the V1 event held by an adapter envelope, or the event itself
+    """
+    if not is_envelope(event):
+        return event
+    envelope = event[ENVELOPE_KEY]
+    if envelope.get('encoding') != ENVELOPE_ENCODING:
+        raise ValueError('Unsupported envelope encoding: {}'.format(envelope.get('encoding')))
+    return json.loads(zlib.decompress(base64.b64decode(envelope['data'])))
+
+
+def encode_event(event, level=1):
+    """
+    Builds the envelope the adapter sends, e.g. to test a V1 function with compressed events
+    """
+    data = zlib.compress(json.dumps(event, separators=(',', ':')).encode('utf-8'), level)
+    return {ENVELOPE_KEY: {'encoding': ENVELOPE_ENCODING, 'data': base64.b64encode(data).decode('ascii')}}